@@ -1,3 +1,6 @@
+// Match ID handed out by the server on start_game; sent with every call
+let currentMatchId = null;
+
 // API Functions
 async function apiCall(endpoint, data = null) {
     try {
@@ -8,11 +11,14 @@ async function apiCall(endpoint, data = null) {
             }
         };
         
+        let url = `/api/${endpoint}`;
         if (data) {
-            options.body = JSON.stringify(data);
+            options.body = JSON.stringify(currentMatchId ? { match_id: currentMatchId, ...data } : data);
+        } else if (currentMatchId) {
+            url += `${url.includes('?') ? '&' : '?'}match_id=${encodeURIComponent(currentMatchId)}`;
         }
         
-        const response = await fetch(`/api/${endpoint}`, options);
+        const response = await fetch(url, options);
         return await response.json();
     } catch (error) {
         console.error('API call failed:', error);
@@ -38,6 +44,7 @@ function showMainMenu() {
     showScreen('main-menu');
     // Ensure server route expects POST — send an empty object so apiCall uses POST
     apiCall('reset_game', {});
+    currentMatchId = null;
     currentPlayer = 1;
 }
 
@@ -166,6 +173,7 @@ async function startGame(gameMode) {
     });
     
     if (!result.error) {
+        currentMatchId = result.match_id;
         currentGameState = result;
         currentPlayer = 1; // Reset to player 1
         updateGameDisplay();
@@ -185,13 +193,19 @@ async function makeChoice(choice, playerNumber) {
         return;
     }
     
+    // The round number lets the server drop double-fired or retried moves
     const result = await apiCall('play_round', {
         player_choice: choice,
-        player_number: playerNumber
+        player_number: playerNumber,
+        round: currentGameState.current_round
     });
     
     if (!result.error) {
-        if (result.status === 'waiting') {
+        if (result.status === 'duplicate') {
+            // Already applied; just catch up with the server
+            currentGameState = result.game_state;
+            updateGameDisplay();
+        } else if (result.status === 'waiting') {
             currentGameState = result.game_state;
             updateChoiceDisplay(playerNumber, choice, true); // true = hide actual choice
             disablePlayerButtons(playerNumber);
@@ -221,22 +235,22 @@ async function makeChoice(choice, playerNumber) {
 }
 
 function updateGameStateFromServer() {
-    // Periodically check game state from server (optional)
+    // Long-poll the server: it answers only when the match state version changes
     if (!(currentGameState && currentGameState.game_active && !currentGameState.both_choices_made)) return;
 
     if (pollingInProgress) return;
     pollingInProgress = true;
 
-    setTimeout(async () => {
+    (async () => {
+        let keepPolling = false;
         try {
-            const result = await apiCall('get_game_state');
-            if (!result.error && result.game_mode === currentGameState.game_mode) {
-                // Only update if the game mode is the same
-                const previousState = JSON.stringify(currentGameState);
-                const newState = JSON.stringify(result);
-
-                if (previousState !== newState) {
-                    currentGameState = result;
+            const result = await apiCall(`poll_state?since=${currentGameState.version || 0}`);
+            keepPolling = !result.error;
+            if (!result.error && !result.unchanged) {
+                // Merge a delta, or take the full state when we were too far behind
+                const newState = result.delta ? { ...currentGameState, ...result.delta } : result.state;
+                if (newState.game_mode === currentGameState.game_mode) {
+                    currentGameState = newState;
                     updateGameDisplay();
 
                     // Auto-play for CPU
@@ -258,7 +272,9 @@ function updateGameStateFromServer() {
         } finally {
             pollingInProgress = false;
         }
-    }, 1000);
+        // Keep listening while the round is still waiting on a move
+        if (keepPolling) updateGameStateFromServer();
+    })();
 }
 
 function showPlayerTurnMessage() {
@@ -622,7 +638,7 @@ function displayRecords(records) {
         pvpList.innerHTML = records.player_vs_player.map(record => `
             <div class="record-item">
                 <strong>${record.match}</strong><br>
-                Winner: ${record.winner}<br>
+                ${record.draw ? 'Draw' : `Winner: ${record.winner}`}<br>
                 <small>${new Date(record.date).toLocaleDateString()}</small>
             </div>
         `).join('');
@@ -0,0 +1,150 @@
+"""
+Vectorized statistics over the match history.
+
+Reads MatchHistory's row file as a memory-mapped NumPy record array, so a
+query touches only the columns it needs and never builds Python objects per
+round. Per-match attributes (mode, variant) are kept as small code arrays
+indexed by match number and gathered onto rows with one fancy index.
+"""
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from match_history import CHALLENGE, ROUND, load_columns
+from rules import DRAW, FIRST, SECOND, VARIANTS, get_rules
+
+UNKNOWN = 255
+VARIANT_CODES = {name: code for code, name in enumerate(VARIANTS)}
+
+
+def rate(part, total):
+    return float(part) / float(total) if total else None
+
+
+class Analytics:
+    def __init__(self, history):
+        self.history = history
+        # Held while the match codes and the mapped columns catch up with the history
+        self.lock = threading.Lock()
+        self.modes = {}  # game mode -> code
+        self.match_mode = np.zeros(0, dtype=np.uint8)
+        self.match_variant = np.zeros(0, dtype=np.uint8)
+        self._columns = None  # (row count, memmap)
+
+    def _sync_matches(self):
+        # Code the matches registered since the last call; caller holds self.lock
+        new = list(self.history.metas(len(self.match_mode)))
+        if not new:
+            return
+        modes = np.fromiter((self._mode_code(meta.get('game_mode')) for meta in new), dtype=np.uint8, count=len(new))
+        variants = np.fromiter((VARIANT_CODES.get(meta.get('variant'), UNKNOWN) for meta in new),
+                               dtype=np.uint8, count=len(new))
+        self.match_mode = np.concatenate([self.match_mode, modes])
+        self.match_variant = np.concatenate([self.match_variant, variants])
+
+    def _mode_code(self, mode):
+        # Modes past the 255th share UNKNOWN rather than growing the map
+        code = self.modes.get(mode)
+        if code is None:
+            if len(self.modes) >= UNKNOWN:
+                return UNKNOWN
+            code = self.modes[mode] = len(self.modes)
+        return code
+
+    def columns(self):
+        """Every history row written so far; re-mapped only when the file has grown."""
+        self.history.load()
+        self.history.flush()
+        with self.lock:
+            with self.history.lock:
+                rows = self.history.row_count
+            if self._columns is None or self._columns[0] != rows:
+                self._columns = (rows, load_columns(self.history.rounds_file)[:rows])
+            self._sync_matches()
+            return self._columns[1]
+
+    def _match_codes(self, codes, match_no):
+        # Rows of a match missing from the index (torn metadata) get UNKNOWN
+        if len(match_no) and int(match_no.max()) >= len(codes):
+            codes = np.concatenate([codes, np.full(int(match_no.max()) + 1 - len(codes), UNKNOWN, np.uint8)])
+        return codes[match_no]
+
+    def rows(self, kind=ROUND, variant=None, mode=None):
+        cols = self.columns()
+        # An unknown variant or mode matches nothing, not the UNKNOWN rows
+        variant_code = VARIANT_CODES.get(variant) if variant else None
+        mode_code = self.modes.get(mode) if mode else None
+        if (variant and variant_code is None) or (mode and mode_code is None):
+            return cols[:0]
+        mask = cols['kind'] == kind
+        if variant:
+            mask &= self._match_codes(self.match_variant, cols['match_no']) == variant_code
+        if mode:
+            mask &= self._match_codes(self.match_mode, cols['match_no']) == mode_code
+        return cols[mask]
+
+    def move_stats(self, variant='classic', mode=None):
+        """Times each move was played and its win/draw/loss counts, from either side."""
+        rules = get_rules(variant)
+        rows = self.rows(ROUND, rules.name, mode)
+        moves = np.concatenate([rows['move1'], rows['move2']]).astype(np.int64)
+        outcome = np.concatenate([rows['outcome'], rows['outcome']])
+        first = np.arange(len(moves)) < len(rows)
+        won = np.where(first, outcome == FIRST, outcome == SECOND)
+        drawn = outcome == DRAW
+        valid = (moves >= 0) & (moves < rules.size)
+        moves, won, drawn = moves[valid], won[valid], drawn[valid]
+
+        played = np.bincount(moves, minlength=rules.size)
+        wins = np.bincount(moves, weights=won, minlength=rules.size)
+        draws = np.bincount(moves, weights=drawn, minlength=rules.size)
+        return [
+            {'move': move, 'played': int(played[code]), 'wins': int(wins[code]), 'draws': int(draws[code]),
+             'losses': int(played[code] - wins[code] - draws[code]), 'win_rate': rate(wins[code], played[code])}
+            for code, move in enumerate(rules.moves)
+        ]
+
+    def openings(self, variant='classic', mode=None):
+        """First-round moves by popularity."""
+        rules = get_rules(variant)
+        rows = self.rows(ROUND, rules.name, mode)
+        rows = rows[rows['round'] == 1]
+        moves = np.concatenate([rows['move1'], rows['move2']]).astype(np.int64)
+        moves = moves[(moves >= 0) & (moves < rules.size)]
+        counts = np.bincount(moves, minlength=rules.size)
+        order = np.argsort(-counts, kind='stable')
+        return [{'move': rules.moves[code], 'count': int(counts[code]), 'share': rate(counts[code], len(moves))}
+                for code in order]
+
+    def challenge_stats(self, limit=20, min_attempts=1):
+        """Pass rate per challenge, most attempted first."""
+        rows = self.rows(CHALLENGE)
+        codes = rows['challenge'].astype(np.int64)
+        attempts = np.bincount(codes)
+        passed = np.bincount(codes, weights=rows['passed'], minlength=len(attempts))
+        attempts[:1] = 0  # code 0: no challenge recorded
+        candidates = np.nonzero(attempts >= max(min_attempts, 1))[0]
+        top = candidates[np.argsort(-attempts[candidates], kind='stable')][:limit]
+        with self.history.lock:
+            challenge_ids = self.history.challenge_ids
+            names = [challenge_ids[code - 1] if code <= len(challenge_ids) else None for code in top]
+        return [{'challenge_id': name, 'attempts': int(attempts[code]), 'passed': int(passed[code]),
+                 'pass_rate': rate(passed[code], attempts[code])}
+                for name, code in zip(names, top)]
+
+    def cpu_win_rate(self, mode='player_vs_cpu_hard', bucket=86400):
+        """CPU (player 2) round results per time bucket of `bucket` seconds."""
+        rows = self.rows(ROUND, None, mode)
+        if not len(rows):
+            return []
+        slots, index = np.unique(rows['time'] // bucket, return_inverse=True)
+        rounds = np.bincount(index)
+        cpu_wins = np.bincount(index, weights=rows['outcome'] == SECOND)
+        draws = np.bincount(index, weights=rows['outcome'] == DRAW)
+        return [
+            {'start': datetime.fromtimestamp(int(slot) * bucket, timezone.utc).isoformat(),
+             'rounds': int(rounds[i]), 'cpu_wins': int(cpu_wins[i]), 'draws': int(draws[i]),
+             'win_rate': rate(cpu_wins[i], rounds[i])}
+            for i, slot in enumerate(slots)
+        ]
@@ -0,0 +1,121 @@
+"""
+Grading of challenge answers.
+
+Each challenge gets an AnswerMatcher built once from its expected answer:
+every accepted form is canonicalized into a set, so the common cases (the
+exact word, a quiz letter, "a) went" or just "went") cost one set lookup.
+Anything else is compared by edit distance with a per-word limit and an
+early cutoff, and those verdicts are memoized in an LRU because players keep
+sending the same misspellings.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+FUZZY_CACHE_SIZE = 65536
+# Answers this much longer than every target can't be near misses
+MAX_ANSWER_LENGTH = 200
+
+_SPACES = re.compile(r'\s+')
+# 'a) went', '(b) very good', 'c. going', 'd: goes'
+_OPTION = re.compile(r'^\(?([a-z])\s*[).:\]]\s*(.*)$')
+_EDGES = ' .,;:!?"\'()[]'
+
+
+def canonical(text):
+    """Case-folded, NFKC-normalized text with collapsed spaces and no edge punctuation."""
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    return _SPACES.sub(' ', text).strip(_EDGES)
+
+
+def edit_limit(target):
+    # Short words must be exact; longer ones tolerate a typo or two
+    if len(target) < 4:
+        return 0
+    return 1 if len(target) < 8 else 2
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance of a and b, or None as soon as it must exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if a == b:
+        return 0
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        # Every later row is at least this row's minimum
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class AnswerMatcher:
+    """
+    `accepted` and `rejected` hold canonical answers known to pass or fail;
+    `targets` are (text, correct) pairs tried by edit distance.
+    `options` maps quiz letters to whether they are the correct one.
+    """
+
+    __slots__ = ('accepted', 'rejected', 'targets', 'options')
+
+    def __init__(self, accepted, rejected=(), targets=(), options=None):
+        self.accepted = frozenset(accepted)
+        self.rejected = frozenset(rejected)
+        self.targets = tuple(targets)
+        self.options = options or {}
+
+    @classmethod
+    def for_word(cls, word, aliases=()):
+        accepted = {canonical(text) for text in (word, *aliases)} - {''}
+        return cls(accepted, targets=[(text, True) for text in accepted])
+
+    @classmethod
+    def for_quiz(cls, correct_letter, options, aliases=()):
+        """`options` maps letters to option text (without the 'a) ' prefix)."""
+        correct_letter = canonical(correct_letter)
+        accepted = {correct_letter} | {canonical(text) for text in aliases}
+        rejected = set()
+        targets = []
+        for letter, text in options.items():
+            letter, text = canonical(letter), canonical(text)
+            correct = letter == correct_letter
+            (accepted if correct else rejected).add(letter)
+            if text:
+                (accepted if correct else rejected).add(text)
+                targets.append((text, correct))
+        # Text shared by a right and a wrong option proves nothing
+        ambiguous = accepted & rejected
+        return cls(accepted - ambiguous, rejected | ambiguous, targets,
+                   {canonical(letter): canonical(letter) == correct_letter for letter in options})
+
+    def matches(self, answer):
+        text = canonical(answer)
+        if text in self.accepted:
+            return True
+        if text in self.rejected or not text or len(text) > MAX_ANSWER_LENGTH:
+            return False
+        if self.options:
+            # 'b) very good': the letter decides
+            option = _OPTION.match(text)
+            if option and option.group(1) in self.options:
+                return self.options[option.group(1)]
+        return _fuzzy_verdict(self, text)
+
+
+@lru_cache(maxsize=FUZZY_CACHE_SIZE)
+def _fuzzy_verdict(matcher, text):
+    # Passes only if a correct target is strictly nearer than every wrong one
+    best_correct = best_wrong = None
+    for target, correct in matcher.targets:
+        distance = bounded_distance(text, target, edit_limit(target))
+        if distance is None:
+            continue
+        if correct:
+            best_correct = distance if best_correct is None else min(best_correct, distance)
+        else:
+            best_wrong = distance if best_wrong is None else min(best_wrong, distance)
+    return best_correct is not None and (best_wrong is None or best_correct < best_wrong)
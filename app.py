@@ -1,31 +1,263 @@
-from flask import Flask, render_template, request, jsonify
-from game_logic import RockPaperScissors
+from flask import Flask, Response, g, render_template, request, jsonify
+from game_logic import GAME_MODES, RockPaperScissors
+from match_journal import MatchJournal
+from match_history import MatchHistory
+from matchmaking import Matchmaker
+from rate_limit import TokenBucketLimiter
+from ratings import RatingEngine
+from record_store import RecordStore
+from sessions import SessionStore
+from state_backend import SQLiteRatingEngine, SQLiteRecordStore, SQLiteSessionStore, open_pool
 import json
+import math
+import os
+import time
 from datetime import datetime
+import metrics
 
 app = Flask(__name__)
-game = RockPaperScissors()
+# 'memory' keeps match state in this process; 'sqlite:///path/state.db'
+# shares match state and records between worker processes
+STATE_BACKEND = os.environ.get('RPS_STATE_BACKEND', 'memory')
+
+
+def new_game(match_id):
+    # SQLite rates PvP records as it saves them
+    return RockPaperScissors(store=records, journal=journal, match_id=match_id, history=history,
+                             ratings=ratings if STATE_BACKEND == 'memory' else None)
+
+
+if STATE_BACKEND == 'memory':
+    # Records are shared by every match; match state lives in the session store
+    # and every change to it is journaled so matches survive a restart
+    records = RecordStore()
+    journal = MatchJournal()
+    # Round-by-round history of every match, kept after the match ends
+    history = MatchHistory()
+    sessions = SessionStore(new_game, on_remove=journal.remove)
+    ratings = RatingEngine()
+else:
+    # The database is the durable copy, so no journal; the history files
+    # have a single writer, so replays and stats are off. The record writer
+    # rates PvP records in the database, so games don't update the ratings.
+    pool = open_pool(STATE_BACKEND)
+    records = SQLiteRecordStore(pool)
+    journal = None
+    history = None
+    sessions = SQLiteSessionStore(pool, new_game)
+    ratings = SQLiteRatingEngine(pool)
+
+
+_analytics = None
+
+
+def get_analytics():
+    """Analytics over the match history, created on first use (NumPy is slow to import); None if unavailable."""
+    global _analytics
+    if _analytics is None and history is not None:
+        try:
+            from analytics import Analytics
+        except ImportError:  # NumPy is optional; /api/stats/* needs it
+            return None
+        _analytics = Analytics(history)
+    return _analytics
+
+# Rounds of a match opened by the matchmaking queue
+ONLINE_ROUNDS = 5
+
+
+def open_online_match(first, second):
+    match_id, _ = sessions.create()
+    with sessions.locked(match_id) as game:
+        # Only the paired clients know the tokens, so only they can move
+        game.start_game('player_vs_player', first.player, second.player, ONLINE_ROUNDS,
+                        tokens=(first.token, second.token))
+    return match_id
+
+
+# Players are queued at their current rating unless the client sends one.
+# The queue lives in one process, so it is off when workers share a database.
+if STATE_BACKEND == 'memory':
+    matchmaker = Matchmaker(open_online_match, rating_of=ratings.rating)
+else:
+    matchmaker = None
+NO_MATCHMAKING = {'error': 'Matchmaking needs the in-process state backend'}
+
+# Limit on play_round per player: RPS_PLAY_BURST at once, then RPS_PLAY_RATE
+# per second. A rate of 0 turns the limit off. Matchmade players are keyed by
+# their (token-checked) seat, so clients behind one proxy or NAT don't share
+# a bucket; players of matches without tokens are keyed by address.
+PLAY_RATE = float(os.environ.get('RPS_PLAY_RATE', 10))
+play_limiter = TokenBucketLimiter(PLAY_RATE, int(os.environ.get('RPS_PLAY_BURST', 20))) if PLAY_RATE > 0 else None
+
+
+def recover_matches():
+    if journal is None:
+        return
+    for match_id, version, state, challenge_id, challenge_for_player in journal.matches():
+        game = sessions.factory(match_id)
+        game.restore(version, state, challenge_id, challenge_for_player)
+        sessions.restore(match_id, game)
+
+
+recover_matches()
+
+
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    if metrics.profiler:
+        g.profile = metrics.profiler.start()
+
+
+def finish_request_metrics(exc):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    # Label by route pattern, not raw path, so label values stay bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method)
+    profile = g.pop('profile', None)
+    if profile:
+        metrics.profiler.stop(profile, route)
+
+
+# With metrics off and no profiler the hooks aren't installed at all
+if metrics.enabled or metrics.profiler:
+    app.before_request(start_request_metrics)
+    app.teardown_request(finish_request_metrics)
+
+
+def get_match_id():
+    data = request.get_json(silent=True) or {}
+    return data.get('match_id') or request.args.get('match_id')
+
+
+def match_not_found():
+    return jsonify({'error': 'Match not found'}), 404
+
+
+def get_int_arg(name, default):
+    return to_int(request.args.get(name, default), default)
+
+
+# Helpers shared with the ASGI entry point (asgi.py)
+def to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_max_rounds(value):
+    # Be defensive: ensure max_rounds is a positive integer
+    max_rounds = to_int(value, 5)
+    return max_rounds if max_rounds > 0 else 5
+
+
+def refuse_play(game, player_number, token, client):
+    """
+    (body, status, headers) refusing a play_round before it reaches the game,
+    or None to go ahead. The player is checked before a token of their rate
+    limit is spent, so nobody can spend another player's tokens.
+    """
+    if player_number not in (1, 2):
+        return {'error': 'Invalid player number'}, 400, {}
+    if not game.authorized(player_number, token):
+        return {'error': 'Invalid player token'}, 403, {}
+    if play_limiter is None:
+        return None
+    key = (game.match_id, player_number) if game.game_state.player(player_number).token else client
+    wait = play_limiter.take(key)
+    if not wait:
+        return None
+    metrics.PLAYS_REJECTED.inc('rate_limited')
+    return {'error': 'Too many requests'}, 429, {'Retry-After': str(math.ceil(wait))}
+
+
+def leave_match(match_id, token):
+    """
+    Discard a match its client is leaving. A matchmade match is kept (and
+    False returned) unless `token` belongs to one of its players, so nobody
+    can end another pair's match by its ID.
+    """
+    with sessions.locked(match_id, write=False) as game:
+        allowed = game is None or game.authorized(1, token) or game.authorized(2, token)
+    if allowed:
+        sessions.discard(match_id)
+    return allowed
+
+
+def query_records(args):
+    """Run a /api/get_records query from its query args; returns (body, status)."""
+    # Filters: mode, player, since/until (ISO dates), limit and cursor
+    mode = args.get('mode')
+    limit = min(max(to_int(args.get('limit', 50), 50), 1), 500)
+    cursor = to_int(args.get('cursor'), None)
+    # A cursor only makes sense within a single category
+    if cursor is not None and not mode:
+        return {'error': 'cursor requires mode'}, 400
+
+    return records.query(
+        [mode] if mode else None,
+        player=args.get('player'),
+        since=args.get('since'),
+        until=args.get('until'),
+        limit=limit,
+        cursor=cursor
+    ), 200
+
+def query_stats(name, args):
+    """Run a /api/stats/<name> query from its query args; returns (body, status)."""
+    analytics = get_analytics()
+    if analytics is None:
+        return {'error': 'Statistics need NumPy and the in-process state backend'}, 501
+    variant = args.get('variant', 'classic')
+    mode = args.get('mode')
+    if name == 'moves':
+        return {'variant': variant, 'moves': analytics.move_stats(variant, mode)}, 200
+    if name == 'openings':
+        return {'variant': variant, 'openings': analytics.openings(variant, mode)}, 200
+    if name == 'challenges':
+        limit = min(max(to_int(args.get('limit'), 20), 1), 500)
+        min_attempts = max(to_int(args.get('min_attempts'), 1), 1)
+        return {'challenges': analytics.challenge_stats(limit, min_attempts)}, 200
+    if name == 'cpu':
+        mode = mode or 'player_vs_cpu_hard'
+        # Bucket width in seconds, from an hour up to a year
+        bucket = min(max(to_int(args.get('bucket'), 86400), 3600), 366 * 86400)
+        return {'mode': mode, 'buckets': analytics.cpu_win_rate(mode, bucket)}, 200
+    return {'error': 'Unknown statistic'}, 404
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # API Routes
 @app.route('/api/start_game', methods=['POST'])
 def start_game():
     data = request.json
     game_mode = data.get('game_mode')
+    # Modes are recorded per match and grouped by in /api/stats, so only known ones
+    if game_mode not in GAME_MODES:
+        return jsonify({'error': 'Invalid game mode'}), 400
     player1_name = data.get('player1_name', 'Player 1')
     player2_name = data.get('player2_name', 'CPU')
-    # Be defensive: ensure max_rounds is an integer
-    try:
-        max_rounds = int(data.get('max_rounds', 5))
-        if max_rounds <= 0:
-            max_rounds = 5
-    except (TypeError, ValueError):
-        max_rounds = 5
-    
-    result = game.start_game(game_mode, player1_name, player2_name, max_rounds)
+    variant = data.get('variant', 'classic')
+    max_rounds = parse_max_rounds(data.get('max_rounds', 5))
+
+    # Starting a new game replaces the caller's previous match, if any
+    previous = data.get('match_id')
+    if previous:
+        leave_match(previous, data.get('player_token'))
+
+    match_id, _ = sessions.create()
+    with sessions.locked(match_id) as game:
+        result = game.start_game(game_mode, player1_name, player2_name, max_rounds, variant)
+    result['match_id'] = match_id
     return jsonify(result)
 
 @app.route('/api/play_round', methods=['POST'])
@@ -33,21 +265,94 @@ def play_round():
     data = request.json
     player_choice = data.get('player_choice')
     player_number = data.get('player_number', 1)
-    
-    result = game.play_round(player_choice, player_number)
+    # Optional: the round the move is for, so retries are answered from the match
+    round_number = to_int(data.get('round'), None)
+
+    with sessions.locked(get_match_id()) as game:
+        if game is None:
+            return match_not_found()
+        refused = refuse_play(game, player_number, data.get('player_token'), request.remote_addr)
+        if refused:
+            body, status, headers = refused
+            return jsonify(body), status, headers
+        result = game.play_round(player_choice, player_number, round_number, data.get('player_token'))
     return jsonify(result)
 
 @app.route('/api/get_game_state', methods=['GET'])
 def get_game_state():
-    return jsonify(game.get_game_state())
+    match_id = get_match_id()
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return match_not_found()
+        # The version identifies the state, so a matching ETag means nothing changed
+        etag = f'{match_id}-{game.version}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(game.snapshot_json(), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/poll_state', methods=['GET'])
+def poll_state():
+    # Long-poll: answer as soon as the match version moves past `since`
+    match_id = get_match_id()
+    since = get_int_arg('since', 0)
+    timeout = min(max(get_int_arg('timeout', 25), 0), 60)
+    if sessions.wait_for_change(match_id, since, timeout) is None:
+        return match_not_found()
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return match_not_found()
+        if game.version <= since:
+            return jsonify({'version': game.version, 'unchanged': True})
+        return jsonify(game.state_since(since))
+
+
+@app.route('/api/stream_state', methods=['GET'])
+def stream_state():
+    # Server-Sent Events: one event per state version, as a delta when possible
+    match_id = get_match_id()
+    since = to_int(request.headers.get('Last-Event-ID') or request.args.get('since', 0), 0)
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return match_not_found()
+
+    def events(version):
+        while True:
+            sessions.wait_for_change(match_id, version, 15)
+            with sessions.locked(match_id, write=False) as game:
+                # Gone: discarded, expired or replaced by a new match
+                if game is None:
+                    yield 'event: closed\ndata: {}\n\n'
+                    return
+                payload = game.state_since(version) if game.version > version else None
+                finished = not game.game_state.game_active and not game.current_challenge
+            if payload is None:
+                yield ': keepalive\n\n'
+                continue
+            version = payload['version']
+            yield f"id: {version}\ndata: {json.dumps(payload)}\n\n"
+            if finished:
+                return
+
+    return Response(events(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/get_challenge', methods=['GET'])
 def get_challenge():
-    ch = game.get_current_challenge()
-    if not ch:
-        return jsonify({'challenge': None})
-    return jsonify({'challenge': ch, 'for_player': game.challenge_for_player})
+    with sessions.locked(get_match_id(), write=False) as game:
+        if game is None:
+            return match_not_found()
+        if not game.current_challenge:
+            return jsonify({'challenge': None})
+        # The public payload is pre-encoded by the challenge bank
+        body = '{"challenge": %s, "for_player": %s}' % (
+            game.current_challenge.public_json, json.dumps(game.challenge_for_player))
+    return Response(body, mimetype='application/json')
 
 
 @app.route('/api/submit_challenge', methods=['POST'])
@@ -55,26 +360,94 @@ def submit_challenge():
     data = request.json
     player_number = data.get('player_number')
     answer = data.get('answer')
-    result = game.submit_challenge_answer(player_number, answer)
+    with sessions.locked(get_match_id()) as game:
+        if game is None:
+            return match_not_found()
+        result = game.submit_challenge_answer(player_number, answer, data.get('player_token'))
     return jsonify(result)
 
 @app.route('/api/reset_game', methods=['POST'])
 def reset_game():
-    game.reset_game()
+    # Leaving a match frees its slot in the session store
+    match_id = get_match_id()
+    token = (request.get_json(silent=True) or {}).get('player_token')
+    if match_id and not leave_match(match_id, token):
+        return jsonify({'error': 'Invalid player token'}), 403
     return jsonify({'status': 'success'})
 
+@app.route('/api/match/<match_id>/replay', methods=['GET'])
+def replay_match(match_id):
+    # Newline-delimited JSON: the match first, then one line per round or challenge
+    replay = history.replay(match_id) if history else None
+    if replay is None:
+        return match_not_found()
+    meta, events = replay
+
+    def lines():
+        yield json.dumps({'match': meta}) + '\n'
+        for event in events:
+            yield json.dumps(event) + '\n'
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+@app.route('/api/stats/<name>', methods=['GET'])
+def stats(name):
+    body, status = query_stats(name, request.args)
+    return jsonify(body), status
+
+@app.before_request
+def refuse_matchmaking():
+    if matchmaker is None and request.path.startswith('/api/matchmaking/'):
+        return jsonify(NO_MATCHMAKING), 501
+
+@app.route('/api/matchmaking/join', methods=['POST'])
+def matchmaking_join():
+    # Each online player plays from their own browser as the player_number returned once matched
+    data = request.get_json(silent=True) or {}
+    return jsonify(matchmaker.join(data.get('player_name') or 'Player', to_int(data.get('rating'), None)))
+
+@app.route('/api/matchmaking/status', methods=['GET'])
+def matchmaking_status():
+    status = matchmaker.poll(request.args.get('ticket'))
+    if status is None:
+        return jsonify({'error': 'Ticket not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/matchmaking/leave', methods=['POST'])
+def matchmaking_leave():
+    data = request.get_json(silent=True) or {}
+    return jsonify({'left': matchmaker.leave(data.get('ticket'))})
+
+@app.route('/api/matchmaking/stats', methods=['GET'])
+def matchmaking_stats():
+    return jsonify(matchmaker.stats())
+
+@app.route('/api/ratings', methods=['GET'])
+def get_ratings():
+    player = request.args.get('player')
+    if player:
+        return jsonify({'player': player, 'rating': round(ratings.rating(player), 1)})
+    limit = min(max(get_int_arg('limit', 10), 1), 100)
+    return jsonify({'ratings': ratings.top(limit)})
+
 @app.route('/api/get_records', methods=['GET'])
 def get_records():
-    return jsonify(game.get_records())
+    body, status = query_records(request.args)
+    return jsonify(body), status
+
+@app.route('/api/leaderboard', methods=['GET'])
+def leaderboard():
+    limit = min(max(get_int_arg('limit', 10), 1), 100)
+    return jsonify({'leaderboard': records.leaderboard(limit)})
 
 @app.route('/api/save_record', methods=['POST'])
 def save_record():
     data = request.json
     record_type = data.get('record_type')
     data = data.get('data')
-    game.save_record(record_type, data)
+    records.append(record_type, data)
     return jsonify({'status': 'success'})
 
 if __name__ == '__main__':
     # Run without debug/reload to avoid restart loops while diagnosing
-    app.run(debug=False, port=5000)
\ No newline at end of file
+    app.run(debug=False, port=5000)
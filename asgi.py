@@ -0,0 +1,417 @@
+"""
+ASGI entry point: the same /api/* routes as app.py with async handlers.
+
+Shares the record store and session store set up in app.py. Long-polls and
+SSE streams wait on futures rather than threads, so one process can hold
+thousands of idle PvP connections. Records are written by RecordStore's
+background writer, never inside a request. Every handler that takes a
+match's lock or touches a store runs that part in Starlette's thread pool:
+the lock may be held by a request doing I/O (a first lazy load, the end of
+a match), and with a shared backend every access is a database query. So
+the event loop itself never waits on a lock, the disk or the database.
+
+    python asgi.py                     # uvicorn with the settings below
+    uvicorn asgi:app --port 5000       # or any ASGI server
+"""
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import metrics
+from app import (GAME_MODES, NO_MATCHMAKING, app as flask_app, history, journal, leave_match, matchmaker,
+                 parse_max_rounds, query_records, refuse_play, query_stats, ratings, records, sessions, to_int)
+
+# Server settings, overridable from the environment. With the default
+# in-process state backend match state lives in this process, so more than
+# one worker needs RPS_STATE_BACKEND=sqlite:///... (see state_backend.py).
+SERVER_CONFIG = {
+    'host': os.environ.get('RPS_HOST', '127.0.0.1'),
+    'port': int(os.environ.get('RPS_PORT', 5000)),
+    'workers': int(os.environ.get('RPS_WORKERS', 1)),
+    # Longer than the longest long-poll (60s) so idle keep-alives survive it
+    'timeout_keep_alive': 75,
+    'backlog': int(os.environ.get('RPS_BACKLOG', 4096)),
+    'limit_concurrency': int(os.environ.get('RPS_LIMIT_CONCURRENCY', 10000)),
+    'timeout_graceful_shutdown': 10,
+    'proxy_headers': True,
+    'access_log': False,
+}
+
+LONG_POLL_MAX = 60
+SSE_KEEPALIVE = 15
+
+_index_html = None
+
+# Profiler of the current request when it is sampled (RPS_PROFILE_EVERY)
+_profile = ContextVar('profile', default=None)
+
+
+async def in_threadpool(func, *args):
+    """run_in_threadpool, profiled when the request is sampled, since that is where the work runs."""
+    profile = _profile.get()
+    if profile is None:
+        return await run_in_threadpool(func, *args)
+    return await run_in_threadpool(metrics.Profiler.run, profile, func, *args)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def match_not_found():
+    return JSONResponse({'error': 'Match not found'}, status_code=404)
+
+
+async def index(request):
+    # Render once with Flask's template setup; the page doesn't change
+    global _index_html
+    if _index_html is None:
+        with flask_app.test_request_context():
+            _index_html = render_template('index.html')
+    return HTMLResponse(_index_html)
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+async def start_game(request):
+    data = await read_json(request)
+    if data.get('game_mode') not in GAME_MODES:
+        return JSONResponse({'error': 'Invalid game mode'}, status_code=400)
+    result = await in_threadpool(new_match, data)
+    return JSONResponse(result)
+
+
+def new_match(data):
+    # Starting a new game replaces the caller's previous match, if any
+    if data.get('match_id'):
+        leave_match(data['match_id'], data.get('player_token'))
+    match_id, _ = sessions.create()
+    with sessions.locked(match_id) as game:
+        result = game.start_game(
+            data.get('game_mode'),
+            data.get('player1_name', 'Player 1'),
+            data.get('player2_name', 'CPU'),
+            parse_max_rounds(data.get('max_rounds', 5)),
+            data.get('variant', 'classic')
+        )
+    result['match_id'] = match_id
+    return result
+
+
+async def play_round(request):
+    data = await read_json(request)
+    client = request.client.host if request.client else None
+    result = await in_threadpool(play_move, data, client)
+    if result is None:
+        return match_not_found()
+    body, status, headers = result
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def play_move(data, client):
+    # The last round of a match also saves its record, history and ratings
+    player_number = data.get('player_number', 1)
+    with sessions.locked(data.get('match_id')) as game:
+        if game is None:
+            return None
+        refused = refuse_play(game, player_number, data.get('player_token'), client)
+        if refused:
+            return refused
+        return game.play_round(data.get('player_choice'), player_number, to_int(data.get('round'), None),
+                               data.get('player_token')), 200, {}
+
+
+async def get_game_state(request):
+    match_id = request.query_params.get('match_id')
+    state = await in_threadpool(read_state, match_id, request.headers.get('if-none-match', ''))
+    if state is None:
+        return match_not_found()
+    version, body = state
+    headers = {'ETag': f'"{match_id}-{version}"', 'Cache-Control': 'no-cache'}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+def read_state(match_id, if_none_match):
+    """(version, snapshot JSON, or None if the client's ETag is current); None if the match is unknown."""
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return None
+        if f'"{match_id}-{game.version}"' in if_none_match:
+            return game.version, None
+        return game.version, game.snapshot_json()
+
+
+async def poll_state(request):
+    match_id = request.query_params.get('match_id')
+    since = to_int(request.query_params.get('since'), 0)
+    timeout = min(max(to_int(request.query_params.get('timeout'), 25), 0), LONG_POLL_MAX)
+    if await sessions.wait_for_change_async(match_id, since, timeout) is None:
+        return match_not_found()
+    body = await in_threadpool(changes_since, match_id, since)
+    if body is None:
+        return match_not_found()
+    return JSONResponse(body)
+
+
+def changes_since(match_id, since):
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return None
+        if game.version <= since:
+            return {'version': game.version, 'unchanged': True}
+        return game.state_since(since)
+
+
+def next_event(match_id, version):
+    """(changes since `version` or None, whether the match is over); None if the match is gone."""
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return None
+        payload = game.state_since(version) if game.version > version else None
+        return payload, not game.game_state.game_active and not game.current_challenge
+
+
+async def stream_state(request):
+    match_id = request.query_params.get('match_id')
+    since = to_int(request.headers.get('last-event-id') or request.query_params.get('since'), 0)
+    if await in_threadpool(next_event, match_id, since) is None:
+        return match_not_found()
+
+    async def events(version):
+        while True:
+            await sessions.wait_for_change_async(match_id, version, SSE_KEEPALIVE)
+            event = await in_threadpool(next_event, match_id, version)
+            # Gone: discarded, expired or replaced by a new match
+            if event is None:
+                yield 'event: closed\ndata: {}\n\n'
+                return
+            payload, finished = event
+            if payload is None:
+                yield ': keepalive\n\n'
+                continue
+            version = payload['version']
+            yield f"id: {version}\ndata: {json.dumps(payload)}\n\n"
+            if finished:
+                return
+
+    return StreamingResponse(events(since), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def get_challenge(request):
+    body = await in_threadpool(challenge_json, request.query_params.get('match_id'))
+    if body is None:
+        return match_not_found()
+    return Response(body, media_type='application/json')
+
+
+def challenge_json(match_id):
+    with sessions.locked(match_id, write=False) as game:
+        if game is None:
+            return None
+        if not game.current_challenge:
+            return '{"challenge": null}'
+        return '{"challenge": %s, "for_player": %s}' % (
+            game.current_challenge.public_json, json.dumps(game.challenge_for_player))
+
+
+async def submit_challenge(request):
+    data = await read_json(request)
+    result = await in_threadpool(answer_challenge, data)
+    if result is None:
+        return match_not_found()
+    return JSONResponse(result)
+
+
+def answer_challenge(data):
+    with sessions.locked(data.get('match_id')) as game:
+        if game is None:
+            return None
+        return game.submit_challenge_answer(data.get('player_number'), data.get('answer'),
+                                            data.get('player_token'))
+
+
+async def reset_game(request):
+    data = await read_json(request)
+    if data.get('match_id') and not await in_threadpool(leave_match, data['match_id'], data.get('player_token')):
+        return JSONResponse({'error': 'Invalid player token'}, status_code=403)
+    return JSONResponse({'status': 'success'})
+
+
+async def replay_match(request):
+    # Flushes the history and may build its row index on first use
+    replay = await in_threadpool(history.replay, request.path_params['match_id']) if history else None
+    if replay is None:
+        return match_not_found()
+    meta, events = replay
+
+    def lines():
+        yield json.dumps({'match': meta}) + '\n'
+        for event in events:
+            yield json.dumps(event) + '\n'
+
+    # A sync iterator: Starlette reads it in a thread pool
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def stats(request):
+    # Vectorized but CPU-bound over large histories: keep it off the event loop
+    body, status = await in_threadpool(query_stats, request.path_params['name'], request.query_params)
+    return JSONResponse(body, status_code=status)
+
+
+async def matchmaking_join(request):
+    data = await read_json(request)
+    # Pairing opens the match, and the player's rating may be read first
+    status = await in_threadpool(matchmaker.join, data.get('player_name') or 'Player',
+                                     to_int(data.get('rating'), None))
+    return JSONResponse(status)
+
+
+async def matchmaking_status(request):
+    status = await in_threadpool(matchmaker.poll, request.query_params.get('ticket'))
+    if status is None:
+        return JSONResponse({'error': 'Ticket not found'}, status_code=404)
+    return JSONResponse(status)
+
+
+async def matchmaking_leave(request):
+    data = await read_json(request)
+    return JSONResponse({'left': await in_threadpool(matchmaker.leave, data.get('ticket'))})
+
+
+async def matchmaking_stats(request):
+    return JSONResponse(await in_threadpool(matchmaker.stats))
+
+
+# Routes the matchmaking endpoints here when the queue is off (SQLite backend)
+async def matchmaking_off(request):
+    return JSONResponse(NO_MATCHMAKING, status_code=501)
+
+
+async def get_ratings(request):
+    player = request.query_params.get('player')
+    # The first call reads the ratings file; under SQLite every call reads the database
+    if player:
+        rating = await in_threadpool(ratings.rating, player)
+        return JSONResponse({'player': player, 'rating': round(rating, 1)})
+    limit = min(max(to_int(request.query_params.get('limit'), 10), 1), 100)
+    return JSONResponse({'ratings': await in_threadpool(ratings.top, limit)})
+
+
+async def get_records(request):
+    # Loads the records log on first use, or queries the shared database
+    body, status = await in_threadpool(query_records, request.query_params)
+    return JSONResponse(body, status_code=status)
+
+
+async def leaderboard(request):
+    limit = min(max(to_int(request.query_params.get('limit'), 10), 1), 100)
+    return JSONResponse({'leaderboard': await in_threadpool(records.leaderboard, limit)})
+
+
+async def save_record(request):
+    data = await read_json(request)
+    # Only queued here, but may wait behind the first load of the records log
+    await in_threadpool(records.append, data.get('record_type'), data.get('data'))
+    return JSONResponse({'status': 'success'})
+
+
+class MetricsMiddleware:
+    """
+    Per-route request timing and sampled profiling, as app.py's request
+    hooks. A sampled request's profile covers its in_threadpool calls, not
+    the event loop, which interleaves every request; sync iterators that
+    StreamingResponse reads in the pool are not profiled.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = [route for route in routes if isinstance(route, Route)]
+        # Plain paths are looked up directly; only parameterized ones are matched
+        self.paths = {route.path for route in self.routes if '{' not in route.path}
+
+    def _route_of(self, scope):
+        # Label by route pattern, not raw path, so label values stay bounded
+        for route in self.routes:
+            if '{' in route.path and route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        profile = metrics.profiler.sample() if metrics.profiler else None
+        route = scope['path'] if scope['path'] in self.paths else self._route_of(scope)
+        token = _profile.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _profile.reset(token)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route, scope['method'])
+            if profile:
+                metrics.profiler.stop(profile, route)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Flush queued records, match events, history and ratings before the process exits
+    records.close()
+    for store in (journal, history, ratings):
+        if store is not None:
+            store.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+        Route('/api/start_game', start_game, methods=['POST']),
+        Route('/api/play_round', play_round, methods=['POST']),
+        Route('/api/get_game_state', get_game_state, methods=['GET']),
+        Route('/api/poll_state', poll_state, methods=['GET']),
+        Route('/api/stream_state', stream_state, methods=['GET']),
+        Route('/api/get_challenge', get_challenge, methods=['GET']),
+        Route('/api/submit_challenge', submit_challenge, methods=['POST']),
+        Route('/api/reset_game', reset_game, methods=['POST']),
+        Route('/api/match/{match_id}/replay', replay_match, methods=['GET']),
+        Route('/api/stats/{name}', stats, methods=['GET']),
+        Route('/api/matchmaking/join', matchmaking_join if matchmaker else matchmaking_off, methods=['POST']),
+        Route('/api/matchmaking/status', matchmaking_status if matchmaker else matchmaking_off, methods=['GET']),
+        Route('/api/matchmaking/leave', matchmaking_leave if matchmaker else matchmaking_off, methods=['POST']),
+        Route('/api/matchmaking/stats', matchmaking_stats if matchmaker else matchmaking_off, methods=['GET']),
+        Route('/api/ratings', get_ratings, methods=['GET']),
+        Route('/api/get_records', get_records, methods=['GET']),
+        Route('/api/leaderboard', leaderboard, methods=['GET']),
+        Route('/api/save_record', save_record, methods=['POST']),
+        Mount(flask_app.static_url_path, StaticFiles(directory=flask_app.static_folder, check_dir=False),
+              name='static'),
+    ],
+    lifespan=lifespan,
+)
+if metrics.enabled or metrics.profiler:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', **SERVER_CONFIG)
@@ -0,0 +1,236 @@
+"""
+Load test for the /api/* endpoints.
+
+Drives full PvP match flows (start_game, play_round for both players,
+get_game_state, challenge fetch/submit, save_record) from concurrent
+virtual users and reports p50/p95/p99 latency and throughput per endpoint.
+
+By default requests go through Flask's test client in-process, after
+seeding a temporary records log with --records entries; pass --url to hit a
+running server instead. Results are written as JSON so runs can be compared
+across commits.
+
+    python benchmarks/load_test.py --users 16 --matches 20 --records 100000
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --users 64
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MOVES = ["rock", "paper", "scissors"]
+
+
+class FlaskClient:
+    """Calls the app in-process through Flask's test client."""
+
+    def __init__(self):
+        # Measure the endpoints, not the play_round rate limit
+        os.environ.setdefault('RPS_PLAY_RATE', '0')
+        import app
+        self.client = app.app.test_client()
+
+    def call(self, method, endpoint, payload=None, params=None):
+        if method == 'GET':
+            response = self.client.get(f'/api/{endpoint}', query_string=params or {})
+        else:
+            response = self.client.post(f'/api/{endpoint}', json=payload or {})
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Calls a running server over HTTP."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def call(self, method, endpoint, payload=None, params=None):
+        url = f'{self.url}/api/{endpoint}'
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        data = json.dumps(payload or {}).encode() if method == 'POST' else None
+        request = urllib.request.Request(url, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, client, method, endpoint, payload=None, params=None):
+        start = time.perf_counter()
+        status, body = client.call(method, endpoint, payload, params)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if status >= 400 or (isinstance(body, dict) and body.get('error')):
+                self.errors[endpoint] += 1
+        return body or {}
+
+
+def play_match(client, recorder, rounds, rng):
+    """One PvP match from start to saved record."""
+    game = recorder.timed(client, 'POST', 'start_game', {
+        'game_mode': 'player_vs_player',
+        'player1_name': f'Load{rng.randrange(1000)}',
+        'player2_name': f'Load{rng.randrange(1000)}',
+        'max_rounds': rounds
+    })
+    match_id = game.get('match_id')
+    for _ in range(rounds):
+        recorder.timed(client, 'POST', 'play_round',
+                       {'match_id': match_id, 'player_choice': rng.choice(MOVES), 'player_number': 1})
+        result = recorder.timed(client, 'POST', 'play_round',
+                                {'match_id': match_id, 'player_choice': rng.choice(MOVES), 'player_number': 2})
+        recorder.timed(client, 'GET', 'get_game_state', params={'match_id': match_id})
+        if result.get('challenge_issued'):
+            challenge = recorder.timed(client, 'GET', 'get_challenge', params={'match_id': match_id})
+            recorder.timed(client, 'POST', 'submit_challenge', {
+                'match_id': match_id,
+                'player_number': challenge.get('for_player'),
+                'answer': rng.choice(['a', 'b', 'c', 'd', 'cat'])
+            })
+    recorder.timed(client, 'POST', 'save_record', {
+        'record_type': 'player_vs_cpu',
+        'data': {'match': 'load test', 'winner': 'nobody', 'date': datetime.now().isoformat()}
+    })
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    total = 0
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values.sort()
+        total += len(values)
+        endpoints[endpoint] = {
+            'count': len(values),
+            'errors': recorder.errors.get(endpoint, 0),
+            'throughput_rps': len(values) / elapsed,
+            'mean_ms': sum(values) / len(values) * 1000,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    return endpoints, total
+
+
+def seed_records(count, rng):
+    """Write a records log with `count` entries into the current directory."""
+    with open('game_records.jsonl', 'w', encoding='utf-8') as f:
+        for i in range(count):
+            a, b = f'Seed{rng.randrange(5000)}', f'Seed{rng.randrange(5000)}'
+            f.write(json.dumps({'type': 'player_vs_player', 'data': {
+                'match': f'{a} vs {b}', 'winner': rng.choice([a, b]),
+                'date': f'2025-01-01T00:00:{i % 60:02d}'
+            }}) + '\n')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /api/* endpoints")
+    parser.add_argument('--url', help="server to test; default is Flask's in-process test client")
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--matches', type=int, default=10, help="matches per user")
+    parser.add_argument('--rounds', type=int, default=5, help="rounds per match")
+    parser.add_argument('--records', type=int, default=0,
+                        help="records to seed before an in-process run")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="JSON results file (default benchmarks/results/load-<commit>.json)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    workdir = None
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        # Isolated working directory so the run never touches real records
+        workdir = tempfile.TemporaryDirectory()
+        os.chdir(workdir.name)
+        seed_records(args.records, rng)
+        client = FlaskClient()
+
+    recorder = Recorder()
+    seeds = [rng.getrandbits(32) for _ in range(args.users)]
+
+    def user(seed):
+        user_rng = random.Random(seed)
+        for _ in range(args.matches):
+            play_match(client, recorder, args.rounds, user_rng)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, seeds))
+    elapsed = time.perf_counter() - start
+
+    endpoints, total = summarize(recorder, elapsed)
+    results = {
+        'benchmark': 'load_test',
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'target': args.url or 'flask-test-client',
+        'config': {key: getattr(args, key) for key in ('users', 'matches', 'rounds', 'records', 'seed')},
+        'elapsed_seconds': elapsed,
+        'total_requests': total,
+        'throughput_rps': total / elapsed,
+        'endpoints': endpoints,
+    }
+
+    print(f"{'endpoint':<18}{'count':>8}{'err':>6}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:<18}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_rps']:>10.1f}"
+              f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+    print(f"total: {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"load-{results['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if workdir:
+        os.chdir(ROOT)
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Microbenchmarks for the game_logic and challenges hot paths.
+
+Each benchmark reports nanoseconds per operation (median and best of
+several repeats). Size-dependent ones run at growing input sizes and are
+flagged when their cost grows with the input, which catches accidental
+O(n) regressions. Results are JSON; --compare checks them against a saved
+baseline and exits non-zero on regressions.
+
+    python benchmarks/micro.py --output baseline.json
+    python benchmarks/micro.py --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HISTORY_SIZES = [10, 100, 1000, 10000]
+RECORD_COUNTS = [0, 1000, 10000, 100000]
+# A benchmark whose cost grows more than this between its smallest and
+# largest input is reported as scaling with input size
+SCALING_LIMIT = 2.0
+
+
+def measure(func, number, repeat):
+    """ns per call of func() as (median, best) over `repeat` runs of `number` calls."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter_ns() - start) / number)
+    return statistics.median(timings), min(timings)
+
+
+def new_game(store, mode='player_vs_cpu_hard', rounds=10 ** 9):
+    from game_logic import RockPaperScissors
+    game = RockPaperScissors(store=store)
+    game.start_game(mode, 'Bench', 'CPU', rounds)
+    return game
+
+
+def play_rounds(game, count):
+    moves = game.choices
+    for i in range(count):
+        game.play_round(moves[i % len(moves)], 1)
+        game.play_round('', 2)
+        if game.current_challenge:
+            game.submit_challenge_answer(game.challenge_for_player, 'x')
+
+
+def run_benchmarks(number, repeat):
+    from challenges import check_challenge, get_random_challenge
+    from record_store import RecordStore
+
+    results = {}
+    store = RecordStore(flush_interval=3600)
+
+    def bench(name, func, count=number):
+        median, best = measure(func, count, repeat)
+        results[name] = {'ns_per_op': median, 'best_ns_per_op': best}
+
+    game = new_game(store)
+    moves = game.choices
+
+    def round_trip():
+        game.play_round(moves[0], 1)
+        game.play_round('', 2)
+        game.current_challenge = None
+    bench('play_round', round_trip)
+
+    def determine_winner():
+        game.game_state.player1.choice = 0
+        game.game_state.player2.choice = 2
+        game.determine_winner()
+        game.current_challenge = None
+    bench('determine_winner', determine_winner)
+
+    bench('get_game_state', game.get_game_state)
+
+    for size in HISTORY_SIZES:
+        game = new_game(store)
+        play_rounds(game, size)
+        bench(f'get_cpu_choice_hard[history={size}]', lambda: game.get_cpu_choice('hard'))
+
+    bench('get_random_challenge', get_random_challenge)
+    challenge = get_random_challenge()
+    bench('check_challenge', lambda: check_challenge(challenge, 'Strawberry '))
+
+    for count in RECORD_COUNTS:
+        workdir = tempfile.TemporaryDirectory()
+        log_file = os.path.join(workdir.name, 'records.jsonl')
+        with open(log_file, 'w') as f:
+            for i in range(count):
+                f.write(json.dumps({'type': 'player_vs_player',
+                                    'data': {'match': f'P{i % 97} vs P{i % 89}', 'winner': f'P{i % 97}',
+                                             'date': '2025-01-01T00:00:00'}}) + '\n')
+        record_store = RecordStore(log_file=log_file, legacy_file=os.devnull, flush_interval=0.05)
+        record = {'match': 'A vs B', 'winner': 'A', 'date': '2025-01-01T00:00:00'}
+        bench(f'save_record[records={count}]', lambda: record_store.append('player_vs_player', record))
+        record_store.close()
+        workdir.cleanup()
+
+    store.close()
+    return results
+
+
+def scaling_report(results):
+    """Cost growth from the smallest to the largest input of each sized benchmark."""
+    groups = {}
+    for name, stats in results.items():
+        if '[' in name:
+            base, param = name[:-1].split('[', 1)
+            size = int(param.split('=', 1)[1])
+            groups.setdefault(base, []).append((size, stats['ns_per_op']))
+    report = {}
+    for base, points in groups.items():
+        points.sort()
+        growth = points[-1][1] / points[0][1] if points[0][1] else None
+        report[base] = {
+            'sizes': [size for size, _ in points],
+            'growth': growth,
+            'scales_with_input': growth is not None and growth > SCALING_LIMIT,
+        }
+    return report
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline per benchmark; return the regressed names."""
+    regressions = []
+    print(f"{'benchmark':<40}{'baseline ns':>14}{'current ns':>14}{'ratio':>8}")
+    for name, stats in results.items():
+        old = baseline.get('benchmarks', {}).get(name)
+        if not old:
+            print(f"{name:<40}{'-':>14}{stats['ns_per_op']:>14.0f}{'new':>8}")
+            continue
+        ratio = stats['ns_per_op'] / old['ns_per_op']
+        flag = ''
+        if ratio > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<40}{old['ns_per_op']:>14.0f}{stats['ns_per_op']:>14.0f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for game_logic and challenges")
+    parser.add_argument('--number', type=int, default=2000, help="calls per repeat")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--compare', help="baseline JSON from a previous run")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="slowdown ratio counted as a regression in --compare")
+    args = parser.parse_args()
+
+    # Run inside a temp directory so nothing touches the real records
+    cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    try:
+        benchmarks = run_benchmarks(args.number, args.repeat)
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+
+    scaling = scaling_report(benchmarks)
+    results = {
+        'benchmark': 'micro',
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {'number': args.number, 'repeat': args.repeat},
+        'benchmarks': benchmarks,
+        'scaling': scaling,
+    }
+
+    for name, stats in benchmarks.items():
+        print(f"{name:<40}{stats['ns_per_op']:>12.0f} ns/op")
+    for base, info in scaling.items():
+        note = 'GROWS WITH INPUT' if info['scales_with_input'] else 'flat'
+        print(f"scaling {base}: x{info['growth']:.2f} over sizes {info['sizes']} ({note})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+    failed = any(info['scales_with_input'] for info in scaling.values())
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        failed = bool(compare(benchmarks, baseline, args.tolerance)) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
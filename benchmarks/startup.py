@@ -0,0 +1,137 @@
+"""
+Cold-start benchmark: how long a fresh worker takes to be ready.
+
+For each data size a temporary directory is seeded with a records log and
+match history of that many entries, then fresh interpreters import app.py
+there. `ready` is the time to import it (what a worker pays before it can
+accept requests); the other steps time the first request that loads each
+piece of data lazily. `ready` growing with the data size is reported as a
+regression, like the scaling checks in micro.py.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --sizes 0 100000 1000000 --importtime
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = [0, 10000, 100000]
+# `ready` may grow this much between the smallest and largest data size
+SCALING_LIMIT = 2.0
+
+# Run in the seeded directory by a fresh interpreter; prints step timings as JSON
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, %(root)r)
+import app
+steps = {'ready': time.perf_counter() - start}
+
+def step(name, func):
+    begin = time.perf_counter()
+    func()
+    steps[name] = time.perf_counter() - begin
+
+client = app.app.test_client()
+step('first_leaderboard', lambda: client.get('/api/leaderboard'))
+match = {}
+step('first_start_game', lambda: match.update(client.post('/api/start_game', json={
+    'game_mode': 'player_vs_cpu_easy', 'player1_name': 'Bench', 'max_rounds': 3}).get_json()))
+from challenges import bank
+step('first_challenge', lambda: bank.sample())
+step('first_replay', lambda: client.get('/api/match/m0/replay').get_data())
+print(json.dumps(steps))
+"""
+
+
+def seed(count):
+    """Records log and match history with `count` entries in the current directory."""
+    from match_history import ROUND, ROW
+    with open('game_records.jsonl', 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({'type': 'player_vs_player', 'data': {
+                'match': f'P{i % 997} vs P{i % 991}', 'winner': f'P{i % 997}', 'date': '2025-01-01T00:00:00'
+            }}) + '\n')
+    matches = max(count // 10, 1)
+    with open('match_index.jsonl', 'w', encoding='utf-8') as f:
+        for i in range(matches):
+            f.write(json.dumps({'match_id': f'm{i}', 'game_mode': 'player_vs_cpu_hard', 'player1': 'P',
+                                'player2': 'CPU', 'variant': 'classic', 'started': 0}) + '\n')
+    with open('match_rounds.bin', 'wb') as f:
+        f.write(b''.join(ROW.pack(i % matches, 1 + i // matches, ROUND, i % 3, (i + 1) % 3, 2, 0, 0, 1, 0, 0, 0)
+                         for i in range(count)))
+
+
+def run_child(workdir, importtime):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD % {'root': ROOT}]
+    env = dict(os.environ, RPS_METRICS='0', RPS_STATE_BACKEND='memory')
+    done = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(done.stdout.strip().splitlines()[-1]), done.stderr
+
+
+def slowest_imports(report, count=10):
+    """The `count` imports with the largest cumulative time from -X importtime output."""
+    rows = []
+    for line in report.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker cold-start benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="records and history rows to seed")
+    parser.add_argument('--repeat', type=int, default=3, help="fresh interpreters per size")
+    parser.add_argument('--importtime', action='store_true', help="also list the slowest imports")
+    parser.add_argument('--output', help="write results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                seed(size)
+            finally:
+                os.chdir(cwd)
+            runs = [run_child(workdir, args.importtime) for _ in range(args.repeat)]
+        steps = {name: statistics.median(run[0][name] for run in runs) for name in runs[0][0]}
+        results[size] = steps
+        print(f"size={size:<10}" + ''.join(f"{name} {seconds * 1000:8.1f} ms   " for name, seconds in steps.items()))
+        if args.importtime:
+            for micros, module in slowest_imports(runs[-1][1]):
+                print(f"    {micros / 1000:8.1f} ms {module}")
+
+    smallest, largest = results[min(results)]['ready'], results[max(results)]['ready']
+    growth = largest / smallest if smallest else None
+    scales = growth is not None and growth > SCALING_LIMIT
+    print(f"ready: x{growth:.2f} from size {min(results)} to {max(results)} "
+          f"({'GROWS WITH DATA' if scales else 'flat'})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'startup',
+                'date': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'config': {'sizes': args.sizes, 'repeat': args.repeat},
+                'results': {str(size): steps for size, steps in results.items()},
+                'ready_growth': growth,
+            }, f, indent=2)
+        print(f"results written to {args.output}")
+    sys.exit(1 if scales else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from challenges import bank as default_bank
+
+
+class _PlayerDeck:
+    __slots__ = ('size', 'swapped', 'remaining', 'draws', 'reviews', 'last_seen')
+
+    def __init__(self, size):
+        self.size = size
+        # Deck position -> card for the positions moved by a swap; any other
+        # position still holds its own index, so a fresh deck costs nothing
+        self.swapped = {}
+        self.remaining = size
+        self.draws = 0
+        # (due_at_draw, challenge) for challenges the player failed
+        self.reviews = deque()
+        self.last_seen = 0.0
+
+
+class ChallengeScheduler:
+    """
+    Hands out challenges per player without repeats.
+
+    Players are keyed by a stable id the caller chooses (the game uses the
+    rated name of matchmade players, and otherwise its match ID and player
+    number, since display names are shared defaults). Each player draws
+    from their own deck over the whole bank using an incremental
+    Fisher-Yates shuffle (one swap per draw, O(1)) that only stores the
+    swapped positions, so a deck costs memory per draw rather than per
+    challenge in the bank; when the deck runs out it starts over.
+    Challenges the player fails come back after `review_gap` more draws, or
+    the caller's shorter gap for a deck that only lasts a short match. At
+    most `max_players` decks are kept: inactive players are evicted after
+    `ttl` seconds or in LRU order.
+    """
+
+    def __init__(self, bank=None, max_players=50000, ttl=3600, review_gap=3, max_reviews=10):
+        self.bank = bank or default_bank
+        self.max_players = max_players
+        self.ttl = ttl
+        self.review_gap = review_gap
+        self.max_reviews = max_reviews
+        self.players = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _deck(self, player, now):
+        deck = self.players.get(player)
+        if deck is None:
+            # Drop players idle past the TTL (oldest first), then enforce the cap
+            while self.players:
+                oldest = next(iter(self.players.values()))
+                if now - oldest.last_seen <= self.ttl and len(self.players) < self.max_players:
+                    break
+                self.players.popitem(last=False)
+            deck = self.players[player] = _PlayerDeck(len(self.bank.all))
+        else:
+            self.players.move_to_end(player)
+        deck.last_seen = now
+        return deck
+
+    def draw(self, player):
+        """Next challenge for `player`: a due review first, else the next card of the deck."""
+        self.bank.load()
+        with self.lock:
+            deck = self._deck(player, time.monotonic())
+            deck.draws += 1
+            if deck.reviews and deck.reviews[0][0] <= deck.draws:
+                return deck.reviews.popleft()[1]
+
+            if deck.remaining == 0 or deck.size != len(self.bank.all):
+                # Deck exhausted (or the bank grew): start a fresh cycle
+                deck.size = deck.remaining = len(self.bank.all)
+                deck.swapped.clear()
+            i = random.randrange(deck.remaining)
+            last = deck.remaining - 1
+            swapped = deck.swapped
+            card = swapped.get(i, i)
+            # The last undrawn card takes the drawn one's place; `last` leaves the deck
+            if i != last:
+                swapped[i] = swapped.get(last, last)
+            swapped.pop(last, None)
+            deck.remaining = last
+            return self.bank.all[card]
+
+    def record(self, player, challenge, passed, gap=None):
+        """Queue a failed challenge for review, due after at most `gap` draws; passing a review drops it."""
+        if passed:
+            return
+        gap = self.review_gap if gap is None else min(gap, self.review_gap)
+        with self.lock:
+            deck = self.players.get(player)
+            if deck is None:
+                return
+            if len(deck.reviews) >= self.max_reviews:
+                deck.reviews.popleft()
+            deck.reviews.append((deck.draws + gap, challenge))
+
+    def __len__(self):
+        return len(self.players)
+
+
+scheduler = ChallengeScheduler()
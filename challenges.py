@@ -1,13 +1,28 @@
+import csv
+import json
+import os
 import random
-from quiz import quiz_questions
-from guessTheWord import word_guess_questions
+import threading
+from collections import namedtuple
+from answer_matching import AnswerMatcher
 
-def get_random_quiz_question():
-    question_data = random.choice(quiz_questions)
+# One preprocessed challenge. `public` is the payload sent to clients (no
+# answer) and is shared between matches, so treat it as read-only;
+# `public_json` is the same payload already encoded; `answer` is normalized;
+# `matcher` grades submissions (see answer_matching).
+Challenge = namedtuple('Challenge', ['id', 'type', 'public', 'public_json', 'answer', 'matcher'])
+
+QUIZ_LETTERS = ['a', 'b', 'c', 'd']
+
+
+def normalize(answer):
+    return str(answer).lower().strip()
+
+
+def make_quiz_challenge(challenge_id, question_data):
     opts = question_data.get('options', [])
     mapped = {}
-    letters = ['a', 'b', 'c', 'd']
-    for i, letter in enumerate(letters):
+    for i, letter in enumerate(QUIZ_LETTERS):
         try:
             raw = opts[i]
         except IndexError:
@@ -18,44 +33,157 @@ def get_random_quiz_question():
         else:
             text = raw
         mapped[letter] = text
+    public = {'type': 'quiz', 'question': question_data['question'], 'options': mapped}
+    correct = question_data['correct_answer']
+    return Challenge(challenge_id, 'quiz', public, json.dumps(public), normalize(correct),
+                     AnswerMatcher.for_quiz(correct, mapped, question_data.get('aliases', ())))
+
+
+def make_word_challenge(challenge_id, challenge):
+    public = {'type': 'word_guess', 'clue': challenge['clue'], 'hint': challenge['hint']}
+    return Challenge(challenge_id, 'word_guess', public, json.dumps(public), normalize(challenge['word']),
+                     AnswerMatcher.for_word(challenge['word'], challenge.get('aliases', ())))
+
+
+def split_aliases(value):
+    return [alias for alias in (value or '').split('|') if alias.strip()]
+
+
+def read_bank_file(path):
+    """
+    Read extra questions from a JSON file ({"quiz": [...], "word_guess": [...]},
+    items shaped like quiz.py / guessTheWord.py) or a CSV file with a `type`
+    column plus question,a,b,c,d,correct_answer or clue,hint,word columns.
+    Items may list other accepted answers in `aliases` ('|'-separated in CSV).
+    Returns (quiz_items, word_items).
+    """
+    if path.endswith('.csv'):
+        quiz_items, word_items = [], []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('type') == 'quiz':
+                    quiz_items.append({
+                        'question': row['question'],
+                        'options': [row.get(letter, '') for letter in QUIZ_LETTERS],
+                        'correct_answer': row['correct_answer'],
+                        'aliases': split_aliases(row.get('aliases'))
+                    })
+                elif row.get('type') == 'word_guess':
+                    word_items.append({'clue': row['clue'], 'hint': row['hint'], 'word': row['word'],
+                                       'aliases': split_aliases(row.get('aliases'))})
+        return quiz_items, word_items
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('quiz', []), data.get('word_guess', [])
+
+
+def builtin_items():
+    """The questions of quiz.py and guessTheWord.py, imported on first use."""
+    from quiz import quiz_questions
+    from guessTheWord import word_guess_questions
+    return quiz_questions, word_guess_questions
+
+
+class ChallengeBank:
+    """
+    Immutable challenge records built once, sampled in O(1).
+
+    Sources (bank file paths, or `builtin_items`) are only read the first
+    time a challenge is drawn or looked up, so large banks don't slow down
+    startup.
+    """
+
+    def __init__(self, quiz_items=(), word_items=(), sources=()):
+        self.quiz = []
+        self.word_guess = []
+        self.all = []
+        self.by_id = {}
+        self.sources = list(sources)
+        self.lock = threading.Lock()
+        self._extend(quiz_items, word_items, 'builtin')
+
+    def _extend(self, quiz_items, word_items, prefix):
+        for item in quiz_items:
+            self._add(self.quiz, make_quiz_challenge(f'{prefix}:quiz:{len(self.quiz)}', item))
+        for item in word_items:
+            self._add(self.word_guess, make_word_challenge(f'{prefix}:word:{len(self.word_guess)}', item))
+
+    def _add(self, pool, challenge):
+        pool.append(challenge)
+        self.all.append(challenge)
+        self.by_id[challenge.id] = challenge
+
+    def add_source(self, path):
+        self.sources.append(path)
+
+    def load(self):
+        """Build the challenges of any sources not loaded yet."""
+        with self.lock:
+            while self.sources:
+                source = self.sources[0]
+                if source is builtin_items:
+                    self._extend(*builtin_items(), 'builtin')
+                else:
+                    self._extend(*read_bank_file(source), os.path.basename(source))
+                # Dropped only once loaded, so callers that see no sources see every challenge
+                self.sources.pop(0)
+
+    def sample(self, kind=None):
+        if self.sources:
+            self.load()
+        # Choose between quiz and word guess, then an item of that kind
+        if kind is None:
+            kind = 'quiz' if random.random() < 0.5 else 'word_guess'
+        pool = self.quiz if kind == 'quiz' else self.word_guess
+        return pool[random.randrange(len(pool))]
+
+    def get(self, challenge_id):
+        if self.sources:
+            self.load()
+        return self.by_id.get(challenge_id)
+
+
+# Extra bank files can be listed in CHALLENGE_BANKS (os.pathsep separated)
+bank = ChallengeBank(sources=[builtin_items] + [
+    path for path in os.environ.get('CHALLENGE_BANKS', '').split(os.pathsep) if path
+])
+
+
+def get_random_quiz_question():
+    challenge = bank.sample('quiz')
+    return dict(challenge.public, correct_answer=challenge.answer)  # kept for server-side checking
 
-    return {
-        'type': 'quiz',
-        'question': question_data['question'],
-        'options': mapped,
-        'correct_answer': question_data['correct_answer']  # kept for server-side checking
-    }
 
 def get_random_word_challenge():
-    challenge = random.choice(word_guess_questions)
-    return {
-        'type': 'word_guess',
-        'clue': challenge['clue'],
-        'hint': challenge['hint'],
-        'word': challenge['word']  # kept for server-side checking
-    }
+    challenge = bank.sample('word_guess')
+    return dict(challenge.public, word=challenge.answer)  # kept for server-side checking
+
 
 def get_random_challenge():
-    # Choose between quiz and word guess
-    if random.choice(['quiz', 'word_guess']) == 'quiz':
-        return get_random_quiz_question()
-    else:
-        return get_random_word_challenge()
+    return bank.sample()
+
 
 def check_challenge(challenge, answer):
     """
     Check the provided answer against the stored challenge.
-    For quiz challenge answer should be a single letter like 'a', 'b', etc.
-    For word_guess the answer should be the guessed word.
+    For quiz challenge answer can be the letter ('a'), the option ('a) went')
+    or its text ('went'). For word_guess the answer should be the guessed
+    word; small typos in longer words are accepted.
+    Accepts a Challenge record or the dicts returned by get_random_quiz_question
+    / get_random_word_challenge.
     Returns True if correct, False otherwise.
     """
+    if isinstance(challenge, Challenge):
+        return challenge.matcher.matches(answer)
+
     if not challenge or 'type' not in challenge:
         return False
 
+    # Plain dicts aren't preprocessed, so build their matcher per call
     if challenge['type'] == 'quiz':
-        expected = challenge.get('correct_answer')
-        return str(answer).lower().strip() == str(expected).lower().strip()
+        matcher = AnswerMatcher.for_quiz(challenge.get('correct_answer'), challenge.get('options') or {})
     elif challenge['type'] == 'word_guess':
-        expected = challenge.get('word')
-        return str(answer).lower().strip() == str(expected).lower().strip()
-    return False
+        matcher = AnswerMatcher.for_word(challenge.get('word'))
+    else:
+        return False
+    return matcher.matches(answer)
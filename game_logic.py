@@ -1,52 +1,142 @@
-import random
+import asyncio
 import json
+import secrets
+import threading
 from datetime import datetime
-from challenges import get_random_challenge, check_challenge
+import metrics
+from challenges import bank, check_challenge
+from challenge_scheduler import scheduler
+from record_store import RecordStore
+from strategies import DIFFICULTIES, make_strategy
+from match_state import NO_MOVE, MatchState, PlayerState
+from rules import DRAW, FIRST, get_rules
+
+
+GAME_MODES = ('player_vs_player', 'cpu_vs_cpu') + tuple(f'player_vs_cpu_{level}' for level in DIFFICULTIES)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
 
 class RockPaperScissors:
-    def __init__(self):
-        self.choices = ["rock", "paper", "scissors"]
-        self.records_file = "game_records.json"
+    def __init__(self, store=None, journal=None, match_id=None, history=None, ratings=None):
+        # State version: bumped on every mutation so clients can wait for changes
+        self.version = 0
+        self.changed = threading.Condition()
+        self.async_waiters = []  # (loop, future) pairs from wait_for_change_async
+        self._snapshot = None       # (version, state) built at most once per version
+        self._prev_snapshot = None  # previous one, used to compute deltas
+        self._snapshot_json = None  # (version, encoded snapshot)
         self.reset_game()
+        # Matches served from a session store share one record store
+        self.store = store
         self.load_records()
+        # Optional MatchJournal that makes this match survive restarts
+        self.journal = journal
+        self.match_id = match_id
+        # Optional MatchHistory that keeps every round for replays
+        self.history = history
+        # Optional RatingEngine updated when a PvP match completes
+        self.ratings = ratings
     
     def reset_game(self):
-        self.game_state = {
-            'game_mode': None,
-            'player1': {'name': 'Player 1', 'score': 0, 'choice': None, 'is_human': True, 'choice_made': False},
-            'player2': {'name': 'CPU', 'score': 0, 'choice': None, 'is_human': False, 'choice_made': False},
-            'draws': 0,
-            'current_round': 1,
-            'max_rounds': 5,
-            'player_history': [],
-            'game_active': False,
-            'both_choices_made': False
-        }
+        self.game_state = MatchState()
+        self.choices = list(self.game_state.rules.moves)
         # Challenge state when a loser must perform an English challenge
         self.current_challenge = None
         self.challenge_for_player = None  # 1 or 2
+        # CPU opponent models for this match, created on first use per difficulty
+        self.cpu_strategies = {}
+        # play_round results by (round, player_number), so retries aren't applied twice
+        self.submissions = {}
+        self.bump_version()
+
+    def bump_version(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def log_state(self):
+        if self.journal is not None:
+            self.journal.record(self.match_id, self)
+
+    def load_state(self, version, state, challenge_id, challenge_for_player):
+        """Load a dumped state (MatchState.dump) as `version` of this match."""
+        self.game_state = MatchState.load(state)
+        self.choices = list(self.game_state.rules.moves)
+        self.current_challenge = bank.get(challenge_id) if challenge_id else None
+        self.challenge_for_player = challenge_for_player if self.current_challenge else None
+        self.version = version
+
+    def restore(self, version, state, challenge_id, challenge_for_player):
+        """Load a state logged by the journal. CPU models start fresh."""
+        self.load_state(version, state, challenge_id, challenge_for_player)
+        self.bump_version()
+
+    def wait_for_change(self, since, timeout):
+        """Block until the state version is newer than `since` (or timeout)."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > since, timeout)
+            return self.version
+
+    async def wait_for_change_async(self, since, timeout):
+        """Like wait_for_change, but parks a future instead of a thread."""
+        loop = asyncio.get_running_loop()
+        with self.changed:
+            if self.version > since:
+                return self.version
+            waiter = (loop, loop.create_future())
+            self.async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            with self.changed:
+                if waiter in self.async_waiters:
+                    self.async_waiters.remove(waiter)
+        return self.version
+
+    def snapshot(self):
+        """Client state for the current version, built only once per version."""
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            self._prev_snapshot = self._snapshot
+            self._snapshot = (self.version, self.get_game_state())
+        return self._snapshot[1]
+
+    def snapshot_json(self):
+        """The snapshot encoded as JSON bytes, also cached per version."""
+        if self._snapshot_json is None or self._snapshot_json[0] != self.version:
+            self._snapshot_json = (self.version, json.dumps(self.snapshot()).encode('utf-8'))
+        return self._snapshot_json[1]
+
+    def state_since(self, since):
+        """
+        Changes since version `since`: a delta of the top-level keys that
+        differ when the client is one snapshot behind, else the full state.
+        """
+        state = self.snapshot()
+        prev = self._prev_snapshot
+        if prev is not None and prev[0] == since:
+            delta = {key: value for key, value in state.items() if prev[1].get(key) != value}
+            return {'version': self.version, 'delta': delta}
+        return {'version': self.version, 'state': state}
     
     def load_records(self):
-        try:
-            with open(self.records_file, 'r') as f:
-                self.records = json.load(f)
-            # Validate structure: ensure lists for each record category
-            for key in ["player_vs_player", "player_vs_cpu", "tournament_winners"]:
-                if key not in self.records or not isinstance(self.records[key], list):
-                    # If the file has a non-list (e.g. {}), coerce to empty list
-                    self.records[key] = []
-        except FileNotFoundError:
-            self.records = {
-                "player_vs_player": [],
-                "player_vs_cpu": [],
-                "tournament_winners": []
-            }
+        # The store migrates the legacy game_records.json on first start
+        if self.store is None:
+            self.store = RecordStore()
+        # In-memory stores expose their records; shared ones are only queried
+        self.records = getattr(self.store, 'records', None)
     
     def save_records(self):
-        with open(self.records_file, 'w') as f:
-            json.dump(self.records, f, indent=2)
+        # Records are appended as they are saved; this just forces a group commit
+        self.store.flush()
     
-    def start_game(self, game_mode, player1_name, player2_name, max_rounds):
+    def start_game(self, game_mode, player1_name, player2_name, max_rounds, variant='classic', tokens=(None, None)):
         self.reset_game()
         # Defensive: coerce max_rounds to int and ensure minimum of 1
         try:
@@ -56,110 +146,146 @@ class RockPaperScissors:
         except (TypeError, ValueError):
             max_rounds = 5
 
-        self.game_state.update({
-            'game_mode': game_mode,
-            'player1': {'name': player1_name, 'score': 0, 'choice': None, 'is_human': True, 'choice_made': False},
-            'player2': {'name': player2_name, 'score': 0, 'choice': None, 'is_human': False, 'choice_made': False},
-            'max_rounds': max_rounds,
-            'game_active': True,
-            'both_choices_made': False
-        })
-        
-        # Set player types based on game mode
-        if game_mode == 'player_vs_player':
-            self.game_state['player2']['is_human'] = True
-        elif game_mode in ['player_vs_cpu_easy', 'player_vs_cpu_hard']:
-            self.game_state['player2']['is_human'] = False
-        elif game_mode == 'cpu_vs_cpu':
-            self.game_state['player1']['is_human'] = False
-            self.game_state['player2']['is_human'] = False
+        # Set player types based on game mode; unknown variants play classic rules
+        rules = get_rules(variant)
+        self.choices = list(rules.moves)
+        self.game_state = MatchState(
+            game_mode=game_mode,
+            rules=rules,
+            player1=PlayerState(player1_name, game_mode != 'cpu_vs_cpu', token=tokens[0]),
+            player2=PlayerState(player2_name, game_mode == 'player_vs_player', token=tokens[1]),
+            max_rounds=max_rounds,
+            game_active=True
+        )
+        if self.history is not None:
+            self.history.begin(self.match_id, game_mode, player1_name, player2_name, rules.name)
         
+        self.bump_version()
+        self.log_state()
         return self.get_game_state()
     
     def get_cpu_choice(self, difficulty="easy"):
-        if difficulty == "easy":
-            return random.choice(self.choices)
-        else:  # hard
-            if len(self.game_state['player_history']) >= 3:
-                recent_moves = self.game_state['player_history'][-5:]
-                most_common = max(set(recent_moves), key=recent_moves.count)
-                if random.random() < 0.7:
-                    counters = {'rock': 'paper', 'paper': 'scissors', 'scissors': 'rock'}
-                    return counters[most_common]
-            return random.choice(self.choices)
+        # Strategies update incrementally, so each move costs O(1) however long the match
+        strategy = self.cpu_strategies.get(difficulty)
+        if strategy is None:
+            strategy = self.cpu_strategies[difficulty] = make_strategy(difficulty, self.game_state.rules)
+        return strategy.choose()
+
+    def cpu_difficulty(self):
+        # 'player_vs_cpu_hard' -> 'hard'; unknown suffixes fall back to random play
+        return (self.game_state.game_mode or '').rsplit('_', 1)[-1]
     
-    def play_round(self, player_choice=None, player_number=1):
-        if not self.game_state['game_active']:
+    def duplicate_submission(self, round_number, player_number):
+        """
+        The answer to a repeated play_round for (round, player), or None if
+        the submission is new. Results of the latest round are cached; older
+        rounds, or a cache lost with a reload, get the current state instead.
+        """
+        state = self.game_state
+        result = self.submissions.get((round_number, player_number))
+        if result is not None:
+            metrics.PLAYS_REJECTED.inc('duplicate')
+            return result
+        if round_number < state.current_round or (
+                round_number == state.current_round and state.player(player_number).choice_made):
+            metrics.PLAYS_REJECTED.inc('stale')
+            return {'status': 'duplicate', 'game_state': self.get_game_state()}
+        if round_number > state.current_round:
+            return {'error': 'Round not started'}
+        return None
+
+    def authorized(self, player_number, token):
+        """Whether `token` may act for the player; only matchmade players have a token."""
+        expected = self.game_state.player(player_number).token
+        return expected is None or secrets.compare_digest(str(token or ''), expected)
+
+    def play_round(self, player_choice=None, player_number=1, round_number=None, token=None):
+        if player_number not in (1, 2):
+            return {'error': 'Invalid player number'}
+        if not self.authorized(player_number, token):
+            return {'error': 'Invalid player token'}
+        # Clients that send the round they are playing get each move applied once
+        if round_number is not None:
+            duplicate = self.duplicate_submission(round_number, player_number)
+            if duplicate is not None:
+                return duplicate
+        state = self.game_state
+        if not state.game_active:
             return {'error': 'Game not active'}
+        # An empty choice asks the CPU to move; anything else must be a known move
+        codes = state.rules.codes
+        if player_choice and player_choice not in codes:
+            return {'error': 'Invalid choice'}
+        code = codes[player_choice] if player_choice else NO_MOVE
         
         # Set player choices
-        if player_number == 1:
-            self.game_state['player1']['choice'] = player_choice
-            self.game_state['player1']['choice_made'] = bool(player_choice)
-            if player_choice and self.game_state['player1']['is_human']:
-                self.game_state['player_history'].append(player_choice)
-        else:
-            self.game_state['player2']['choice'] = player_choice
-            self.game_state['player2']['choice_made'] = bool(player_choice)
+        player = state.player1 if player_number == 1 else state.player2
+        changed_mind = player.choice_made
+        player.choice = code
+        player.choice_made = code != NO_MOVE
+        if player_number == 1 and player.choice_made and player.is_human:
+            # A second move in the same round replaces the first
+            if changed_mind:
+                state.player_history.amend(code)
+            else:
+                state.player_history.append(code)
         
         # If CPU needs to make a choice
-        if (not self.game_state['player1']['choice'] and 
-            not self.game_state['player1']['is_human']):
-            difficulty = 'hard' if 'hard' in self.game_state.get('game_mode', '') else 'easy'
-            cpu_choice = self.get_cpu_choice(difficulty)
-            self.game_state['player1']['choice'] = cpu_choice
-            self.game_state['player1']['choice_made'] = True
-        
-        if (not self.game_state['player2']['choice'] and 
-            not self.game_state['player2']['is_human']):
-            difficulty = 'hard' if 'hard' in self.game_state.get('game_mode', '') else 'easy'
-            cpu_choice = self.get_cpu_choice(difficulty)
-            self.game_state['player2']['choice'] = cpu_choice
-            self.game_state['player2']['choice_made'] = True
+        for cpu in (state.player1, state.player2):
+            if cpu.choice == NO_MOVE and not cpu.is_human:
+                cpu.choice = codes[self.get_cpu_choice(self.cpu_difficulty())]
+                cpu.choice_made = True
         
         # Check if both choices are made
-        both_made = (self.game_state['player1']['choice_made'] and 
-                    self.game_state['player2']['choice_made'])
+        both_made = state.player1.choice_made and state.player2.choice_made
         
-        self.game_state['both_choices_made'] = both_made
+        state.both_choices_made = both_made
+        self.bump_version()
         
+        round_number = state.current_round
         if both_made:
-            return self.determine_winner()
+            result = self.determine_winner()
+            # Once a round is resolved, a retry from either player gets its result
+            self.submissions = {(round_number, 1): result, (round_number, 2): result}
         else:
-            return {
+            self.log_state()
+            result = {
                 'status': 'waiting', 
                 'game_state': self.get_game_state(),
                 'player_ready': player_number,
                 'both_ready': False
             }
+            self.submissions[(round_number, player_number)] = result
+        return result
     
     def determine_winner(self):
-        choice1 = self.game_state['player1']['choice']
-        choice2 = self.game_state['player2']['choice']
+        state = self.game_state
+        player1, player2 = state.player1, state.player2
+        choice1 = player1.choice
+        choice2 = player2.choice
+
+        # CPU models learn the human's move only once the round is resolved
+        if player1.is_human:
+            for strategy in self.cpu_strategies.values():
+                strategy.observe(state.rules.moves[choice1])
         
-        if choice1 == choice2:
+        # One lookup in the rule set's precomputed outcome/message tables
+        outcome, victory_message = state.rules.resolve(choice1, choice2)
+        metrics.ROUNDS_PLAYED.inc('player_vs_player' if state.game_mode == 'player_vs_player' else 'player_vs_cpu')
+        if outcome == DRAW:
             result = 'draw'
-            self.game_state['draws'] += 1
+            state.draws += 1
             message = "It's a DRAW!"
-        elif ((choice1 == 'rock' and choice2 == 'scissors') or
-              (choice1 == 'scissors' and choice2 == 'paper') or
-              (choice1 == 'paper' and choice2 == 'rock')):
+        elif outcome == FIRST:
             result = 'player1'
-            self.game_state['player1']['score'] += 1
-            message = f"{self.game_state['player1']['name']} WINS!"
+            player1.score += 1
+            message = f"{player1.name} WINS!"
         else:
             result = 'player2'
-            self.game_state['player2']['score'] += 1
-            message = f"{self.game_state['player2']['name']} WINS!"
-        
-        # Victory messages
-        victory_messages = {
-            ('rock', 'scissors'): "Rock crushes Scissors! 💥",
-            ('scissors', 'paper'): "Scissors cut Paper! ✂️📄",
-            ('paper', 'rock'): "Paper covers Rock! 📄🪨"
-        }
-        
-        victory_message = victory_messages.get((choice1, choice2), "") if result == 'player1' else victory_messages.get((choice2, choice1), "")
+            player2.score += 1
+            message = f"{player2.name} WINS!"
+        if self.history is not None:
+            self.history.add_round(self.match_id, state, outcome)
         
         round_result = {
             'result': result,
@@ -170,151 +296,140 @@ class RockPaperScissors:
         }
         
         # Reset choices for next round (but keep the made flags for display)
-        self.game_state['player1']['choice_made'] = False
-        self.game_state['player2']['choice_made'] = False
-        self.game_state['both_choices_made'] = False
+        player1.choice_made = False
+        player2.choice_made = False
+        state.both_choices_made = False
 
         # If someone lost and is human, create a challenge for the loser
         # Determine loser
         if result in ['player1', 'player2']:
-            loser = 'player2' if result == 'player1' else 'player1'
-            loser_num = 1 if loser == 'player1' else 2
+            loser_num = 2 if result == 'player1' else 1
+            loser = state.player(loser_num)
             # Only issue a challenge if the loser is human
-            if self.game_state[loser]['is_human']:
-                # create a challenge and attach to state
-                self.current_challenge = get_random_challenge()
+            if loser.is_human:
+                # create a challenge and attach to state; the scheduler avoids
+                # repeats and brings back challenges this player failed
+                self.current_challenge = scheduler.draw(self.deck_of(loser_num)[0])
                 self.challenge_for_player = loser_num
                 round_result['challenge_issued'] = True
+                metrics.CHALLENGES_ISSUED.inc(self.current_challenge.type)
                 # Do not end the round immediately; caller should fetch challenge
 
         # Check if game should continue (increment round after handling challenges)
-        self.game_state['current_round'] += 1
-        if self.game_state['current_round'] > self.game_state['max_rounds']:
+        state.current_round += 1
+        if state.current_round > state.max_rounds:
             # If a challenge was just issued, postpone finalizing the game until challenge resolution
             if round_result.get('challenge_issued'):
                 # Mark that the game should end after the challenge finishes
-                self.game_state['end_after_challenge'] = True
+                state.end_after_challenge = True
                 round_result['game_complete'] = False
             else:
                 round_result['game_complete'] = True
-                self.game_state['game_active'] = False
-                # Save records for PvP games
-                if self.game_state['game_mode'] == 'player_vs_player':
-                    winner = (self.game_state['player1']['name'] 
-                             if self.game_state['player1']['score'] > self.game_state['player2']['score'] 
-                             else self.game_state['player2']['name'])
-                    self.save_record('player_vs_player', {
-                        'match': f"{self.game_state['player1']['name']} vs {self.game_state['player2']['name']}",
-                        'winner': winner,
-                        'date': datetime.now().isoformat()
-                    })
+                state.game_active = False
+                self.save_match_record()
 
+        self.bump_version()
+        self.log_state()
         return round_result
 
+    def save_match_record(self):
+        state = self.game_state
+        player1, player2 = state.player1, state.player2
+        record = {
+            'match': f"{player1.name} vs {player2.name}",
+            'date': datetime.now().isoformat()
+        }
+        # Equal scores are a draw, not a win for player 2
+        if player1.score == player2.score:
+            record['winner'] = None
+            record['draw'] = True
+            score1 = 0.5
+        else:
+            record['winner'] = player1.name if player1.score > player2.score else player2.name
+            score1 = 1.0 if player1.score > player2.score else 0.0
+        if self.match_id:
+            # Links the record to /api/match/<match_id>/replay
+            record['match_id'] = self.match_id
+        if state.game_mode == 'player_vs_player':
+            self.save_record('player_vs_player', record)
+            if self.ratings is not None and player1.name != player2.name:
+                self.ratings.update(player1.name, player2.name, score1)
+        elif state.game_mode != 'cpu_vs_cpu':
+            # CPU-only matches are exhibitions; they have no record category
+            self.save_record('player_vs_cpu', record)
+
     # Challenge-related methods
     def get_current_challenge(self):
+        # The bank keeps a public payload (no answer) for every challenge
         if not self.current_challenge:
             return None
-        # Return challenge without exposing the correct answer when sending to clients
-        ch = self.current_challenge.copy()
-        # For server-side checking we keep the 'word' or 'correct_answer' in memory
-        # but remove it from the public payload
-        if ch.get('type') == 'quiz':
-            ch.pop('correct_answer', None)
-        elif ch.get('type') == 'word_guess':
-            ch.pop('word', None)
-        return ch
-
-    def submit_challenge_answer(self, player_number, answer):
+        return self.current_challenge.public
+
+    def deck_of(self, player_number):
+        """(scheduler key, review gap) of a player's challenge deck."""
+        state = self.game_state
+        player = state.player(player_number)
+        # Matchmade players keep one deck across matches, under the name they are rated by
+        if player.token:
+            return ('player', player.name), None
+        # Otherwise the deck lasts one match, so failures must come back within it
+        return (self.match_id, player_number), max(1, state.max_rounds // 3)
+
+    def submit_challenge_answer(self, player_number, answer, token=None):
         # Only allow the player who was assigned the challenge to submit
         if not self.current_challenge or self.challenge_for_player != player_number:
             return {'error': 'No challenge for this player'}
+        if not self.authorized(player_number, token):
+            return {'error': 'Invalid player token'}
 
-        passed = check_challenge(self.current_challenge, answer)
+        state = self.game_state
+        challenge = self.current_challenge
+        passed = check_challenge(challenge, answer)
+        deck, gap = self.deck_of(player_number)
+        scheduler.record(deck, challenge, passed, gap)
+        metrics.CHALLENGES_ANSWERED.inc(challenge.type, 'true' if passed else 'false')
         # Clear challenge state
         self.current_challenge = None
         self.challenge_for_player = None
 
         if not passed:
             # If failed, award point to opponent
-            opponent_num = 1 if player_number == 2 else 2
-            self.game_state[f'player{opponent_num}']['score'] += 1
+            state.player(1 if player_number == 2 else 2).score += 1
+        if self.history is not None:
+            self.history.add_challenge(self.match_id, state, player_number, challenge.id, passed)
+        self.bump_version()
 
         # If we were supposed to end the game after this challenge, finalize now
-        if self.game_state.get('end_after_challenge'):
-            self.game_state['game_active'] = False
+        if state.end_after_challenge:
+            state.game_active = False
             # mark game complete in the returned payload
             resp = {'passed': passed, 'game_state': self.get_game_state(), 'game_complete': True}
 
-            # Save records for PvP games if applicable
-            if self.game_state.get('game_mode') == 'player_vs_player':
-                winner = (self.game_state['player1']['name'] 
-                         if self.game_state['player1']['score'] > self.game_state['player2']['score'] 
-                         else self.game_state['player2']['name'])
-                self.save_record('player_vs_player', {
-                    'match': f"{self.game_state['player1']['name']} vs {self.game_state['player2']['name']}",
-                    'winner': winner,
-                    'date': datetime.now().isoformat()
-                })
+            self.save_match_record()
 
             # Clear the flag
-            self.game_state['end_after_challenge'] = False
+            state.end_after_challenge = False
+            self.log_state()
             return resp
 
+        self.log_state()
         return {'passed': passed, 'game_state': self.get_game_state()}
     
     def get_game_state(self):
-        # Return a safe version of game state that hides opponent's choice
-        safe_state = self.game_state.copy()
-
-        # If both choices aren't made, hide the actual choices from players
-        if not safe_state['both_choices_made']:
-            # For player 1 - only show if they've made a choice
-            if safe_state['player1']['choice_made']:
-                safe_state['player1']['choice_display'] = 'ready'
-                safe_state['player1']['choice_emoji'] = '✅'
-                safe_state['player1']['choice_text'] = 'Ready!'
-            else:
-                safe_state['player1']['choice_display'] = 'waiting'
-                safe_state['player1']['choice_emoji'] = '❓'
-                safe_state['player1']['choice_text'] = 'Waiting...'
-
-            # For player 2 - only show if they've made a choice
-            if safe_state['player2']['choice_made']:
-                safe_state['player2']['choice_display'] = 'ready'
-                safe_state['player2']['choice_emoji'] = '✅'
-                safe_state['player2']['choice_text'] = 'Ready!'
-            else:
-                safe_state['player2']['choice_display'] = 'waiting'
-                safe_state['player2']['choice_emoji'] = '❓'
-                safe_state['player2']['choice_text'] = 'Waiting...'
-        else:
-            # When both are ready, show the actual choices
-            emojis = {'rock': '🪨', 'paper': '📄', 'scissors': '✂️'}
-            names = {'rock': 'ROCK', 'paper': 'PAPER', 'scissors': 'SCISSORS'}
-
-            safe_state['player1']['choice_display'] = 'revealed'
-            safe_state['player1']['choice_emoji'] = emojis.get(safe_state['player1']['choice'], '❓')
-            safe_state['player1']['choice_text'] = names.get(safe_state['player1']['choice'], 'UNKNOWN')
-
-            safe_state['player2']['choice_display'] = 'revealed'
-            safe_state['player2']['choice_emoji'] = emojis.get(safe_state['player2']['choice'], '❓')
-            safe_state['player2']['choice_text'] = names.get(safe_state['player2']['choice'], 'UNKNOWN')
+        # Return a safe version of game state; choices are only revealed
+        # once both players have made theirs
+        safe_state = self.game_state.to_dict()
 
         # Expose minimal challenge info (no answers) so clients can react
         safe_state['challenge_pending'] = bool(self.current_challenge)
         safe_state['challenge_for_player'] = self.challenge_for_player
+        safe_state['version'] = self.version
 
         return safe_state
-        
     
     def get_records(self):
-        return self.records
+        return self.store.snapshot()
     
     def save_record(self, record_type, data):
-        # Be defensive: if the record_type is missing or not a list (file corruption), coerce it
-        if record_type not in self.records or not isinstance(self.records.get(record_type), list):
-            self.records[record_type] = []
-
-        self.records[record_type].append(data)
-        self.save_records()
\ No newline at end of file
+        # O(1): the store queues the record and its writer batches it to disk
+        self.store.append(record_type, data)
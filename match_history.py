@@ -0,0 +1,378 @@
+"""
+Per-round match history as fixed-width binary rows.
+
+Every resolved round and every graded challenge is one 25-byte row in
+`rounds_file` (see ROW). Match metadata (ID, mode, players, variant, start
+time) is one JSON line per match in `matches_file`, and challenge IDs one
+JSON string per line in `challenges_file`; rows refer to both by their line
+number (challenge 0 meaning none). Only the byte offset of each metadata
+line is kept in memory; the line is read back when it is needed. Rows are only appended, so the file can
+be read back as columns with NumPy (`load_columns`) or streamed with
+struct.iter_unpack (`iter_rows`) at millions of rows per second.
+
+    python match_history.py export rounds.csv
+"""
+import argparse
+import atexit
+import csv
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+import metrics
+from rules import DRAW, FIRST, SECOND, get_rules
+
+# match_no, round, kind, move1, move2, outcome, passed, score1, score2, draws, time, challenge
+ROW = struct.Struct('<IHBbbBBHHHII')
+FIELDS = ('match_no', 'round', 'kind', 'move1', 'move2', 'outcome', 'passed',
+          'score1', 'score2', 'draws', 'time', 'challenge')
+NUMPY_DTYPE = [('match_no', '<u4'), ('round', '<u2'), ('kind', 'u1'), ('move1', 'i1'), ('move2', 'i1'),
+               ('outcome', 'u1'), ('passed', 'u1'), ('score1', '<u2'), ('score2', '<u2'), ('draws', '<u2'),
+               ('time', '<u4'), ('challenge', '<u4')]
+
+# kind: a resolved round (outcome is rules.DRAW/FIRST/SECOND) or a graded
+# challenge (outcome is the player who answered, passed is 0/1)
+ROUND, CHALLENGE = 0, 1
+KINDS = {ROUND: 'round', CHALLENGE: 'challenge'}
+RESULTS = {DRAW: 'draw', FIRST: 'player1', SECOND: 'player2'}
+MAX_U16 = 0xFFFF
+
+
+def iter_lines(path):
+    """
+    (start, end, JSON value) of each line of a line file, stopping at a torn
+    line (crash mid-write, or a line the writer hasn't finished). Read-only:
+    only MatchHistory, which owns the file, cuts the torn tail off.
+    """
+    try:
+        with open(path, 'rb') as f:
+            start = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                try:
+                    value = json.loads(line)
+                except ValueError:
+                    return
+                yield start, start + len(line), value
+                start += len(line)
+    except FileNotFoundError:
+        pass
+
+
+def read_lines(path):
+    """JSON values of a line file (see iter_lines)."""
+    return [value for _, _, value in iter_lines(path)]
+
+
+def cut_tail(path, end):
+    """Truncate a file to `end` bytes if it is longer, so later appends stay readable."""
+    if os.path.exists(path) and os.path.getsize(path) > end:
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+
+
+def describe(row, rules, challenge_ids):
+    """Client form of a row: move names instead of codes."""
+    event = {'round': row['round'], 'kind': KINDS.get(row['kind'], row['kind']),
+             'score': [row['score1'], row['score2']], 'draws': row['draws'], 'time': row['time']}
+    if row['kind'] == ROUND:
+        event['player1_choice'] = rules.moves[row['move1']] if 0 <= row['move1'] < rules.size else None
+        event['player2_choice'] = rules.moves[row['move2']] if 0 <= row['move2'] < rules.size else None
+        event['result'] = RESULTS.get(row['outcome'])
+    else:
+        event['player'] = row['outcome']
+        event['passed'] = bool(row['passed'])
+        code = row['challenge']
+        event['challenge_id'] = challenge_ids[code - 1] if 0 < code <= len(challenge_ids) else None
+    return event
+
+
+class MatchHistory:
+    def __init__(self, rounds_file="match_rounds.bin", matches_file="match_index.jsonl",
+                 challenges_file="challenge_index.jsonl", batch_size=256, flush_interval=0.2):
+        self.rounds_file = rounds_file
+        self.matches_file = matches_file
+        self.challenges_file = challenges_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # Serializes writes to the files; taken before `lock`, never while holding it
+        self.io_lock = threading.Lock()
+        self.pending_rows = bytearray()
+        self.pending_matches = []
+        self.pending_challenges = []
+        self.offsets = array('Q')   # match_no -> offset of its metadata line in matches_file
+        self.matches_end = 0        # end of matches_file once the queued lines are written
+        self.numbers = {}      # match_id -> match_no
+        self.challenge_ids = []     # challenge code - 1 -> challenge ID
+        self.challenge_codes = {}   # challenge ID -> code
+        # Row index for replays, caught up from the file by each replay under
+        # index_lock (not `lock`, so recording carries on meanwhile)
+        self.index_lock = threading.Lock()
+        self.rows_of = {}      # match_no -> array of row numbers
+        self.indexed = 0       # rows of rounds_file already in rows_of
+        self.row_count = 0
+        self.loaded = False
+        self.closed = False
+
+        # The files are read when the history is first used, not at startup
+        self.writer = threading.Thread(target=self._run_writer, name='match-history', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def load(self):
+        """Read the ID tables and open the files, if not done yet."""
+        with self.cond:
+            self._load()
+
+    def _load(self):
+        # Caller holds the lock
+        if self.loaded or self.closed:
+            return
+        end = 0
+        for offset, end, meta in iter_lines(self.matches_file):
+            self.numbers[meta['match_id']] = len(self.offsets)
+            self.offsets.append(offset)
+        cut_tail(self.matches_file, end)
+        self.matches_end = end
+        end = 0
+        for _, end, challenge_id in iter_lines(self.challenges_file):
+            self.challenge_ids.append(challenge_id)
+        cut_tail(self.challenges_file, end)
+        self.challenge_codes = {challenge_id: code for code, challenge_id in enumerate(self.challenge_ids, 1)}
+
+        if os.path.exists(self.rounds_file):
+            # Drop a partial row left by a crash mid-write
+            size = os.path.getsize(self.rounds_file)
+            if size % ROW.size:
+                with open(self.rounds_file, 'r+b') as f:
+                    f.truncate(size - size % ROW.size)
+            self.row_count = size // ROW.size
+        self.rounds_handle = open(self.rounds_file, 'ab')
+        # Binary, so offsets count the bytes actually written
+        self.matches_handle = open(self.matches_file, 'ab')
+        self.challenges_handle = open(self.challenges_file, 'a', encoding='utf-8')
+        self.loaded = True
+
+    def _index_rows(self):
+        # Caller holds index_lock; only reads the rows written since the last call
+        try:
+            written = os.path.getsize(self.rounds_file) // ROW.size
+        except FileNotFoundError:
+            return
+        row = self.indexed
+        for match_no, *_ in iter_rows(self.rounds_file, start=row, stop=written):
+            rows = self.rows_of.get(match_no)
+            if rows is None:
+                rows = self.rows_of[match_no] = array('I')
+            rows.append(row)
+            row += 1
+        self.indexed = row
+
+    def begin(self, match_id, game_mode, player1, player2, variant):
+        """Register a new match; its rounds can then be added by match_id."""
+        meta = {'match_id': match_id, 'game_mode': game_mode, 'player1': player1,
+                'player2': player2, 'variant': variant, 'started': int(time.time())}
+        line = json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n'
+        with self.cond:
+            self._load()
+            self.numbers[match_id] = len(self.offsets)
+            self.offsets.append(self.matches_end)
+            self.matches_end += len(line)
+            self.pending_matches.append(line)
+
+    def add(self, match_id, round_number, kind, move1, move2, outcome, passed, score1, score2, draws,
+            challenge_id=None):
+        with self.cond:
+            self._load()
+            match_no = self.numbers.get(match_id)
+            if match_no is None or self.closed:
+                return
+            challenge = self.challenge_codes.get(challenge_id, 0) if challenge_id else 0
+            if challenge_id and not challenge:
+                self.challenge_ids.append(challenge_id)
+                challenge = self.challenge_codes[challenge_id] = len(self.challenge_ids)
+                self.pending_challenges.append(json.dumps(challenge_id, ensure_ascii=False))
+            self.pending_rows += ROW.pack(match_no, min(round_number, MAX_U16), kind, move1, move2, outcome,
+                                          passed, min(score1, MAX_U16), min(score2, MAX_U16),
+                                          min(draws, MAX_U16), int(time.time()), challenge)
+            self.row_count += 1
+            if len(self.pending_rows) >= self.batch_size * ROW.size:
+                self.cond.notify()
+
+    def add_round(self, match_id, state, outcome):
+        self.add(match_id, state.current_round, ROUND, state.player1.choice, state.player2.choice,
+                 outcome, 0, state.player1.score, state.player2.score, state.draws)
+
+    def add_challenge(self, match_id, state, player_number, challenge_id, passed):
+        self.add(match_id, state.current_round - 1, CHALLENGE, -1, -1, player_number, int(passed),
+                 state.player1.score, state.player2.score, state.draws, challenge_id)
+
+    def replay(self, match_id):
+        """(metadata, events) of a match, or None if unknown; events come lazily in order."""
+        # Rows still queued are in memory only; write them so one read sees all
+        self.flush()
+        with self.cond:
+            self._load()
+            match_no = self.numbers.get(match_id)
+            if match_no is None:
+                return None
+            offset = self.offsets[match_no]
+            challenge_ids = list(self.challenge_ids)
+        meta = next(self._read_metas(offset), None)
+        if meta is None:
+            return None
+        with self.index_lock:
+            self._index_rows()
+            rows = self.rows_of.get(match_no, array('I'))[:]
+        return meta, self._read_events(rows, get_rules(meta.get('variant')), challenge_ids)
+
+    def metas(self, start=0):
+        """Metadata of the written matches from match number `start` on, in order."""
+        with self.lock:
+            if not self.loaded or start >= len(self.offsets):
+                return iter(())
+            offset = self.offsets[start]
+        return self._read_metas(offset)
+
+    def _read_metas(self, offset):
+        with open(self.matches_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                # A line still being written ends the matches written so far
+                if not line.endswith(b'\n'):
+                    return
+                yield json.loads(line)
+
+    def _read_events(self, rows, rules, challenge_ids):
+        with open(self.rounds_file, 'rb') as f:
+            for row in rows:
+                f.seek(row * ROW.size)
+                data = f.read(ROW.size)
+                # Rows added after the flush may not be written yet
+                if len(data) < ROW.size:
+                    return
+                yield describe(dict(zip(FIELDS, ROW.unpack(data))), rules, challenge_ids)
+
+    def _write_pending(self):
+        with self.io_lock:
+            with self.lock:
+                if self.closed or not self.loaded:
+                    return
+                batch = self._take_pending()
+            self._write_batch(*batch)
+
+    def _take_pending(self):
+        # Caller holds the lock
+        batch = (self.pending_matches, self.pending_challenges, self.pending_rows)
+        self.pending_matches = []
+        self.pending_challenges = []
+        self.pending_rows = bytearray()
+        return batch
+
+    def _write_batch(self, matches, challenges, rows):
+        # Caller holds io_lock only; ID tables go first so rows never point past them
+        if not matches and not challenges and not rows:
+            return
+        start = time.perf_counter()
+        if matches:
+            self.matches_handle.write(b''.join(matches))
+            self.matches_handle.flush()
+            os.fsync(self.matches_handle.fileno())
+        if challenges:
+            self.challenges_handle.write('\n'.join(challenges) + '\n')
+            self.challenges_handle.flush()
+            os.fsync(self.challenges_handle.fileno())
+        if rows:
+            self.rounds_handle.write(rows)
+            self.rounds_handle.flush()
+            os.fsync(self.rounds_handle.fileno())
+        metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'history')
+
+    def _run_writer(self):
+        while True:
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.flush_interval)
+            self._write_pending()
+
+    def flush(self):
+        self._write_pending()
+
+    def close(self):
+        with self.io_lock:
+            with self.cond:
+                if self.closed:
+                    return
+                self.closed = True
+                self.cond.notify()
+                if not self.loaded:
+                    return
+                batch = self._take_pending()
+            self._write_batch(*batch)
+            self.rounds_handle.close()
+            self.matches_handle.close()
+            self.challenges_handle.close()
+
+def iter_rows(rounds_file="match_rounds.bin", chunk_rows=65536, start=0, stop=None):
+    """Rows `start` to `stop` (default: the end) of a history file as tuples (see FIELDS), read in large chunks."""
+    with open(rounds_file, 'rb') as f:
+        f.seek(start * ROW.size)
+        left = None if stop is None else max(stop - start, 0)
+        while left is None or left > 0:
+            count = chunk_rows if left is None else min(chunk_rows, left)
+            chunk = f.read(count * ROW.size)
+            if len(chunk) < ROW.size:
+                return
+            rows = len(chunk) // ROW.size
+            yield from ROW.iter_unpack(chunk[:rows * ROW.size])
+            if left is not None:
+                left -= rows
+
+
+def load_columns(rounds_file="match_rounds.bin"):
+    """The history file as a read-only NumPy record array (memory-mapped)."""
+    import numpy as np
+    dtype = np.dtype(NUMPY_DTYPE)
+    rows = os.path.getsize(rounds_file) // dtype.itemsize
+    if not rows:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(rounds_file, dtype=dtype, mode='r', shape=(rows,))
+
+
+def export_csv(output, rounds_file="match_rounds.bin", matches_file="match_index.jsonl"):
+    matches = [meta['match_id'] for meta in read_lines(matches_file)]
+    count = 0
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('match_id',) + FIELDS)
+        for row in iter_rows(rounds_file):
+            match_id = matches[row[0]] if row[0] < len(matches) else ''
+            writer.writerow((match_id,) + row)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match history tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="write every history row as CSV")
+    export.add_argument('output')
+    export.add_argument('--rounds-file', default='match_rounds.bin')
+    export.add_argument('--matches-file', default='match_index.jsonl')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = export_csv(args.output, args.rounds_file, args.matches_file)
+    print(f"exported {count} rows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: the journal is not guarded against a second process
+    fcntl = None
+
+
+class MatchJournal:
+    """
+    Write-ahead log of live match state, so matches survive a restart.
+
+    Every mutation of a match appends one compact JSON line to `log_file`:
+    [match_id, version, state, challenge_id, challenge_for_player], or
+    [match_id, null] when the match is removed. As with RecordStore, lines
+    are queued in memory and a background writer flushes them in batches
+    with one write + fsync, done outside the lock so logging a move never
+    waits for the disk.
+
+    The journal also keeps the latest line of every live match. Once
+    `snapshot_every` events have been logged, those lines are written to
+    `snapshot_file` (temp file + os.replace) and the log is truncated, so
+    recovery reads at most one snapshot plus `snapshot_every` log lines
+    however long the matches have been running.
+
+    Opening the journal recovers it and starts a new log, which would wipe
+    the log of a process still using it, so one process at a time holds an
+    exclusive lock on `log_file`.lock; a second one gets a RuntimeError.
+    """
+
+    def __init__(self, log_file="matches.wal", snapshot_file="matches.snapshot",
+                 snapshot_every=10000, batch_size=64, flush_interval=0.05):
+        self.log_file = log_file
+        self.snapshot_file = snapshot_file
+        self.snapshot_every = snapshot_every
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # Serializes writes to the files; taken before `lock`, never while holding it
+        self.io_lock = threading.Lock()
+        self.pending = []
+        self.latest = {}  # match_id -> encoded line of its last state
+        self.events_since_snapshot = 0
+        self.closed = False
+
+        self.lock_handle = self._claim()
+        self._recover()
+        # Start from a fresh snapshot so a torn log tail is never appended to
+        self._snapshot()
+
+        self.writer = threading.Thread(target=self._run_writer, name='match-journal', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _claim(self):
+        if fcntl is None:
+            return None
+        handle = open(self.log_file + '.lock', 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            raise RuntimeError(f"{self.log_file} is in use by another process; run a single worker "
+                               "or share state between workers with RPS_STATE_BACKEND") from None
+        return handle
+
+    def _recover(self):
+        # Snapshot first, then the log on top of it; the last line of a match wins
+        for path in (self.snapshot_file, self.log_file):
+            try:
+                f = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    line = line.strip()
+                    try:
+                        event = json.loads(line)
+                        match_id = event[0]
+                    except (ValueError, IndexError, TypeError):
+                        # Blank or torn line (crash mid-write)
+                        continue
+                    if event[1] is None:
+                        self.latest.pop(match_id, None)
+                    else:
+                        self.latest[match_id] = line
+
+    def matches(self):
+        """Recovered (match_id, version, state, challenge_id, challenge_for_player) tuples."""
+        with self.lock:
+            lines = list(self.latest.values())
+        return [json.loads(line) for line in lines]
+
+    def _log(self, match_id, line):
+        with self.cond:
+            if self.closed:
+                return
+            if line is None:
+                if self.latest.pop(match_id, None) is None:
+                    return
+                line = json.dumps([match_id, None])
+            else:
+                self.latest[match_id] = line
+            self.pending.append(line)
+            self.events_since_snapshot += 1
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    def record(self, match_id, game):
+        """Log the current state of `game`."""
+        challenge = game.current_challenge
+        self._log(match_id, json.dumps([
+            match_id, game.version, game.game_state.dump(),
+            challenge.id if challenge else None, game.challenge_for_player
+        ], ensure_ascii=False))
+
+    def remove(self, match_id):
+        self._log(match_id, None)
+
+    def _write_pending(self):
+        with self.io_lock:
+            with self.lock:
+                if self.closed:
+                    return
+                lines, self.pending = self.pending, []
+            self._write_lines(lines)
+
+    def _write_lines(self, lines):
+        # Caller holds io_lock only
+        if not lines:
+            return
+        start = time.perf_counter()
+        self.handle.write('\n'.join(lines) + '\n')
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'journal')
+
+    def _snapshot(self):
+        # Copies the latest lines under the lock and writes them outside it;
+        # events logged meanwhile stay queued for the new log
+        with self.io_lock:
+            with self.lock:
+                if self.closed:
+                    return
+                lines = list(self.latest.values())
+                self.pending = []
+                self.events_since_snapshot = 0
+            start = time.perf_counter()
+            tmp_file = self.snapshot_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            # Everything logged so far is in the snapshot, so the log starts over
+            handle = getattr(self, 'handle', None)
+            if handle is not None:
+                handle.close()
+            self.handle = open(self.log_file, 'w', encoding='utf-8')
+            metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'snapshot')
+
+    def _run_writer(self):
+        while True:
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.flush_interval)
+                snapshot = self.events_since_snapshot >= self.snapshot_every
+            if snapshot:
+                self._snapshot()
+            else:
+                self._write_pending()
+
+    def flush(self):
+        """Write and fsync every queued event now."""
+        self._write_pending()
+
+    def snapshot(self):
+        """Write a snapshot now and truncate the log."""
+        self._snapshot()
+
+    def close(self):
+        with self.io_lock:
+            with self.cond:
+                if self.closed:
+                    return
+                self.closed = True
+                lines, self.pending = self.pending, []
+                self.cond.notify()
+            self._write_lines(lines)
+            self.handle.close()
+            if self.lock_handle is not None:
+                self.lock_handle.close()
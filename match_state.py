@@ -0,0 +1,144 @@
+from array import array
+from dataclasses import dataclass, field
+
+from rules import CLASSIC, RuleSet, get_rules
+
+NO_MOVE = -1
+HISTORY_SIZE = 64
+
+# (choice_display, choice_emoji, choice_text) shown to clients
+WAITING = ('waiting', '❓', 'Waiting...')
+READY = ('ready', '✅', 'Ready!')
+REVEALED_UNKNOWN = ('revealed', '❓', 'UNKNOWN')
+
+
+def revealed_display(rules, code):
+    if code < 0:
+        return REVEALED_UNKNOWN
+    move = rules.moves[code]
+    return ('revealed', rules.emojis.get(move, '❓'), move.upper())
+
+
+class MoveHistory:
+    """Last `size` moves as small ints in a fixed array used as a ring buffer."""
+
+    __slots__ = ('moves', 'count')
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.moves = array('b', bytes(size))
+        self.count = 0
+
+    def append(self, code):
+        self.moves[self.count % len(self.moves)] = code
+        self.count += 1
+
+    def amend(self, code):
+        """Replace the latest move."""
+        if self.count:
+            self.moves[(self.count - 1) % len(self.moves)] = code
+
+    def __len__(self):
+        return min(self.count, len(self.moves))
+
+    def codes(self):
+        """Moves oldest first."""
+        size = len(self.moves)
+        if self.count <= size:
+            return self.moves[:self.count]
+        start = self.count % size
+        return self.moves[start:] + self.moves[:start]
+
+    def names(self, rules):
+        return [rules.moves[code] for code in self.codes()]
+
+    @classmethod
+    def from_codes(cls, codes):
+        history = cls()
+        for code in codes:
+            history.append(code)
+        return history
+
+
+@dataclass(slots=True)
+class PlayerState:
+    name: str
+    is_human: bool
+    score: int = 0
+    choice: int = NO_MOVE
+    choice_made: bool = False
+    # Secret a matchmade player must send with their moves; never sent in the state
+    token: str = None
+
+    def dump(self):
+        return [self.name, self.is_human, self.score, self.choice, self.choice_made, self.token]
+
+    def to_dict(self, revealed, rules):
+        if revealed:
+            display = revealed_display(rules, self.choice)
+        else:
+            display = READY if self.choice_made else WAITING
+        return {
+            'name': self.name,
+            'score': self.score,
+            # The move itself stays hidden until both players have chosen
+            'choice': rules.moves[self.choice] if revealed and self.choice >= 0 else None,
+            'is_human': self.is_human,
+            'choice_made': self.choice_made,
+            'choice_display': display[0],
+            'choice_emoji': display[1],
+            'choice_text': display[2],
+        }
+
+
+@dataclass(slots=True)
+class MatchState:
+    game_mode: str = None
+    rules: RuleSet = CLASSIC
+    player1: PlayerState = field(default_factory=lambda: PlayerState('Player 1', True))
+    player2: PlayerState = field(default_factory=lambda: PlayerState('CPU', False))
+    draws: int = 0
+    current_round: int = 1
+    max_rounds: int = 5
+    # Recent moves of a human player 1
+    player_history: MoveHistory = field(default_factory=MoveHistory)
+    game_active: bool = False
+    both_choices_made: bool = False
+    end_after_challenge: bool = False
+
+    def player(self, number):
+        return self.player1 if number == 1 else self.player2
+
+    def to_dict(self):
+        """
+        API representation. Builds fresh dicts every time, so display fields
+        never leak back into the live state.
+        """
+        revealed = self.both_choices_made
+        return {
+            'game_mode': self.game_mode,
+            'variant': self.rules.name,
+            'moves': self.rules.moves,
+            'player1': self.player1.to_dict(revealed, self.rules),
+            'player2': self.player2.to_dict(revealed, self.rules),
+            'draws': self.draws,
+            'current_round': self.current_round,
+            'max_rounds': self.max_rounds,
+            'player_history': self.player_history.names(self.rules),
+            'game_active': self.game_active,
+            'both_choices_made': self.both_choices_made,
+            'end_after_challenge': self.end_after_challenge,
+        }
+
+    def dump(self):
+        """Compact JSON-able form of the whole state, for the match journal."""
+        return [self.game_mode, self.rules.name, self.player1.dump(), self.player2.dump(),
+                self.draws, self.current_round, self.max_rounds, self.player_history.codes().tolist(),
+                self.game_active, self.both_choices_made, self.end_after_challenge]
+
+    @classmethod
+    def load(cls, data):
+        (game_mode, variant, player1, player2, draws, current_round, max_rounds, history,
+         game_active, both_choices_made, end_after_challenge) = data
+        return cls(game_mode, get_rules(variant), PlayerState(*player1), PlayerState(*player2),
+                   draws, current_round, max_rounds, MoveHistory.from_codes(history),
+                   game_active, both_choices_made, end_after_challenge)
@@ -0,0 +1,267 @@
+import heapq
+import secrets
+import threading
+import time
+from collections import deque
+
+DEFAULT_RATING = 1500
+
+
+class Ticket:
+    __slots__ = ('id', 'player', 'rating', 'joined', 'last_seen', 'bucket', 'match', 'matched_at', 'token', 'pairing')
+
+    def __init__(self, ticket_id, player, rating, now, bucket):
+        self.id = ticket_id
+        self.player = player
+        self.rating = rating
+        self.joined = now
+        self.last_seen = now
+        self.bucket = bucket
+        self.match = None  # (match_id, player_number) once paired
+        self.matched_at = None
+        self.token = None  # secret for play_round/submit_challenge, set on pairing
+        self.pairing = False  # reserved while its match is being opened
+
+
+class Matchmaker:
+    """
+    Queue of players waiting for an online PvP opponent.
+
+    Waiting tickets sit in rating buckets of `bucket_width` points; each
+    bucket is a heap ordered by join time, so its oldest player is at the
+    top. Two players may be paired when their rating gap is within the
+    window of the longer-waiting one, which starts at `base_gap` and grows
+    by `gap_per_second` while they wait (up to `max_gap`). A pairing attempt
+    only looks at the tops of the few buckets inside that window.
+
+    Pairing is tried when a player joins and whenever a waiting player polls
+    its ticket; `open_match(ticket1, ticket2)` starts the game and returns
+    its match ID. Each paired ticket gets a secret `token` that only its
+    status reveals, which the game then requires with that player's moves.
+    The pair is picked under the lock and reserved, and its match is opened
+    after releasing it, so other players aren't held up by open_match.
+
+    Leaving drops a ticket at once; not polling for `idle_timeout` seconds
+    drops it at the next join, poll or stats call, which sweep tickets in
+    the order they were last seen. Heap entries of dropped tickets are
+    skipped when they reach the top of their bucket.
+    """
+
+    def __init__(self, open_match, bucket_width=50, base_gap=100, gap_per_second=10, max_gap=400,
+                 idle_timeout=30, matched_ttl=300, rating_of=None):
+        self.open_match = open_match
+        self.rating_of = rating_of
+        self.bucket_width = bucket_width
+        self.base_gap = base_gap
+        self.gap_per_second = gap_per_second
+        self.max_gap = max_gap
+        self.idle_timeout = idle_timeout
+        self.matched_ttl = matched_ttl
+        self.lock = threading.Lock()
+        self.buckets = {}    # bucket -> heap of (joined, ticket_id)
+        self.tickets = {}    # ticket_id -> Ticket (waiting or recently matched)
+        self.matched = deque()  # ticket IDs in pairing order, expired after matched_ttl
+        self.seen = deque()  # (last_seen, ticket_id) in time order; stale once the ticket is seen again
+        self.recent_waits = deque(maxlen=1000)
+        self.counts = {'joined': 0, 'left': 0, 'timed_out': 0, 'paired': 0}
+
+    def _gap(self, ticket, now):
+        return min(self.base_gap + self.gap_per_second * (now - ticket.joined), self.max_gap)
+
+    def _active(self, ticket_id, now):
+        ticket = self.tickets.get(ticket_id)
+        if ticket is None or ticket.match is not None or ticket.pairing:
+            return None
+        if now - ticket.last_seen > self.idle_timeout:
+            del self.tickets[ticket_id]
+            self.counts['timed_out'] += 1
+            return None
+        return ticket
+
+    def _top(self, bucket, now, exclude):
+        """Oldest live ticket of a bucket other than `exclude`, popping dead entries."""
+        heap = self.buckets.get(bucket)
+        if heap is None:
+            return None
+        # `exclude` is set aside while the live top below it is found
+        held = None
+        found = None
+        while heap:
+            ticket = self._active(heap[0][1], now)
+            if ticket is None:
+                heapq.heappop(heap)
+            elif ticket is exclude:
+                # A failed pairing may have queued it twice; one entry is enough
+                entry = heapq.heappop(heap)
+                held = held or entry
+            else:
+                found = ticket
+                break
+        if held is not None:
+            heapq.heappush(heap, held)
+        if not heap:
+            del self.buckets[bucket]
+        return found
+
+    def _find_opponent(self, ticket, now):
+        # Scan outward from the player's bucket as far as any window can reach
+        reach = self.max_gap // self.bucket_width + 1
+        best = None
+        for bucket in range(ticket.bucket - reach, ticket.bucket + reach + 1):
+            other = self._top(bucket, now, ticket)
+            if other is None:
+                continue
+            gap = abs(other.rating - ticket.rating)
+            if gap > max(self._gap(ticket, now), self._gap(other, now)):
+                continue
+            # Longest-waiting eligible player first
+            if best is None or other.joined < best.joined:
+                best = other
+        return best
+
+    def _pair(self, pair):
+        """Open the match of a reserved pair; called without the lock."""
+        first, second = pair
+        try:
+            match_id = self.open_match(first, second)
+        except Exception:
+            # Back to the queue, with fresh heap entries in case theirs were popped meanwhile
+            with self.lock:
+                for ticket in pair:
+                    ticket.pairing = False
+                    ticket.token = None
+                    heapq.heappush(self.buckets.setdefault(ticket.bucket, []), (ticket.joined, ticket.id))
+            raise
+        now = time.monotonic()
+        with self.lock:
+            for number, ticket in ((1, first), (2, second)):
+                ticket.pairing = False
+                ticket.match = (match_id, number)
+                ticket.matched_at = now
+                self.recent_waits.append(now - ticket.joined)
+                self.matched.append(ticket.id)
+            self.counts['paired'] += 1
+
+    def _expire_matched(self, now):
+        while self.matched:
+            ticket = self.tickets.get(self.matched[0])
+            if ticket is not None and now - ticket.matched_at <= self.matched_ttl:
+                break
+            self.matched.popleft()
+            if ticket is not None:
+                del self.tickets[ticket.id]
+
+    def _expire_idle(self, now):
+        while self.seen and now - self.seen[0][0] > self.idle_timeout:
+            last_seen, ticket_id = self.seen.popleft()
+            ticket = self.tickets.get(ticket_id)
+            if ticket is not None and ticket.match is None and not ticket.pairing and ticket.last_seen == last_seen:
+                del self.tickets[ticket_id]
+                self.counts['timed_out'] += 1
+
+    def _seen(self, ticket, now):
+        ticket.last_seen = now
+        self.seen.append((now, ticket.id))
+
+    def _reserve(self, ticket, now):
+        """Pick and reserve an opponent for `ticket`; returns the pair (player 1 first) or None."""
+        opponent = self._find_opponent(ticket, now)
+        if opponent is None:
+            return None
+        # The longer-waiting player is player 1
+        pair = (ticket, opponent) if ticket.joined <= opponent.joined else (opponent, ticket)
+        for player in pair:
+            player.pairing = True
+            player.token = secrets.token_urlsafe(16)
+        return pair
+
+    def join(self, player, rating=None):
+        """Queue a player; returns the ticket status (possibly already matched)."""
+        if rating is None:
+            rating = self.rating_of(player) if self.rating_of else DEFAULT_RATING
+        now = time.monotonic()
+        with self.lock:
+            self._expire_matched(now)
+            self._expire_idle(now)
+            ticket_id = secrets.token_urlsafe(9)
+            ticket = Ticket(ticket_id, player, rating, now, int(rating // self.bucket_width))
+            self.tickets[ticket_id] = ticket
+            self._seen(ticket, now)
+            heapq.heappush(self.buckets.setdefault(ticket.bucket, []), (now, ticket_id))
+            self.counts['joined'] += 1
+            pair = self._reserve(ticket, now)
+            if pair is None:
+                return self._status(ticket, now)
+        self._pair(pair)
+        with self.lock:
+            return self._status(ticket, time.monotonic())
+
+    def poll(self, ticket_id):
+        """Status of a ticket, or None if unknown; waiting players are retried with a wider window."""
+        now = time.monotonic()
+        with self.lock:
+            self._expire_matched(now)
+            self._expire_idle(now)
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None:
+                return None
+            if ticket.pairing or ticket.match is not None:
+                return self._status(ticket, now)
+            if self._active(ticket_id, now) is None:
+                return None
+            self._seen(ticket, now)
+            pair = self._reserve(ticket, now)
+            if pair is None:
+                return self._status(ticket, now)
+        self._pair(pair)
+        with self.lock:
+            return self._status(ticket, time.monotonic())
+
+    def leave(self, ticket_id):
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None or ticket.match is not None or ticket.pairing:
+                return False
+            # Its heap entry is skipped when it reaches the top
+            del self.tickets[ticket_id]
+            self.counts['left'] += 1
+            return True
+
+    def _status(self, ticket, now):
+        if ticket.match is not None:
+            match_id, number = ticket.match
+            return {'ticket': ticket.id, 'status': 'matched', 'match_id': match_id, 'player_number': number,
+                    'player_token': ticket.token}
+        return {'ticket': ticket.id, 'status': 'waiting', 'rating': ticket.rating,
+                'waited': round(now - ticket.joined, 3)}
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            self._expire_idle(now)
+            oldest = None
+            depth = {}
+            for bucket, heap in self.buckets.items():
+                # A ticket may have two entries after a failed pairing
+                live = [self.tickets[ticket_id] for ticket_id in {entry[1] for entry in heap}
+                        if ticket_id in self.tickets and self.tickets[ticket_id].match is None
+                        and not self.tickets[ticket_id].pairing]
+                if live:
+                    low = bucket * self.bucket_width
+                    depth[f'{low}-{low + self.bucket_width - 1}'] = len(live)
+                    first = min(ticket.joined for ticket in live)
+                    oldest = first if oldest is None else min(oldest, first)
+            waits = sorted(self.recent_waits)
+            counts = dict(self.counts)
+        return {
+            'waiting': sum(depth.values()),
+            'depth_by_rating': dict(sorted(depth.items(), key=lambda item: int(item[0].split('-')[0]))),
+            'oldest_wait': round(now - oldest, 3) if oldest is not None else None,
+            'recent_wait': {
+                'count': len(waits),
+                'mean': sum(waits) / len(waits) if waits else None,
+                'p50': waits[len(waits) // 2] if waits else None,
+                'p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+            },
+            **counts,
+        }
@@ -0,0 +1,165 @@
+"""
+In-process metrics in Prometheus text format, plus an opt-in profiler.
+
+Set RPS_METRICS=0 to turn metric collection off (every update becomes a
+single flag check). Set RPS_PROFILE_EVERY=N to run cProfile on every Nth
+request and dump the stats into RPS_PROFILE_DIR (default ./profiles).
+"""
+import cProfile
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+enabled = os.environ.get('RPS_METRICS', '1') != '0'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.label_names + ('le',)
+        with self.lock:
+            for labels, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {series[-1]}')
+                lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+REQUEST_SECONDS = Histogram('rps_request_duration_seconds', 'Time spent handling a request', ['route', 'method'])
+ROUNDS_PLAYED = Counter('rps_rounds_played_total', 'Rounds resolved', ['game_mode'])
+CHALLENGES_ISSUED = Counter('rps_challenges_issued_total', 'Challenges given to round losers', ['type'])
+CHALLENGES_ANSWERED = Counter('rps_challenges_answered_total', 'Challenge answers graded', ['type', 'passed'])
+RECORD_WRITES = Counter('rps_record_writes_total', 'Records saved', ['record_type'])
+RECORD_IO_SECONDS = Histogram('rps_record_io_seconds', 'Time spent writing records and the match journal to disk', ['operation'])
+PLAYS_REJECTED = Counter('rps_play_round_rejected_total', 'play_round submissions not applied', ['reason'])
+
+REGISTRY = [REQUEST_SECONDS, ROUNDS_PLAYED, CHALLENGES_ISSUED, CHALLENGES_ANSWERED, RECORD_WRITES,
+            RECORD_IO_SECONDS, PLAYS_REJECTED]
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """Profiles one request out of every `every` and dumps it to `directory`."""
+
+    def __init__(self, every, directory):
+        self.every = every
+        self.directory = directory
+        self.requests = itertools.count(1)
+        # cProfile allows one active profiler at a time
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """Return a profiler, not yet running, if this request is sampled, else None."""
+        if next(self.requests) % self.every or not self.lock.acquire(blocking=False):
+            return None
+        return cProfile.Profile()
+
+    def start(self):
+        """Return a running profiler if this request is sampled, else None."""
+        profile = self.sample()
+        if profile:
+            profile.enable()
+        return profile
+
+    @staticmethod
+    def run(profile, func, *args):
+        """Call `func` under `profile` in the calling thread (cProfile only sees its own thread)."""
+        profile.enable()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+
+    def stop(self, profile, route):
+        profile.disable()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            name = '{}-{}.prof'.format(route.strip('/').replace('/', '_') or 'index', time.time_ns())
+            profile.dump_stats(os.path.join(self.directory, name))
+        finally:
+            self.lock.release()
+
+
+_every = int(os.environ.get('RPS_PROFILE_EVERY', 0) or 0)
+profiler = Profiler(_every, os.environ.get('RPS_PROFILE_DIR', 'profiles')) if _every > 0 else None
@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets, keyed by any hashable client id: a client may
+    send `burst` requests at once and `rate` per second after that. A bucket
+    is refilled lazily when its client is next seen, so a check is O(1). At most `max_clients` buckets are kept,
+    least recently seen dropped first (that client just starts over with a
+    full bucket).
+    """
+
+    def __init__(self, rate, burst, max_clients=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # client -> [tokens, last refill]
+
+    def take(self, client):
+        """Spend a token of `client`; returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = [self.burst, now]
+                if len(self.buckets) > self.max_clients:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
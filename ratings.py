@@ -0,0 +1,236 @@
+"""
+Elo ratings for PvP players.
+
+RatingEngine updates two ratings in O(1) as each match completes and keeps
+them in memory, read from `path` on first use; a background thread writes
+them back (temp file + os.replace) every `flush_interval` seconds when
+something changed.
+
+When the formula changes (K factor, initial rating), `rerate` rebuilds every
+rating from the saved player_vs_player records. Elo is sequential per
+player, so matches are grouped into levels where no player appears twice
+(each match goes one level after the previous matches of both its
+players); every level is then applied as one set of NumPy array operations,
+which gives exactly the ratings of a match-by-match replay.
+
+The K factor and initial rating saved with the ratings win over the
+constructor's, so a running server keeps using the formula they were
+built with. A server holds a shared lock on `path`.lock once it has loaded
+the ratings, and `rerate` refuses to run while that lock is held, since
+the server would write its copy back over the rebuilt file.
+
+With RPS_STATE_BACKEND=sqlite:///..., the ratings live in the database
+(state_backend.SQLiteRatingEngine) and `rerate` rebuilds them there from
+the database's records, in one transaction, without stopping the servers.
+
+    python ratings.py rerate --k 24
+"""
+import argparse
+import atexit
+import heapq
+import json
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock file, rerate is not guarded
+    fcntl = None
+
+from record_index import players_of
+
+K_FACTOR = 32
+INITIAL_RATING = 1500
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def match_score(data):
+    """(player1, player2, score of player1) for a PvP record, or None."""
+    names = players_of(data)
+    if len(names) != 2:
+        return None
+    if data.get('draw'):
+        return names[0], names[1], 0.5
+    winner = data.get('winner')
+    if winner == names[0]:
+        return names[0], names[1], 1.0
+    if winner == names[1]:
+        return names[0], names[1], 0.0
+    return None
+
+
+class RatingEngine:
+    def __init__(self, path="ratings.json", k=K_FACTOR, initial=INITIAL_RATING, flush_interval=5.0):
+        self.path = path
+        self.k = k
+        self.initial = initial
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.ratings = None  # player -> [rating, matches], loaded on first use
+        self.dirty = False
+        self.lock_handle = None  # open `path`.lock while it is held
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self._run_writer, name='rating-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _hold(self, exclusive=False):
+        """Lock `path`.lock, shared by servers and exclusive for rerate; False if it is taken."""
+        if fcntl is None:
+            return True
+        if self.lock_handle is None:
+            self.lock_handle = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(self.lock_handle, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+        except BlockingIOError:
+            return False
+        return True
+
+    def claim(self):
+        """Take the ratings for `rerate`; False while a server has them loaded."""
+        return self._hold(exclusive=True)
+
+    def _players(self):
+        # Caller holds the lock
+        if self.ratings is None:
+            # Waits for a rerate in progress, then keeps rerate off while loaded
+            self._hold()
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (FileNotFoundError, ValueError):
+                data = {}
+            self.k = data.get('k', self.k)
+            self.initial = data.get('initial', self.initial)
+            self.ratings = {player: list(entry) for player, entry in data.get('players', {}).items()}
+        return self.ratings
+
+    def rating(self, player):
+        with self.lock:
+            entry = self._players().get(player)
+            return entry[0] if entry else self.initial
+
+    def update(self, player1, player2, score1):
+        """Apply one match; `score1` is 1, 0.5 or 0 from player 1's side."""
+        with self.lock:
+            players = self._players()
+            a = players.setdefault(player1, [self.initial, 0])
+            b = players.setdefault(player2, [self.initial, 0])
+            delta = self.k * (score1 - expected_score(a[0], b[0]))
+            a[0] += delta
+            b[0] -= delta
+            a[1] += 1
+            b[1] += 1
+            self.dirty = True
+            return a[0], b[0]
+
+    def top(self, limit=10):
+        with self.lock:
+            best = heapq.nlargest(limit, self._players().items(), key=lambda item: item[1][0])
+        return [{'player': player, 'rating': round(rating, 1), 'matches': matches}
+                for player, (rating, matches) in best]
+
+    def replace(self, ratings):
+        """Swap in ratings rebuilt by `rerate` and write them out."""
+        with self.lock:
+            self.ratings = {player: list(entry) for player, entry in ratings.items()}
+            self.dirty = True
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {'k': self.k, 'initial': self.initial, 'players': self.ratings}
+            tmp_file = self.path + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.path)
+            self.dirty = False
+
+    def _run_writer(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.flush()
+
+
+def rerate(records, k=K_FACTOR, initial=INITIAL_RATING):
+    """Ratings ({player: [rating, matches]}) from PvP records in the order they were played."""
+    import numpy as np
+
+    ids = {}
+    first, second, scores, levels = [], [], [], []
+    last_level = []  # player id -> level of their latest match
+    for data in records:
+        match = match_score(data)
+        if match is None:
+            continue
+        a = ids.setdefault(match[0], len(ids))
+        b = ids.setdefault(match[1], len(ids))
+        if a == b:
+            continue
+        while len(last_level) < len(ids):
+            last_level.append(-1)
+        level = max(last_level[a], last_level[b]) + 1
+        last_level[a] = last_level[b] = level
+        first.append(a)
+        second.append(b)
+        scores.append(match[2])
+        levels.append(level)
+
+    ratings = np.full(len(ids), float(initial))
+    counts = np.zeros(len(ids), dtype=np.int64)
+    if first:
+        first, second = np.array(first), np.array(second)
+        scores, levels = np.array(scores), np.array(levels)
+        order = np.argsort(levels, kind='stable')
+        bounds = np.flatnonzero(np.diff(levels[order])) + 1
+        for batch in np.split(order, bounds):
+            # No player appears twice within a level, so plain fancy indexing is safe
+            a, b = first[batch], second[batch]
+            delta = k * (scores[batch] - 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400)))
+            ratings[a] += delta
+            ratings[b] -= delta
+        counts += np.bincount(first, minlength=len(ids)) + np.bincount(second, minlength=len(ids))
+    return {player: [float(ratings[i]), int(counts[i])] for player, i in ids.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rating tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    command = sub.add_parser('rerate', help="rebuild ratings.json from the saved PvP records")
+    command.add_argument('--k', type=float, default=K_FACTOR)
+    command.add_argument('--initial', type=float, default=INITIAL_RATING)
+    command.add_argument('--path', default='ratings.json')
+    command.add_argument('--state-backend', default=os.environ.get('RPS_STATE_BACKEND', 'memory'))
+    args = parser.parse_args()
+
+    if args.state_backend != 'memory':
+        from state_backend import SQLiteRatingEngine, open_pool
+        count = SQLiteRatingEngine(open_pool(args.state_backend)).rebuild(args.k, args.initial)
+        print(f"rerated {count} players in {args.state_backend}")
+        return
+    engine = RatingEngine(args.path, args.k, args.initial)
+    if not engine.claim():
+        sys.exit(f"{args.path} is in use by a running server; stop it before rerating")
+    from record_store import RecordStore
+    store = RecordStore()
+    ratings = rerate(store.snapshot().get('player_vs_player', []), args.k, args.initial)
+    store.close()
+    engine.replace(ratings)
+    engine.close()
+    print(f"rerated {len(ratings)} players into {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+def players_of(data):
+    """Player names mentioned by a record ('A vs B' matches or a champion)."""
+    if not isinstance(data, dict):
+        return []
+    match = data.get('match')
+    if isinstance(match, str) and ' vs ' in match:
+        return [name.strip() for name in match.split(' vs ', 1)]
+    champion = data.get('champion')
+    return [champion] if champion else []
+
+
+def date_of(data):
+    """A record's date, or '' if it has none (or not as a string)."""
+    date = data.get('date') if isinstance(data, dict) else None
+    return date if isinstance(date, str) else ''
+
+
+class RecordIndex:
+    """
+    Secondary indexes over the record store.
+
+    Records of a category are only ever appended, so a record's position in
+    its category list is a stable ID. The index keeps, per (category, player),
+    the sorted list of positions that mention the player, plus a win/loss
+    table updated as each record is added. Pages are read newest first and
+    the cursor is the position to continue below.
+
+    The date of every position is kept too. Records are normally saved in
+    date order, so since/until are two bisections on those dates; a
+    category whose dates ever go backwards falls back to checking each
+    record.
+    """
+
+    def __init__(self):
+        self.by_player = defaultdict(list)
+        self.standings = {}  # name -> [wins, losses]
+        self.dates = defaultdict(list)  # category -> date of each position ('' if none)
+        self.unordered = set()  # categories whose dates aren't sorted
+
+    def add(self, record_type, data, position):
+        date = date_of(data)
+        dates = self.dates[record_type]
+        if dates and date < dates[-1]:
+            self.unordered.add(record_type)
+        dates.append(date)
+
+        names = players_of(data)
+        for name in names:
+            self.by_player[(record_type, name)].append(position)
+
+        # Standings are between people: PvP only, and draws (no winner) don't count
+        winner = data.get('winner') if isinstance(data, dict) else None
+        if winner and len(names) == 2 and record_type == 'player_vs_player':
+            for name in names:
+                row = self.standings.setdefault(name, [0, 0])
+                row[0 if name == winner else 1] += 1
+
+    def query(self, entries, record_type, player=None, since=None, until=None, limit=50, cursor=None):
+        """Return (page, next_cursor) of `entries`, newest first."""
+        # Positions [low, high) hold the dates within since/until
+        low, high = 0, len(entries)
+        dates = self.dates.get(record_type, [])
+        indexed = len(dates) == len(entries)
+        if (since or until) and record_type not in self.unordered and indexed:
+            if since:
+                low = bisect_left(dates, since)
+            if until:
+                high = bisect_right(dates, until)
+        if cursor is not None:
+            high = min(high, cursor)
+
+        if player:
+            positions = self.by_player.get((record_type, player), [])
+            first = bisect_left(positions, low)
+            end = bisect_left(positions, high)
+            candidates = (positions[i] for i in range(end - 1, first - 1, -1))
+        else:
+            candidates = range(high - 1, low - 1, -1)
+
+        page = []
+        for position in candidates:
+            data = entries[position]
+            date = dates[position] if indexed else date_of(data)
+            # ISO dates compare correctly as strings
+            if since and date < since:
+                continue
+            if until and date > until:
+                continue
+            if len(page) == limit:
+                return page, page_cursor
+            page.append(data)
+            page_cursor = position
+        return page, None
+
+    def leaderboard(self, limit=10):
+        top = heapq.nlargest(limit, self.standings.items(), key=lambda item: (item[1][0], -item[1][1]))
+        return [
+            {'player': name, 'wins': wins, 'losses': losses, 'matches': wins + losses}
+            for name, (wins, losses) in top
+        ]
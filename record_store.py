@@ -0,0 +1,246 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+import metrics
+from record_index import RecordIndex
+
+RECORD_TYPES = ["player_vs_player", "player_vs_cpu", "tournament_winners"]
+
+
+def _metric_type(record_type):
+    # Keep metric labels bounded whatever clients send as record_type
+    return record_type if record_type in RECORD_TYPES else 'other'
+
+
+class RecordStore:
+    """
+    Append-only store for game records.
+
+    Each record is one JSON line ({"type": ..., "data": ...}) in `log_file`.
+    `append` only queues the line in memory; a background writer flushes
+    queued lines in batches with a single write + fsync (group commit), so
+    saving a record costs O(1) regardless of how much history there is.
+    The writer swaps the queue out under the lock and writes it outside, so
+    an append never waits for the disk.
+    `compact` rewrites the log atomically (temp file + os.replace).
+
+    The log is only read into memory by the first call that needs the
+    records (snapshot, query, leaderboard), so startup time doesn't grow
+    with the log; until then appends just go to the log. On first start an
+    existing `legacy_file` (the old game_records.json) is migrated into the
+    log. Every loaded record also updates a RecordIndex used for filtered
+    pages and the leaderboard.
+    """
+
+    def __init__(self, log_file="game_records.jsonl", legacy_file="game_records.json",
+                 batch_size=64, flush_interval=0.2):
+        self.log_file = log_file
+        self.legacy_file = legacy_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # Serializes writes to the log file; taken before `lock`, never while holding it
+        self.io_lock = threading.Lock()
+        self.pending = []
+        self.records = {key: [] for key in RECORD_TYPES}
+        self.index = RecordIndex()
+        self.loaded = False
+        self.closed = False
+
+        if os.path.exists(self.log_file):
+            self._end_last_line()
+        else:
+            self._migrate_legacy()
+            self._compact()
+            self.loaded = True
+
+        self.handle = open(self.log_file, 'a', encoding='utf-8')
+        self.writer = threading.Thread(target=self._run_writer, name='record-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _add(self, record_type, data):
+        # Be defensive: coerce unknown or corrupt categories to a list
+        if not isinstance(self.records.get(record_type), list):
+            self.records[record_type] = []
+        entries = self.records[record_type]
+        self.index.add(record_type, data, len(entries))
+        entries.append(data)
+
+    def _end_last_line(self):
+        # A torn last line (crash mid-write) would swallow the next append;
+        # ending it keeps it a bad line of its own, dropped when loading
+        with open(self.log_file, 'rb+') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    def _load(self):
+        # With the writer held off, the log plus the queued lines are every record
+        if self.loaded:
+            return
+        with self.io_lock, self.lock:
+            if self.loaded:
+                return
+            start = time.perf_counter()
+            damaged = self._load_log()
+            for line in self.pending:
+                entry = json.loads(line)
+                self._add(entry['type'], entry['data'])
+            self.loaded = True
+            metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'load')
+        if damaged:
+            # Rewriting the log drops the bad lines
+            self._compact()
+
+    def _load_log(self):
+        """Load the log into memory; return True if bad lines were skipped."""
+        damaged = False
+        with open(self.log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._add(entry['type'], entry['data'])
+                except (ValueError, KeyError, TypeError):
+                    damaged = True
+        return damaged
+
+    def _migrate_legacy(self):
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if not isinstance(legacy, dict):
+            return
+        for record_type, entries in legacy.items():
+            if isinstance(entries, list):
+                for data in entries:
+                    self._add(record_type, data)
+
+    def append(self, record_type, data):
+        line = json.dumps({'type': record_type, 'data': data}, ensure_ascii=False)
+        with self.cond:
+            if self.loaded:
+                self._add(record_type, data)
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+        metrics.RECORD_WRITES.inc(_metric_type(record_type))
+
+    def extend(self, record_type, entries):
+        """Append several records of one type under a single lock/batch."""
+        lines = [json.dumps({'type': record_type, 'data': data}, ensure_ascii=False) for data in entries]
+        with self.cond:
+            if self.loaded:
+                for data in entries:
+                    self._add(record_type, data)
+            self.pending.extend(lines)
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+        metrics.RECORD_WRITES.inc(_metric_type(record_type), amount=len(lines))
+
+    def snapshot(self):
+        """Copy of all records, safe to serialize while writers keep appending."""
+        self._load()
+        with self.lock:
+            return {key: list(entries) for key, entries in self.records.items()}
+
+    def query(self, record_types=None, **filters):
+        """
+        One page per category (newest first) plus the cursor for the next page
+        of each; `filters` are passed to RecordIndex.query.
+        """
+        self._load()
+        with self.lock:
+            result = {'next_cursor': {}}
+            for record_type in record_types or list(self.records):
+                entries = self.records.get(record_type, [])
+                page, cursor = self.index.query(entries, record_type, **filters)
+                result[record_type] = page
+                result['next_cursor'][record_type] = cursor
+            return result
+
+    def leaderboard(self, limit=10):
+        self._load()
+        with self.lock:
+            return self.index.leaderboard(limit)
+
+    def _write_pending(self):
+        with self.io_lock:
+            with self.lock:
+                if self.closed:
+                    return
+                lines, self.pending = self.pending, []
+            self._write_lines(lines)
+
+    def _write_lines(self, lines):
+        # Caller holds io_lock only; appends carry on while this writes and fsyncs
+        if not lines:
+            return
+        start = time.perf_counter()
+        self.handle.write('\n'.join(lines) + '\n')
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'write')
+
+    def _run_writer(self):
+        while True:
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.flush_interval)
+            self._write_pending()
+
+    def flush(self):
+        """Write and fsync every queued record now."""
+        self._write_pending()
+
+    def compact(self):
+        """Atomically rewrite the log from the in-memory records."""
+        self._load()
+        self._compact()
+
+    def _compact(self):
+        # The queued lines are part of the copied records, so the new log
+        # replaces them; records appended while it is written stay queued
+        with self.io_lock:
+            with self.lock:
+                if self.closed:
+                    return
+                records = {record_type: list(entries) for record_type, entries in self.records.items()}
+                self.pending = []
+            start = time.perf_counter()
+            tmp_file = self.log_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for record_type, entries in records.items():
+                    for data in entries:
+                        f.write(json.dumps({'type': record_type, 'data': data}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.log_file)
+            metrics.RECORD_IO_SECONDS.observe(time.perf_counter() - start, 'compact')
+            handle = getattr(self, 'handle', None)
+            if handle is not None:
+                handle.close()
+                self.handle = open(self.log_file, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.io_lock:
+            with self.cond:
+                if self.closed:
+                    return
+                self.closed = True
+                lines, self.pending = self.pending, []
+                self.cond.notify()
+            self._write_lines(lines)
+            self.handle.close()
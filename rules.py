@@ -0,0 +1,115 @@
+"""
+Move sets and their outcome tables.
+
+A RuleSet is declared once and shared by every match that uses it. Outcomes
+and victory messages come from flat N x N tables indexed by move codes, so
+resolving a round is a single lookup whatever the number of moves.
+"""
+DRAW, FIRST, SECOND = 0, 1, 2
+
+
+class RuleSet:
+    def __init__(self, name, moves, beats, messages=None, emojis=None):
+        """
+        `moves` fixes the move codes (their index); `beats` maps each move to
+        the moves it defeats; `messages` maps (winner, loser) to a victory line.
+        """
+        self.name = name
+        self.moves = tuple(moves)
+        self.codes = {move: code for code, move in enumerate(self.moves)}
+        self.size = n = len(self.moves)
+        self.emojis = emojis or {}
+        messages = messages or {}
+
+        # outcome[a * n + b]: DRAW, FIRST (a wins) or SECOND (b wins)
+        self.outcome = bytearray(n * n)
+        self.messages = [""] * (n * n)
+        for winner, losers in beats.items():
+            w = self.codes[winner]
+            for loser in losers:
+                l = self.codes[loser]
+                self.outcome[w * n + l] = FIRST
+                self.outcome[l * n + w] = SECOND
+                text = messages.get((winner, loser)) or f"{winner.title()} beats {loser.title()}!"
+                self.messages[w * n + l] = text
+                self.messages[l * n + w] = text
+
+        # counter[m]: a move that beats m (what to play if m is predicted)
+        self.counter = [next(w for w in range(n) if self.outcome[w * n + m] == FIRST) for m in range(n)]
+
+    def resolve(self, a, b):
+        """(outcome, victory message) for move codes a vs b."""
+        i = a * self.size + b
+        return self.outcome[i], self.messages[i]
+
+
+def cyclic_rules(name, moves, messages=None, emojis=None):
+    """
+    Balanced variant with an odd number of moves: each move beats the
+    (N - 1) / 2 moves that follow it in `moves`, wrapping around.
+    """
+    n = len(moves)
+    if n % 2 == 0:
+        raise ValueError("a balanced move set needs an odd number of moves")
+    half = (n - 1) // 2
+    beats = {moves[i]: [moves[(i + k) % n] for k in range(1, half + 1)] for i in range(n)}
+    return RuleSet(name, moves, beats, messages, emojis)
+
+
+CLASSIC = RuleSet(
+    'classic',
+    ["rock", "paper", "scissors"],
+    {'rock': ['scissors'], 'paper': ['rock'], 'scissors': ['paper']},
+    {
+        ('rock', 'scissors'): "Rock crushes Scissors! 💥",
+        ('scissors', 'paper'): "Scissors cut Paper! ✂️📄",
+        ('paper', 'rock'): "Paper covers Rock! 📄🪨"
+    },
+    {'rock': '🪨', 'paper': '📄', 'scissors': '✂️'}
+)
+
+RPSLS = RuleSet(
+    'rpsls',
+    ["rock", "paper", "scissors", "lizard", "spock"],
+    {
+        'rock': ['scissors', 'lizard'],
+        'paper': ['rock', 'spock'],
+        'scissors': ['paper', 'lizard'],
+        'lizard': ['paper', 'spock'],
+        'spock': ['rock', 'scissors'],
+    },
+    {
+        ('rock', 'scissors'): "Rock crushes Scissors! 💥",
+        ('rock', 'lizard'): "Rock crushes Lizard! 💥",
+        ('paper', 'rock'): "Paper covers Rock! 📄🪨",
+        ('paper', 'spock'): "Paper disproves Spock! 📄",
+        ('scissors', 'paper'): "Scissors cut Paper! ✂️📄",
+        ('scissors', 'lizard'): "Scissors decapitate Lizard! ✂️",
+        ('lizard', 'paper'): "Lizard eats Paper! 🦎",
+        ('lizard', 'spock'): "Lizard poisons Spock! 🦎",
+        ('spock', 'rock'): "Spock vaporizes Rock! 🖖",
+        ('spock', 'scissors'): "Spock smashes Scissors! 🖖",
+    },
+    {'rock': '🪨', 'paper': '📄', 'scissors': '✂️', 'lizard': '🦎', 'spock': '🖖'}
+)
+
+RPS7 = cyclic_rules(
+    'rps7',
+    ["rock", "fire", "scissors", "sponge", "paper", "air", "water"],
+    emojis={'rock': '🪨', 'fire': '🔥', 'scissors': '✂️', 'sponge': '🧽', 'paper': '📄', 'air': '💨', 'water': '💧'}
+)
+
+RPS15 = cyclic_rules(
+    'rps15',
+    ["rock", "fire", "scissors", "snake", "human", "tree", "wolf", "sponge",
+     "paper", "air", "water", "dragon", "devil", "lightning", "gun"]
+)
+
+# Generated large variant, mostly for simulations and benchmarks
+RPS101 = cyclic_rules('rps101', [f"move{i}" for i in range(1, 102)])
+
+VARIANTS = {rules.name: rules for rules in (CLASSIC, RPSLS, RPS7, RPS15, RPS101)}
+
+
+def get_rules(variant):
+    return VARIANTS.get(variant or 'classic', CLASSIC)
@@ -0,0 +1,117 @@
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.RLock()
+        # match_id -> [game, last_access]; kept in LRU order (oldest first)
+        self.matches = OrderedDict()
+
+
+class SessionStore:
+    """
+    Registry of live matches keyed by match ID.
+
+    Matches are spread across lock stripes (shards) so requests for
+    different matches rarely contend on the same lock. Each shard keeps its
+    matches in LRU order, drops the ones idle for longer than `ttl` seconds
+    and evicts the least recently used match once it is full, so memory is
+    bounded by `max_sessions`.
+
+    `factory(match_id)` builds the game for a new match; `on_remove(match_id)`,
+    if given, is called whenever a match is discarded, expires or is evicted.
+    """
+
+    def __init__(self, factory, shards=16, max_sessions=10000, ttl=1800, on_remove=None):
+        self.factory = factory
+        self.on_remove = on_remove
+        self.ttl = ttl
+        self.shards = [_Shard() for _ in range(shards)]
+        # Spread the global limit across shards (at least one slot each)
+        self.shard_capacity = max(1, max_sessions // shards)
+
+    def _shard(self, match_id):
+        return self.shards[hash(match_id) % len(self.shards)]
+
+    def _expire(self, shard, now):
+        # Oldest entries sit at the front, so stop at the first fresh one
+        while shard.matches:
+            match_id, entry = next(iter(shard.matches.items()))
+            if now - entry[1] <= self.ttl:
+                break
+            del shard.matches[match_id]
+            self._removed(match_id)
+
+    def _removed(self, match_id):
+        if self.on_remove is not None:
+            self.on_remove(match_id)
+
+    def create(self):
+        """Create a new match and return (match_id, game)."""
+        match_id = secrets.token_urlsafe(9)
+        game = self.factory(match_id)
+        self.restore(match_id, game)
+        return match_id, game
+
+    def restore(self, match_id, game):
+        """Register an existing game (e.g. one recovered after a restart)."""
+        shard = self._shard(match_id)
+        now = time.monotonic()
+        with shard.lock:
+            self._expire(shard, now)
+            while len(shard.matches) >= self.shard_capacity:
+                self._removed(shard.matches.popitem(last=False)[0])
+            shard.matches[match_id] = [game, now]
+
+    @contextmanager
+    def locked(self, match_id, write=True):
+        """
+        Yield the game for `match_id` (or None if unknown/expired) while
+        holding its shard lock, so the match is mutated by one request at a time.
+        `write` only matters to shared backends (see state_backend); in process
+        the shard lock is cheap either way.
+        """
+        shard = self._shard(match_id)
+        with shard.lock:
+            now = time.monotonic()
+            self._expire(shard, now)
+            entry = shard.matches.get(match_id) if match_id else None
+            if entry is not None:
+                entry[1] = now
+                shard.matches.move_to_end(match_id)
+                yield entry[0]
+            else:
+                yield None
+
+    def _get(self, match_id):
+        with self.locked(match_id) as game:
+            return game
+
+    def wait_for_change(self, match_id, since, timeout):
+        """Block until the match version passes `since`; None if the match is unknown."""
+        game = self._get(match_id)
+        if game is None:
+            return None
+        # Wait outside the shard lock so other matches (and this one) keep moving
+        return game.wait_for_change(since, timeout)
+
+    async def wait_for_change_async(self, match_id, since, timeout):
+        # The shard lock may be held by a request doing I/O; wait for it off the event loop
+        game = await asyncio.get_running_loop().run_in_executor(None, self._get, match_id)
+        if game is None:
+            return None
+        return await game.wait_for_change_async(since, timeout)
+
+    def discard(self, match_id):
+        shard = self._shard(match_id)
+        with shard.lock:
+            if shard.matches.pop(match_id, None) is not None:
+                self._removed(match_id)
+
+    def __len__(self):
+        return sum(len(shard.matches) for shard in self.shards)
@@ -0,0 +1,132 @@
+"""
+Headless CPU vs CPU simulator.
+
+Runs many matches between two CPU strategies at once with NumPy. Moves
+are the rule set's int codes and each round is resolved with one lookup
+in its N x N outcome table (0 draw, 1 player 1 wins, 2 player 2 wins),
+so large variants cost the same per round as classic RPS.
+
+    python simulator.py --p1 hard --p2 easy --matches 100000 --rounds 5 --variant rpsls
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from rules import FIRST, SECOND, VARIANTS, get_rules
+from strategies import FREQUENCY_COUNTER_PROB, FREQUENCY_MIN_HISTORY, FREQUENCY_WINDOW
+
+# 'hard' is FrequencyStrategy (the 'hard' CPU of strategies.make_strategy) with its default tuning, vectorized
+STRATEGIES = ("easy", "hard")
+
+
+def _choose(strategy, counts, seen, counter, rng):
+    """Vectorized move choice for every match; counts/seen describe the opponent."""
+    n, size = counts.shape
+    moves = rng.integers(0, size, size=n, dtype=np.int8)
+    if strategy == 'hard':
+        # Counter the opponent's most common recent move 70% of the time
+        predicted = counts.argmax(axis=1)
+        use_counter = (seen >= FREQUENCY_MIN_HISTORY) & (rng.random(n) < FREQUENCY_COUNTER_PROB)
+        moves = np.where(use_counter, counter[predicted], moves).astype(np.int8)
+    return moves
+
+
+def simulate(p1='easy', p2='easy', matches=10000, rounds=5, seed=None, variant='classic'):
+    """
+    Play `matches` matches of `rounds` rounds between two CPU strategies
+    and return aggregate stats as a JSON-serializable dict.
+    """
+    if p1 not in STRATEGIES or p2 not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {STRATEGIES}")
+    if matches <= 0 or rounds <= 0:
+        raise ValueError("matches and rounds must be positive")
+
+    rules = get_rules(variant)
+    size = rules.size
+    outcome_table = np.frombuffer(bytes(rules.outcome), dtype=np.uint8).reshape(size, size)
+    counter = np.array(rules.counter, dtype=np.int8)
+
+    rng = np.random.default_rng(seed)
+    rows = np.arange(matches)
+    window = min(FREQUENCY_WINDOW, rounds)
+
+    # Per player: ring buffer of its last moves and move counts inside it
+    history = [np.zeros((matches, window), dtype=np.int8) for _ in range(2)]
+    counts = [np.zeros((matches, size), dtype=np.int32) for _ in range(2)]
+    score1 = np.zeros(matches, dtype=np.int32)
+    score2 = np.zeros(matches, dtype=np.int32)
+    move_totals = np.zeros((2, size), dtype=np.int64)
+
+    for r in range(rounds):
+        # Each CPU looks at the other player's recent moves
+        a = _choose(p1, counts[1], r, counter, rng)
+        b = _choose(p2, counts[0], r, counter, rng)
+
+        outcome = outcome_table[a, b]
+        score1 += outcome == FIRST
+        score2 += outcome == SECOND
+        move_totals[0] += np.bincount(a, minlength=size)
+        move_totals[1] += np.bincount(b, minlength=size)
+
+        slot = r % window
+        for player, moves in enumerate((a, b)):
+            # One entry per row, so plain fancy-index updates are safe here
+            if r >= window:
+                counts[player][rows, history[player][:, slot]] -= 1
+            history[player][:, slot] = moves
+            counts[player][rows, moves] += 1
+
+    total_rounds = matches * rounds
+    p1_rounds = int(score1.sum())
+    p2_rounds = int(score2.sum())
+    diff = score1 - score2
+    diff_values, diff_counts = np.unique(diff, return_counts=True)
+
+    return {
+        'variant': rules.name,
+        'p1': p1,
+        'p2': p2,
+        'matches': matches,
+        'rounds': rounds,
+        'round_stats': {
+            'p1_wins': p1_rounds,
+            'p2_wins': p2_rounds,
+            'draws': total_rounds - p1_rounds - p2_rounds,
+            'p1_win_rate': p1_rounds / total_rounds,
+            'p2_win_rate': p2_rounds / total_rounds,
+        },
+        'match_stats': {
+            'p1_wins': int((diff > 0).sum()),
+            'p2_wins': int((diff < 0).sum()),
+            'draws': int((diff == 0).sum()),
+        },
+        'move_distribution': {
+            'p1': dict(zip(rules.moves, (move_totals[0] / total_rounds).tolist())),
+            'p2': dict(zip(rules.moves, (move_totals[1] / total_rounds).tolist())),
+        },
+        'score_diff_histogram': dict(zip(map(str, diff_values.tolist()), diff_counts.tolist())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless CPU vs CPU matches")
+    parser.add_argument('--p1', choices=STRATEGIES, default='hard')
+    parser.add_argument('--p2', choices=STRATEGIES, default='easy')
+    parser.add_argument('--matches', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='classic')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = simulate(args.p1, args.p2, args.matches, args.rounds, args.seed, args.variant)
+    elapsed = time.perf_counter() - start
+    stats['elapsed_seconds'] = elapsed
+    stats['rounds_per_second'] = args.matches * args.rounds / elapsed if elapsed else None
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,506 @@
+"""
+Shared state backend: match state, active challenges and records in SQLite.
+
+The default backend keeps everything in process (SessionStore, RecordStore,
+MatchJournal). Setting RPS_STATE_BACKEND=sqlite:///path/to/state.db puts
+the same state in one SQLite database in WAL mode, so several worker
+processes (or hosts sharing the file system) can serve the same matches.
+
+SQLiteSessionStore has SessionStore's interface. A request that changes a
+match loads its row inside a write transaction, which also serializes
+requests for the same match across processes, and writes the whole match
+back as a single UPDATE, so all the changes of a round cost one statement
+and one commit. Read-only requests (locked(match_id, write=False)) use a
+deferred read transaction, which WAL mode runs alongside writers. CPU
+models are stored as JSON (Strategy.dump), never pickled. Async waits for
+a new version are answered by one watcher thread per store, which checks
+the versions of every awaited match with one query per `poll_interval`.
+
+SQLiteRecordStore has RecordStore's interface; appends are queued and a
+background writer inserts each batch with executemany in one transaction,
+keeping the leaderboard standings and the Elo ratings in the same
+transaction. SQLiteRatingEngine reads those ratings with RatingEngine's
+interface, so every worker sees (and updates) the same ones.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from record_index import players_of
+from ratings import INITIAL_RATING, K_FACTOR, expected_score, match_score, rerate
+from record_store import RECORD_TYPES
+from strategies import make_strategy
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    challenge_id TEXT,
+    challenge_for_player INTEGER,
+    models TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_updated ON matches (updated);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    date TEXT,
+    player1 TEXT,
+    player2 TEXT
+);
+CREATE INDEX IF NOT EXISTS records_type ON records (type, id);
+CREATE INDEX IF NOT EXISTS records_player1 ON records (type, player1, id);
+CREATE INDEX IF NOT EXISTS records_player2 ON records (type, player2, id);
+CREATE TABLE IF NOT EXISTS standings (
+    player TEXT PRIMARY KEY,
+    wins INTEGER NOT NULL,
+    losses INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS standings_rank ON standings (wins DESC, losses);
+CREATE TABLE IF NOT EXISTS ratings (
+    player TEXT PRIMARY KEY,
+    rating REAL NOT NULL,
+    matches INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ratings_rank ON ratings (rating DESC);
+CREATE TABLE IF NOT EXISTS rating_settings (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+class ConnectionPool:
+    """Up to `size` SQLite connections, reused across threads."""
+
+    def __init__(self, path, size=8, timeout=30):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly with BEGIN
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.created < self.size
+                if grow:
+                    self.created += 1
+            conn = self._connect() if grow else self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    @contextmanager
+    def transaction(self, write=True):
+        """
+        A write transaction (BEGIN IMMEDIATE) or, with write=False, a read
+        transaction that takes no lock; committed unless the block raises.
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN DEFERRED')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+
+def open_pool(url, size=8):
+    """ConnectionPool for a 'sqlite:///path' URL."""
+    prefix = 'sqlite:///'
+    if not url.startswith(prefix):
+        raise ValueError(f"unsupported state backend: {url}")
+    return ConnectionPool(url[len(prefix):], size)
+
+
+def _settle(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class SQLiteSessionStore:
+    def __init__(self, pool, factory, max_sessions=10000, ttl=1800, poll_interval=0.1):
+        self.pool = pool
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.watch_lock = threading.Lock()
+        self.watchers = {}  # match_id -> [(since, loop, future)] of async waits
+        self.watcher = None
+
+    def _row(self, game):
+        challenge = game.current_challenge
+        models = {difficulty: strategy.dump() for difficulty, strategy in game.cpu_strategies.items()}
+        models = json.dumps(models, ensure_ascii=False) if models else None
+        return (game.version, json.dumps(game.game_state.dump(), ensure_ascii=False),
+                challenge.id if challenge else None, game.challenge_for_player, models, time.time())
+
+    def create(self):
+        """Create a new match and return (match_id, game)."""
+        match_id = secrets.token_urlsafe(9)
+        game = self.factory(match_id)
+        now = time.time()
+        with self.pool.transaction() as conn:
+            # Expire idle matches, then evict the least recently updated beyond the limit
+            conn.execute('DELETE FROM matches WHERE updated < ?', (now - self.ttl,))
+            conn.execute('DELETE FROM matches WHERE match_id IN (SELECT match_id FROM matches '
+                         'ORDER BY updated DESC LIMIT -1 OFFSET ?)', (self.max_sessions - 1,))
+            conn.execute('INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)', (match_id,) + self._row(game))
+        return match_id, game
+
+    def _load_models(self, game, models):
+        try:
+            models = json.loads(models)
+        except (TypeError, ValueError):
+            # Unreadable (e.g. written by an older version): the CPU starts over
+            return
+        rules = game.game_state.rules
+        for difficulty, state in models.items():
+            strategy = game.cpu_strategies[difficulty] = make_strategy(difficulty, rules)
+            strategy.load(state)
+
+    @contextmanager
+    def locked(self, match_id, write=True):
+        """
+        Yield the game for `match_id` (or None if unknown/expired). With
+        write=True it is loaded inside a write transaction and saved on exit
+        if its version moved; with write=False changes are not saved.
+        """
+        if not match_id:
+            yield None
+            return
+        with self.pool.transaction(write) as conn:
+            row = conn.execute('SELECT version, state, challenge_id, challenge_for_player, models FROM matches '
+                               'WHERE match_id = ? AND updated >= ?', (match_id, time.time() - self.ttl)).fetchone()
+            if row is None:
+                yield None
+                return
+            version, state, challenge_id, challenge_for_player, models = row
+            game = self.factory(match_id)
+            game.load_state(version, json.loads(state), challenge_id, challenge_for_player)
+            if models:
+                self._load_models(game, models)
+            yield game
+            if write and game.version != version:
+                conn.execute('UPDATE matches SET version = ?, state = ?, challenge_id = ?, challenge_for_player = ?, '
+                             'models = ?, updated = ? WHERE match_id = ?', self._row(game) + (match_id,))
+
+    def discard(self, match_id):
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM matches WHERE match_id = ?', (match_id,))
+
+    def version(self, match_id):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT version FROM matches WHERE match_id = ?', (match_id,)).fetchone()
+        return row[0] if row else None
+
+    def wait_for_change(self, match_id, since, timeout):
+        """Poll the match version until it passes `since`; None if the match is unknown."""
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self.version(match_id)
+            if version is None or version > since or time.monotonic() >= deadline:
+                return version
+            time.sleep(self.poll_interval)
+
+    async def wait_for_change_async(self, match_id, since, timeout):
+        """Like wait_for_change, but the polling is done by the watcher thread."""
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(None, self.version, match_id)
+        if version is None or version > since:
+            return version
+        waiter = (since, loop, loop.create_future())
+        with self.watch_lock:
+            self.watchers.setdefault(match_id, []).append(waiter)
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self._run_watcher, name='match-watcher', daemon=True)
+                self.watcher.start()
+        try:
+            return await asyncio.wait_for(waiter[2], timeout)
+        except asyncio.TimeoutError:
+            return version
+        finally:
+            with self.watch_lock:
+                waiters = self.watchers.get(match_id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self.watchers[match_id]
+
+    def _versions(self, match_ids):
+        versions = {}
+        with self.pool.connection() as conn:
+            # Stay well under SQLite's limit on bound parameters
+            for i in range(0, len(match_ids), 500):
+                chunk = match_ids[i:i + 500]
+                sql = 'SELECT match_id, version FROM matches WHERE match_id IN (%s)' % ', '.join('?' * len(chunk))
+                versions.update(conn.execute(sql, chunk).fetchall())
+        return versions
+
+    def _run_watcher(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self.watch_lock:
+                match_ids = list(self.watchers)
+            if not match_ids:
+                continue
+            try:
+                versions = self._versions(match_ids)
+            except sqlite3.Error:
+                log.exception("checking match versions failed; retrying")
+                continue
+            with self.watch_lock:
+                for match_id in match_ids:
+                    version = versions.get(match_id)
+                    waiters = self.watchers.get(match_id, [])
+                    # A deleted match (None) wakes its waiters too
+                    for since, loop, future in waiters:
+                        if version is None or version > since:
+                            try:
+                                loop.call_soon_threadsafe(_settle, future, version)
+                            except RuntimeError:
+                                # Its event loop has been closed
+                                pass
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM matches WHERE updated >= ?',
+                                (time.time() - self.ttl,)).fetchone()[0]
+
+
+def _rating_settings(conn):
+    saved = dict(conn.execute('SELECT name, value FROM rating_settings'))
+    return saved.get('k', K_FACTOR), saved.get('initial', INITIAL_RATING)
+
+
+def _rate(conn, matches):
+    """Apply (player1, player2, score1) matches in order inside `conn`'s write transaction."""
+    if not matches:
+        return
+    k, initial = _rating_settings(conn)
+    names = list({name for match in matches for name in match[:2]})
+    players = {}
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        players.update((player, [rating, count]) for player, rating, count in conn.execute(
+            'SELECT player, rating, matches FROM ratings WHERE player IN (%s)' % ','.join('?' * len(chunk)), chunk))
+    for player1, player2, score1 in matches:
+        a = players.setdefault(player1, [initial, 0])
+        b = players.setdefault(player2, [initial, 0])
+        delta = k * (score1 - expected_score(a[0], b[0]))
+        a[0] += delta
+        b[0] -= delta
+        a[1] += 1
+        b[1] += 1
+    conn.executemany('INSERT OR REPLACE INTO ratings VALUES (?, ?, ?)',
+                     [(player, rating, count) for player, (rating, count) in players.items()])
+
+
+class SQLiteRecordStore:
+    def __init__(self, pool, batch_size=64, flush_interval=0.2):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # One batch in flight at a time, so records are inserted in order
+        self.io_lock = threading.Lock()
+        self.pending = []  # (record_type, data) pairs
+        self.closed = False
+        self.writer = threading.Thread(target=self._run_writer, name='record-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def append(self, record_type, data):
+        with self.cond:
+            self.pending.append((record_type, data))
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    def extend(self, record_type, entries):
+        with self.cond:
+            self.pending.extend((record_type, data) for data in entries)
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    def _write_pending(self):
+        # Take the batch under the lock and run the transaction outside it, so
+        # appends (often from a request holding a match's write transaction)
+        # never wait for the database
+        with self.io_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return True
+            try:
+                self._insert(batch)
+            except sqlite3.Error:
+                log.exception("writing %d records failed; retrying", len(batch))
+                with self.lock:
+                    self.pending[:0] = batch
+                return False
+            return True
+
+    def _insert(self, batch):
+        rows = []
+        standings = []
+        matches = []  # (player1, player2, score1) for the ratings
+        for record_type, data in batch:
+            names = players_of(data)
+            date = data.get('date') if isinstance(data, dict) else None
+            rows.append((record_type, json.dumps(data, ensure_ascii=False), date,
+                         names[0] if names else None, names[1] if len(names) > 1 else None))
+            # Same rule as RecordIndex: decided PvP matches only
+            winner = data.get('winner') if isinstance(data, dict) else None
+            if winner and len(names) == 2 and record_type == 'player_vs_player':
+                standings.extend((name, int(name == winner), int(name != winner)) for name in names)
+            if record_type == 'player_vs_player':
+                match = match_score(data)
+                if match is not None and match[0] != match[1]:
+                    matches.append(match)
+        with self.pool.transaction() as conn:
+            conn.executemany('INSERT INTO records (type, data, date, player1, player2) VALUES (?, ?, ?, ?, ?)', rows)
+            conn.executemany('INSERT INTO standings VALUES (?, ?, ?) ON CONFLICT (player) DO UPDATE SET '
+                             'wins = wins + excluded.wins, losses = losses + excluded.losses', standings)
+            _rate(conn, matches)
+
+    def _run_writer(self):
+        while True:
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.flush_interval)
+            self._write_pending()
+
+    def flush(self):
+        self._write_pending()
+
+    def compact(self):
+        """Nothing to rewrite; kept for RecordStore compatibility."""
+        self.flush()
+
+    def _types(self, conn):
+        seen = [row[0] for row in conn.execute('SELECT DISTINCT type FROM records')]
+        return RECORD_TYPES + [record_type for record_type in seen if record_type not in RECORD_TYPES]
+
+    def snapshot(self):
+        self.flush()
+        with self.pool.connection() as conn:
+            result = {record_type: [] for record_type in self._types(conn)}
+            for record_type, data in conn.execute('SELECT type, data FROM records ORDER BY id'):
+                result[record_type].append(json.loads(data))
+        return result
+
+    def query(self, record_types=None, player=None, since=None, until=None, limit=50, cursor=None):
+        """Same pages as RecordStore.query; cursors are record row IDs."""
+        with self.pool.connection() as conn:
+            result = {'next_cursor': {}}
+            for record_type in record_types or self._types(conn):
+                sql = 'SELECT id, data FROM records WHERE type = ?'
+                params = [record_type]
+                if player:
+                    sql += ' AND (player1 = ? OR player2 = ?)'
+                    params += [player, player]
+                if since:
+                    sql += ' AND date >= ?'
+                    params.append(since)
+                if until:
+                    sql += ' AND date <= ?'
+                    params.append(until)
+                if cursor is not None:
+                    sql += ' AND id < ?'
+                    params.append(cursor)
+                rows = conn.execute(sql + ' ORDER BY id DESC LIMIT ?', params + [limit + 1]).fetchall()
+                page = rows[:limit]
+                result[record_type] = [json.loads(data) for _, data in page]
+                result['next_cursor'][record_type] = page[-1][0] if len(rows) > limit else None
+            return result
+
+    def leaderboard(self, limit=10):
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT player, wins, losses FROM standings ORDER BY wins DESC, losses LIMIT ?',
+                                (limit,)).fetchall()
+        return [{'player': player, 'wins': wins, 'losses': losses, 'matches': wins + losses}
+                for player, wins, losses in rows]
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        # A few attempts to write what is left; each one waits up to the busy timeout
+        for _ in range(3):
+            if self._write_pending():
+                return
+
+
+class SQLiteRatingEngine:
+    """
+    RatingEngine's interface over the ratings table. SQLiteRecordStore rates
+    each PvP record as it inserts it, so games must not call update; the K
+    factor and initial rating are the ones saved by the last rebuild.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def rating(self, player):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT rating FROM ratings WHERE player = ?', (player,)).fetchone()
+            return row[0] if row else _rating_settings(conn)[1]
+
+    def top(self, limit=10):
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT player, rating, matches FROM ratings ORDER BY rating DESC LIMIT ?',
+                                (limit,)).fetchall()
+        return [{'player': player, 'rating': round(rating, 1), 'matches': matches}
+                for player, rating, matches in rows]
+
+    def rebuild(self, k=K_FACTOR, initial=INITIAL_RATING):
+        """Rerate every saved PvP record with a new formula; returns the number of players."""
+        # Records inserted meanwhile wait for this transaction and are then rated with the new formula
+        with self.pool.transaction() as conn:
+            records = [json.loads(data) for (data,) in
+                       conn.execute("SELECT data FROM records WHERE type = 'player_vs_player' ORDER BY id")]
+            ratings = rerate(records, k, initial)
+            conn.execute('DELETE FROM ratings')
+            conn.executemany('INSERT INTO ratings VALUES (?, ?, ?)',
+                             [(player, rating, count) for player, (rating, count) in ratings.items()])
+            conn.executemany('INSERT OR REPLACE INTO rating_settings VALUES (?, ?)',
+                             [('k', k), ('initial', initial)])
+        return len(ratings)
+
+    def flush(self):
+        """Nothing buffered; kept for RatingEngine compatibility."""
+
+    def close(self):
+        pass
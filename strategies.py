@@ -0,0 +1,193 @@
+import random
+from collections import deque
+
+from rules import CLASSIC, FIRST, SECOND
+
+# FrequencyStrategy's default tuning ('hard'), shared with simulator.py
+FREQUENCY_WINDOW = 5
+FREQUENCY_MIN_HISTORY = 3
+FREQUENCY_COUNTER_PROB = 0.7
+
+class Strategy:
+    """
+    A CPU player for a rule set. `choose` picks the next move and `observe`
+    is told the opponent's move once the round is played. Both run in
+    constant time and every model keeps a bounded amount of memory.
+    `dump` returns the learned state as plain JSON data and `load` restores
+    it into a model built with the same settings.
+    """
+
+    def __init__(self, rules=CLASSIC):
+        self.rules = rules
+        self.moves = rules.moves
+
+    def counter(self, move):
+        """A move that beats `move`."""
+        return self.moves[self.rules.counter[self.rules.codes[move]]]
+
+    def choose(self):
+        raise NotImplementedError
+
+    def observe(self, opponent_move):
+        pass
+
+    def dump(self):
+        return {}
+
+    def load(self, state):
+        pass
+
+
+class RandomStrategy(Strategy):
+    def choose(self):
+        return random.choice(self.moves)
+
+
+class FrequencyStrategy(Strategy):
+    """Counter the opponent's most common move over the last `window` moves."""
+
+    def __init__(self, rules=CLASSIC, window=FREQUENCY_WINDOW, min_history=FREQUENCY_MIN_HISTORY,
+                 counter_prob=FREQUENCY_COUNTER_PROB):
+        super().__init__(rules)
+        self.recent = deque(maxlen=window)
+        self.counts = dict.fromkeys(self.moves, 0)
+        self.min_history = min_history
+        self.counter_prob = counter_prob
+
+    def predict(self):
+        if len(self.recent) < self.min_history:
+            return None
+        return max(self.counts, key=self.counts.get)
+
+    def choose(self):
+        predicted = self.predict()
+        if predicted and random.random() < self.counter_prob:
+            return self.counter(predicted)
+        return random.choice(self.moves)
+
+    def observe(self, opponent_move):
+        if opponent_move not in self.counts:
+            return
+        if len(self.recent) == self.recent.maxlen:
+            self.counts[self.recent[0]] -= 1
+        self.recent.append(opponent_move)
+        self.counts[opponent_move] += 1
+
+    def dump(self):
+        return {'recent': list(self.recent)}
+
+    def load(self, state):
+        for move in state.get('recent', []):
+            self.observe(move)
+
+
+class MarkovStrategy(Strategy):
+    """
+    Order-k Markov model: counts which move followed each sequence of the
+    opponent's last k moves. The table has at most N**k entries.
+    """
+
+    def __init__(self, rules=CLASSIC, order=1):
+        super().__init__(rules)
+        self.order = order
+        self.context = deque(maxlen=order)
+        self.transitions = {}
+
+    def predict(self):
+        if len(self.context) < self.order:
+            return None
+        counts = self.transitions.get(tuple(self.context))
+        if not counts:
+            return None
+        return max(counts, key=counts.get)
+
+    def choose(self):
+        predicted = self.predict()
+        return self.counter(predicted) if predicted else random.choice(self.moves)
+
+    def observe(self, opponent_move):
+        if opponent_move not in self.rules.codes:
+            return
+        if len(self.context) == self.order:
+            counts = self.transitions.setdefault(tuple(self.context), dict.fromkeys(self.moves, 0))
+            counts[opponent_move] += 1
+        self.context.append(opponent_move)
+
+    def dump(self):
+        return {'context': list(self.context),
+                'transitions': [[list(context), counts] for context, counts in self.transitions.items()]}
+
+    def load(self, state):
+        self.context.extend(move for move in state.get('context', []) if move in self.rules.codes)
+        for context, counts in state.get('transitions', []):
+            if len(context) == self.order and all(move in self.rules.codes for move in context):
+                self.transitions[tuple(context)] = {move: int(counts.get(move, 0)) for move in self.moves}
+
+
+class BanditStrategy(Strategy):
+    """
+    Meta-strategy: each round every sub-strategy proposes a move and is
+    scored on how that move would have done (+1 win, -1 loss, with decay).
+    Plays the best-scoring proposal, exploring at random with `epsilon`.
+    """
+
+    def __init__(self, strategies, rules=CLASSIC, epsilon=0.1, decay=0.9):
+        super().__init__(rules)
+        self.strategies = strategies
+        self.scores = [0.0] * len(strategies)
+        self.proposals = None
+        self.epsilon = epsilon
+        self.decay = decay
+
+    def choose(self):
+        self.proposals = [strategy.choose() for strategy in self.strategies]
+        if random.random() < self.epsilon:
+            return random.choice(self.proposals)
+        best = max(range(len(self.scores)), key=self.scores.__getitem__)
+        return self.proposals[best]
+
+    def observe(self, opponent_move):
+        codes = self.rules.codes
+        if opponent_move not in codes:
+            return
+        if self.proposals:
+            for i, move in enumerate(self.proposals):
+                outcome, _ = self.rules.resolve(codes[move], codes[opponent_move])
+                reward = 1 if outcome == FIRST else -1 if outcome == SECOND else 0
+                self.scores[i] = self.scores[i] * self.decay + reward
+            self.proposals = None
+        for strategy in self.strategies:
+            strategy.observe(opponent_move)
+
+    def dump(self):
+        return {'scores': self.scores, 'proposals': self.proposals,
+                'strategies': [strategy.dump() for strategy in self.strategies]}
+
+    def load(self, state):
+        scores = state.get('scores', [])
+        if len(scores) == len(self.scores):
+            self.scores = [float(score) for score in scores]
+        proposals = state.get('proposals')
+        if proposals and len(proposals) == len(self.strategies) and all(move in self.rules.codes for move in proposals):
+            self.proposals = list(proposals)
+        for strategy, sub_state in zip(self.strategies, state.get('strategies', [])):
+            strategy.load(sub_state)
+
+
+# CPU levels a game mode may name; make_strategy plays anything else at random
+DIFFICULTIES = ('easy', 'hard', 'markov', 'expert')
+
+
+def make_strategy(difficulty, rules=CLASSIC):
+    if difficulty == 'hard':
+        return FrequencyStrategy(rules)
+    if difficulty == 'markov':
+        return MarkovStrategy(rules, order=2)
+    if difficulty == 'expert':
+        return BanditStrategy([
+            FrequencyStrategy(rules, counter_prob=1.0),
+            MarkovStrategy(rules, order=1),
+            MarkovStrategy(rules, order=2),
+            RandomStrategy(rules),
+        ], rules)
+    return RandomStrategy(rules)
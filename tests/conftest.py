@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported in a scratch directory, since it opens its data files at import."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    os.environ.setdefault('RPS_METRICS', '0')
+    import app
+    yield app
+    os.chdir(cwd)
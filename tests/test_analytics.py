@@ -0,0 +1,35 @@
+import pytest
+
+from match_history import ROUND, MatchHistory
+
+pytest.importorskip('numpy')
+from analytics import Analytics  # noqa: E402
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = MatchHistory(str(tmp_path / 'rounds.bin'), str(tmp_path / 'matches.jsonl'),
+                           str(tmp_path / 'challenges.jsonl'))
+    yield history
+    history.close()
+
+
+def play(history, match_id, mode, rounds=1):
+    history.begin(match_id, mode, 'Ann', 'CPU', 'classic')
+    for number in range(1, rounds + 1):
+        history.add(match_id, number, ROUND, 0, 1, 2, 0, 0, number, 0)
+
+
+def test_unknown_modes_match_no_rows(history):
+    play(history, 'hard', 'player_vs_cpu_hard', rounds=3)
+    # Enough distinct modes to use up every code
+    for i in range(300):
+        play(history, f'm{i}', f'mode{i}')
+    analytics = Analytics(history)
+    assert len(analytics.rows(ROUND, 'classic', 'player_vs_cpu_hard')) == 3
+    assert len(analytics.modes) == 255
+    # Past the last code a mode is neither tracked nor lumped in with the others
+    assert len(analytics.rows(ROUND, 'classic', 'mode299')) == 0
+    assert len(analytics.rows(ROUND, 'classic', 'never_played')) == 0
+    assert len(analytics.rows(ROUND, 'no_such_variant')) == 0
+    assert len(analytics.rows(ROUND)) == 303
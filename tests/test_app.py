@@ -0,0 +1,57 @@
+import pytest
+
+from rate_limit import TokenBucketLimiter
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'play_limiter', TokenBucketLimiter(1, 3))
+    return app_module.app.test_client()
+
+
+def matchmade(client):
+    first = client.post('/api/matchmaking/join', json={'player_name': 'Ann', 'rating': 1500}).get_json()
+    second = client.post('/api/matchmaking/join', json={'player_name': 'Bob', 'rating': 1500}).get_json()
+    first = client.get('/api/matchmaking/status', query_string={'ticket': first['ticket']}).get_json()
+    return first['match_id'], {first['player_number']: first['player_token'],
+                               second['player_number']: second['player_token']}
+
+
+def play(client, match_id, number, token=None, choice='rock'):
+    return client.post('/api/play_round', json={'match_id': match_id, 'player_choice': choice,
+                                                'player_number': number, 'player_token': token})
+
+
+def test_invalid_player_numbers_are_refused(client):
+    match_id = client.post('/api/start_game', json={'game_mode': 'player_vs_player'}).get_json()['match_id']
+    assert [play(client, match_id, number).status_code for number in (3, 4, 0, '1')] == [400] * 4
+    # The refused plays spent nothing: the address still has its whole burst
+    assert [play(client, match_id, 1).status_code for _ in range(4)] == [200, 200, 200, 429]
+
+
+def test_others_cannot_drain_a_players_limit(client):
+    match_id, tokens = matchmade(client)
+    for _ in range(10):
+        assert play(client, match_id, 2).status_code == 403
+        assert play(client, match_id, 2, tokens[1]).status_code == 403
+    assert play(client, match_id, 2, tokens[2]).status_code == 200
+    statuses = [play(client, match_id, 1, tokens[1]).status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+
+def test_only_its_players_can_discard_a_matchmade_match(client):
+    match_id, tokens = matchmade(client)
+    assert client.post('/api/reset_game', json={'match_id': match_id}).status_code == 403
+    assert client.post('/api/reset_game', json={'match_id': match_id, 'player_token': 'guess'}).status_code == 403
+    # Starting a new game from a stolen match ID leaves that match alone
+    client.post('/api/start_game', json={'game_mode': 'player_vs_cpu', 'match_id': match_id})
+    assert client.get('/api/get_game_state', query_string={'match_id': match_id}).status_code == 200
+
+    assert client.post('/api/reset_game', json={'match_id': match_id, 'player_token': tokens[2]}).status_code == 200
+    assert client.get('/api/get_game_state', query_string={'match_id': match_id}).status_code == 404
+
+
+def test_unknown_game_modes_are_refused(client):
+    response = client.post('/api/start_game', json={'game_mode': 'player_vs_cpu_nightmare'})
+    assert (response.status_code, response.get_json()) == (400, {'error': 'Invalid game mode'})
+    assert client.post('/api/start_game', json={'game_mode': 'player_vs_cpu_expert'}).status_code == 200
@@ -0,0 +1,27 @@
+from challenge_scheduler import ChallengeScheduler
+
+
+class Bank:
+    def __init__(self, size):
+        self.all = [f'c{i}' for i in range(size)]
+
+    def load(self):
+        pass
+
+
+def test_deck_has_no_repeats_until_it_runs_out():
+    scheduler = ChallengeScheduler(Bank(20))
+    cycle = [scheduler.draw('ann') for _ in range(20)]
+    assert sorted(cycle) == sorted(Bank(20).all)
+    assert scheduler.draw('ann') in cycle
+
+
+def test_failures_come_back_after_the_gap():
+    scheduler = ChallengeScheduler(Bank(100), review_gap=3)
+    failed = scheduler.draw('ann')
+    scheduler.record('ann', failed, False)
+    assert failed not in [scheduler.draw('ann') for _ in range(2)]
+    assert scheduler.draw('ann') == failed
+    # A caller's shorter gap wins
+    scheduler.record('ann', failed, False, gap=1)
+    assert scheduler.draw('ann') == failed
@@ -0,0 +1,65 @@
+import pytest
+
+from game_logic import RockPaperScissors
+from record_store import RecordStore
+
+
+@pytest.fixture
+def game(tmp_path):
+    store = RecordStore(str(tmp_path / 'records.jsonl'), str(tmp_path / 'records.json'))
+    game = RockPaperScissors(store=store, match_id='m1')
+    game.start_game('player_vs_player', 'Ann', 'Bob', 3)
+    yield game
+    store.close()
+
+
+def test_retry_of_a_waiting_move_is_not_applied_twice(game):
+    first = game.play_round('rock', 1, 1)
+    assert first['status'] == 'waiting'
+    version = game.version
+    assert game.play_round('paper', 1, 1) is first
+    assert game.version == version
+    assert game.game_state.player_history.names(game.game_state.rules) == ['rock']
+
+
+def test_retry_after_the_round_resolved_gets_its_result(game):
+    game.play_round('rock', 1, 1)
+    result = game.play_round('scissors', 2, 1)
+    assert result['result'] == 'player1'
+    # Either player retrying round 1 gets the same result
+    assert game.play_round('scissors', 2, 1) is result
+    assert game.play_round('rock', 1, 1) is result
+    assert game.game_state.player1.score == 1
+
+
+def test_stale_and_future_rounds(game):
+    game.play_round('rock', 1, 1)
+    game.play_round('rock', 2, 1)
+    game.submissions.clear()  # as after a reload
+    assert game.play_round('paper', 1, 1)['status'] == 'duplicate'
+    assert game.play_round('paper', 1, 5) == {'error': 'Round not started'}
+    assert game.game_state.current_round == 2
+
+
+def test_moves_without_a_round_are_applied(game):
+    game.play_round('rock', 1)
+    assert game.play_round('paper', 1)['status'] == 'waiting'
+    # A second move in the same round replaces the first
+    assert game.game_state.player_history.names(game.game_state.rules) == ['paper']
+
+
+def test_player_token(game):
+    game.start_game('player_vs_player', 'Ann', 'Bob', 3, tokens=('secret1', 'secret2'))
+    assert game.play_round('rock', 1, 1) == {'error': 'Invalid player token'}
+    assert game.play_round('rock', 1, 1, 'secret2') == {'error': 'Invalid player token'}
+    assert game.play_round('rock', 1, 1, 'secret1')['status'] == 'waiting'
+    assert 'secret1' not in str(game.get_game_state())
+
+
+def test_challenge_decks(game):
+    # A deck that only lasts a 3-round match brings failures back at the next draw
+    assert game.deck_of(2) == (('m1', 2), 1)
+    matchmade = RockPaperScissors(match_id='m2')
+    matchmade.start_game('player_vs_player', 'Ann', 'Bob', 5, tokens=('secret1', 'secret2'))
+    # Matchmade players keep their deck from one match to the next
+    assert matchmade.deck_of(1) == (('player', 'Ann'), None)
@@ -0,0 +1,55 @@
+import os
+
+from match_history import CHALLENGE, ROUND, ROW, MatchHistory, read_lines
+
+
+def test_readers_leave_a_torn_line_alone(tmp_path):
+    path = tmp_path / 'index.jsonl'
+    path.write_bytes(b'{"match_id": "a"}\n{"match_id": "b"}\n{"match_')
+    size = os.path.getsize(path)
+    assert read_lines(str(path)) == [{'match_id': 'a'}, {'match_id': 'b'}]
+    # A line the writer hasn't finished may still be completed
+    assert os.path.getsize(path) == size
+
+
+def open_history(tmp_path):
+    return MatchHistory(str(tmp_path / 'rounds.bin'), str(tmp_path / 'matches.jsonl'),
+                        str(tmp_path / 'challenges.jsonl'))
+
+
+def play(history, match_id, rounds, challenge=None):
+    history.begin(match_id, 'player_vs_cpu_hard', 'Ann', 'CPU', 'classic')
+    for number in range(1, rounds + 1):
+        history.add(match_id, number, ROUND, 0, 1, 2, 0, 0, number, 0)
+    if challenge:
+        history.add(match_id, rounds, CHALLENGE, -1, -1, 1, 1, 0, rounds, 0, challenge)
+
+
+def test_history_recovers_from_a_crash_mid_write(tmp_path):
+    history = open_history(tmp_path)
+    play(history, 'm1', 2, 'c1')
+    play(history, 'm2', 1)
+    history.close()
+    sizes = {name: os.path.getsize(tmp_path / name) for name in ('rounds.bin', 'matches.jsonl', 'challenges.jsonl')}
+    # The process died mid-write: half a row and torn metadata and challenge lines
+    with open(tmp_path / 'rounds.bin', 'ab') as f:
+        f.write(b'\x01' * (ROW.size // 2))
+    with open(tmp_path / 'matches.jsonl', 'ab') as f:
+        f.write(b'{"match_id": "m3", "game_')
+    with open(tmp_path / 'challenges.jsonl', 'ab') as f:
+        f.write(b'"c2')
+
+    history = open_history(tmp_path)
+    history.load()
+    assert {name: os.path.getsize(tmp_path / name) for name in sizes} == sizes
+    assert history.row_count == 4
+    assert [meta['match_id'] for meta in history.metas()] == ['m1', 'm2']
+    # New matches, rounds and challenges land after the recovered ones
+    play(history, 'm3', 1, 'c2')
+    meta, events = history.replay('m1')
+    assert (meta['match_id'], len(list(events))) == ('m1', 3)
+    meta, events = history.replay('m3')
+    events = list(events)
+    assert (meta['match_id'], len(events), events[-1]['challenge_id']) == ('m3', 2, 'c2')
+    assert history.replay('m2') is not None
+    history.close()
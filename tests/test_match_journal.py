@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from game_logic import RockPaperScissors
+import match_journal
+from match_journal import MatchJournal
+
+
+@pytest.fixture
+def files(tmp_path):
+    return str(tmp_path / 'matches.wal'), str(tmp_path / 'matches.snapshot')
+
+
+def event(match_id, version, state=None):
+    return json.dumps([match_id, version, state or {'round': version}, None, None])
+
+
+def test_recovery_replays_the_log_over_the_snapshot(files):
+    log_file, snapshot_file = files
+    with open(snapshot_file, 'w') as f:
+        f.write('\n'.join([event('a', 1), event('b', 1), event('gone', 4)]) + '\n')
+    # The process died mid-write: the last line is torn
+    with open(log_file, 'w') as f:
+        f.write('\n'.join([event('a', 2), json.dumps(['gone', None]), event('c', 1), '', event('b', 2)[:20]]))
+
+    journal = MatchJournal(log_file, snapshot_file)
+    recovered = {entry[0]: entry[1] for entry in journal.matches()}
+    assert recovered == {'a': 2, 'b': 1, 'c': 1}
+    journal.close()
+
+    # Recovery starts from a fresh snapshot and an empty log
+    with open(log_file) as f:
+        assert f.read() == ''
+    with open(snapshot_file) as f:
+        assert sorted(json.loads(line)[:2] for line in f) == [['a', 2], ['b', 1], ['c', 1]]
+
+
+def test_logged_matches_survive_a_restart(files):
+    journal = MatchJournal(*files)
+    game = RockPaperScissors(match_id='m1')
+    game.start_game('player_vs_cpu_hard', 'Ann', 'CPU', 3)
+    journal.record('m1', game)
+    journal.snapshot()
+    game.play_round('rock', 1, 1)
+    journal.record('m1', game)
+    journal.record('m2', game)
+    journal.remove('m2')
+    journal.close()
+
+    journal = MatchJournal(*files)
+    (match_id, version, state, _, _), = journal.matches()
+    assert (match_id, version) == ('m1', game.version)
+    assert state == json.loads(json.dumps(game.game_state.dump()))
+    # One process at a time owns the log
+    if match_journal.fcntl is not None:
+        with pytest.raises(RuntimeError):
+            MatchJournal(*files)
+    journal.close()
@@ -0,0 +1,141 @@
+import pytest
+
+import matchmaking
+from matchmaking import Matchmaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(matchmaking.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def opened():
+    return []
+
+
+@pytest.fixture
+def matchmaker(opened):
+    def open_match(first, second):
+        opened.append((first.player, second.player, first.token, second.token))
+        return f'match{len(opened)}'
+
+    return Matchmaker(open_match, idle_timeout=30, matched_ttl=300)
+
+
+def test_pairs_close_ratings(clock, matchmaker, opened):
+    first = matchmaker.join('Ann', 1500)
+    assert first['status'] == 'waiting'
+    clock.now += 1
+    second = matchmaker.join('Bob', 1550)
+    assert second['status'] == 'matched'
+    assert second['player_number'] == 2
+    status = matchmaker.poll(first['ticket'])
+    # The longer-waiting player is player 1
+    assert (status['match_id'], status['player_number']) == ('match1', 1)
+    assert opened == [('Ann', 'Bob', status['player_token'], second['player_token'])]
+    assert status['player_token'] != second['player_token']
+
+
+def test_window_grows_while_waiting(clock, matchmaker):
+    first = matchmaker.join('Ann', 1500)
+    second = matchmaker.join('Bob', 1700)
+    assert second['status'] == 'waiting'
+    clock.now += 5
+    assert matchmaker.poll(first['ticket'])['status'] == 'waiting'
+    clock.now += 6
+    # 100 + 10/s * 11s covers the 200 point gap
+    assert matchmaker.poll(first['ticket'])['status'] == 'matched'
+
+
+def test_idle_tickets_time_out(clock, matchmaker):
+    idle = matchmaker.join('Ann', 1500)
+    clock.now += 31
+    assert matchmaker.join('Bob', 1500)['status'] == 'waiting'
+    assert matchmaker.poll(idle['ticket']) is None
+    assert matchmaker.stats()['timed_out'] == 1
+
+
+def test_idle_tickets_are_swept(clock, matchmaker):
+    # Far apart, so no pairing attempt ever reaches Ann's bucket
+    idle = matchmaker.join('Ann', 1000)
+    clock.now += 20
+    polled = matchmaker.join('Bob', 2000)
+    clock.now += 20
+    matchmaker.poll(polled['ticket'])
+    stats = matchmaker.stats()
+    assert (stats['waiting'], stats['depth_by_rating'], stats['timed_out']) == (1, {'2000-2049': 1}, 1)
+    assert stats['oldest_wait'] == 20
+    assert idle['ticket'] not in matchmaker.tickets
+    clock.now += 31
+    assert matchmaker.stats()['waiting'] == 0
+
+
+def test_each_player_is_paired_once(clock, matchmaker, opened):
+    tickets = []
+    for name in ('Ann', 'Bob', 'Carl', 'Dave'):
+        tickets.append(matchmaker.join(name, 1500)['ticket'])
+        clock.now += 1
+    statuses = [matchmaker.poll(ticket) for ticket in tickets]
+    assert [(status['match_id'], status['player_number']) for status in statuses] == [
+        ('match1', 1), ('match1', 2), ('match2', 1), ('match2', 2)]
+    assert [match[:2] for match in opened] == [('Ann', 'Bob'), ('Carl', 'Dave')]
+
+
+def test_caller_at_top_skips_idle_entries(clock, opened):
+    matchmaker = Matchmaker(lambda first, second: opened.append((first.player, second.player)) or 'm',
+                            base_gap=0, gap_per_second=1, idle_timeout=5)
+    ann = matchmaker.join('Ann', 1500)
+    matchmaker.join('Bob', 1520)  # same bucket, below Ann in the heap, and never polls again
+    for _ in range(6):
+        clock.now += 4
+        # Ann's window reaches Bob's rating after 20s, long after Bob went idle
+        assert matchmaker.poll(ann['ticket'])['status'] == 'waiting'
+    assert opened == []
+    assert matchmaker.stats()['timed_out'] == 1
+
+
+def test_leave_and_matched_expiry(clock, matchmaker):
+    ticket = matchmaker.join('Ann', 1500)['ticket']
+    assert matchmaker.leave(ticket)
+    assert matchmaker.poll(ticket) is None
+    first = matchmaker.join('Bob', 1500)['ticket']
+    matchmaker.join('Carl', 1500)
+    assert not matchmaker.leave(first)
+    clock.now += 301
+    matchmaker.join('Dave', 2500)
+    assert matchmaker.poll(first) is None
+
+
+def test_match_is_opened_outside_the_lock(clock):
+    def open_match(first, second):
+        if opened:
+            return 'match1'
+        opened.append(first.player)
+        # Other players can use the queue meanwhile
+        assert matchmaker.lock.acquire(blocking=False)
+        matchmaker.lock.release()
+        assert matchmaker.poll(first.id)['status'] == 'waiting'
+        assert not matchmaker.leave(second.id)
+        assert matchmaker.join('Cy', 3000)['status'] == 'waiting'
+        raise RuntimeError('database is locked')
+
+    opened = []
+    matchmaker = Matchmaker(open_match)
+    first = matchmaker.join('Ann', 1500)
+    with pytest.raises(RuntimeError):
+        matchmaker.join('Bob', 1500)
+    # Both players are back in the queue, once each
+    assert matchmaker.stats()['waiting'] == 3
+    status = matchmaker.poll(first['ticket'])
+    assert (status['status'], status['match_id'], status['player_number']) == ('matched', 'match1', 1)
@@ -0,0 +1,29 @@
+from record_index import RecordIndex
+
+
+def build(entries, record_type='player_vs_cpu'):
+    index = RecordIndex()
+    for position, data in enumerate(entries):
+        index.add(record_type, data, position)
+    return index
+
+
+def test_date_filters_skip_records_without_a_string_date():
+    entries = [{'match': 'Ann vs CPU', 'date': 5}, {'match': 'Bob vs CPU', 'date': '2025-01-02T00:00:00'},
+               {'match': 'Ann vs CPU'}, {'match': 'Ann vs CPU', 'date': '2025-01-01T00:00:00'}]
+    index = build(entries)
+    # Out of order, so every record is checked against the filter
+    assert 'player_vs_cpu' in index.unordered
+    page, cursor = index.query(entries, 'player_vs_cpu', since='2025-01-01')
+    assert (page, cursor) == ([entries[3], entries[1]], None)
+    page, _ = index.query(entries, 'player_vs_cpu', player='Ann', until='2025-01-01T12:00:00')
+    assert page == [entries[3], entries[2], entries[0]]
+
+
+def test_ordered_dates_are_bisected():
+    entries = [{'match': f'P{day} vs CPU', 'date': f'2025-01-{day:02d}'} for day in range(1, 11)]
+    index = build(entries)
+    page, cursor = index.query(entries, 'player_vs_cpu', since='2025-01-03', until='2025-01-07', limit=3)
+    assert [data['date'] for data in page] == ['2025-01-07', '2025-01-06', '2025-01-05']
+    page, cursor = index.query(entries, 'player_vs_cpu', since='2025-01-03', until='2025-01-07', cursor=cursor)
+    assert ([data['date'] for data in page], cursor) == (['2025-01-04', '2025-01-03'], None)
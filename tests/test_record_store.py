@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from record_store import RecordStore
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'records.jsonl'), str(tmp_path / 'records.json')
+
+
+def line(record_type, data):
+    return json.dumps({'type': record_type, 'data': data})
+
+
+def test_torn_last_line_is_dropped_and_the_log_stays_appendable(paths):
+    log_file, legacy_file = paths
+    # The process died mid-write: the last line has no end
+    with open(log_file, 'w') as f:
+        f.write(line('player_vs_player', {'match': 'Ann vs Bob', 'winner': 'Ann'}) + '\n')
+        f.write(line('player_vs_cpu', {'match': 'Ann vs CPU', 'winner': 'CPU'})[:25])
+
+    store = RecordStore(log_file, legacy_file)
+    # The torn line was ended at startup, so this append is a line of its own
+    store.append('player_vs_cpu', {'match': 'Cy vs CPU', 'winner': 'Cy'})
+    store.close()
+
+    store = RecordStore(log_file, legacy_file)
+    snapshot = store.snapshot()
+    assert snapshot['player_vs_player'] == [{'match': 'Ann vs Bob', 'winner': 'Ann'}]
+    assert snapshot['player_vs_cpu'] == [{'match': 'Cy vs CPU', 'winner': 'Cy'}]
+    store.close()
+    # Loading compacted the bad line away
+    with open(log_file) as f:
+        assert [json.loads(text)['data']['match'] for text in f] == ['Ann vs Bob', 'Cy vs CPU']
+
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from game_logic import RockPaperScissors
+from ratings import RatingEngine
+from state_backend import SQLiteRatingEngine, SQLiteRecordStore, SQLiteSessionStore, open_pool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return open_pool(f'sqlite:///{tmp_path / "state.db"}')
+
+
+@pytest.fixture
+def records(pool):
+    store = SQLiteRecordStore(pool, flush_interval=0.01)
+    yield store
+    store.close()
+
+
+def make_sessions(pool, records):
+    return SQLiteSessionStore(pool, lambda match_id: RockPaperScissors(store=records, match_id=match_id))
+
+
+def test_match_round_trip(pool, records):
+    sessions = make_sessions(pool, records)
+    match_id, _ = sessions.create()
+    with sessions.locked(match_id) as game:
+        game.start_game('player_vs_cpu_hard', 'Ann', 'CPU', 3, 'rpsls')
+        game.play_round('spock', 1, 1)
+        version = game.version
+
+    # A second store on the same database stands in for another worker
+    with make_sessions(pool, records).locked(match_id, write=False) as game:
+        assert game.version == version
+        assert game.game_state.rules.name == 'rpsls'
+        assert game.game_state.player1.name == 'Ann'
+        assert game.game_state.player_history.names(game.game_state.rules) == ['spock']
+        assert game.game_state.current_round == 2
+        assert type(game.cpu_strategies['hard']).__name__ == 'FrequencyStrategy'
+        # Changes made in a read transaction are not saved
+        game.start_game('player_vs_player', 'X', 'Y', 5)
+
+    with sessions.locked(match_id, write=False) as game:
+        assert game.version == version
+        assert game.game_state.player1.name == 'Ann'
+
+
+def test_unknown_or_discarded_match(pool, records):
+    sessions = make_sessions(pool, records)
+    with sessions.locked('missing') as game:
+        assert game is None
+    match_id, _ = sessions.create()
+    sessions.discard(match_id)
+    with sessions.locked(match_id) as game:
+        assert game is None
+
+
+def test_records_round_trip(records):
+    records.append('player_vs_player', {'match': 'Ann vs Bob', 'winner': 'Ann', 'date': '2025-01-02T00:00:00'})
+    records.extend('player_vs_cpu', [{'match': 'Ann vs CPU', 'winner': 'CPU', 'date': '2025-01-03T00:00:00'}])
+    records.flush()
+    assert records.snapshot()['player_vs_player'][0]['winner'] == 'Ann'
+    assert records.query(['player_vs_cpu'], player='Ann')['player_vs_cpu'][0]['winner'] == 'CPU'
+    assert records.query(['player_vs_player'], since='2025-01-03')['player_vs_player'] == []
+    assert records.leaderboard() == [{'player': 'Ann', 'wins': 1, 'losses': 0, 'matches': 1},
+                                     {'player': 'Bob', 'wins': 0, 'losses': 1, 'matches': 1}]
+
+
+def test_ratings_follow_the_records(tmp_path, pool, records):
+    matches = [{'match': 'Ann vs Bob', 'winner': 'Ann'}, {'match': 'Bob vs Cy', 'winner': None, 'draw': True},
+               {'match': 'Cy vs Ann', 'winner': 'Cy'}, {'match': 'Ann vs Ann', 'winner': 'Ann'}]
+    records.extend('player_vs_player', matches)
+    records.flush()
+    expected = RatingEngine(str(tmp_path / 'ratings.json'))
+    expected.update('Ann', 'Bob', 1.0)
+    expected.update('Bob', 'Cy', 0.5)
+    expected.update('Cy', 'Ann', 1.0)
+    # Every worker reads the ratings the record writer keeps in the database
+    shared = SQLiteRatingEngine(pool)
+    assert shared.top() == expected.top()
+    assert shared.rating('Dee') == 1500
+
+    assert shared.rebuild(k=16, initial=1000) == 3
+    assert shared.rating('Dee') == 1000
+    records.append('player_vs_player', {'match': 'Dee vs Ann', 'winner': 'Dee'})
+    records.flush()
+    assert shared.rating('Dee') > 1000
+    assert {entry['player']: entry['matches'] for entry in shared.top()} == {'Ann': 3, 'Bob': 2, 'Cy': 2, 'Dee': 1}
+    expected.close()
+
+
+def test_append_never_waits_for_a_write_transaction(pool, records):
+    # A request holding a match's write transaction saves the match record
+    pool.timeout = 0.05
+    with pool.transaction():
+        start = time.perf_counter()
+        for i in range(100):
+            records.append('player_vs_player', {'match': f'P{i} vs Q', 'winner': 'Q'})
+        assert time.perf_counter() - start < 0.5
+        # The writer can't get the lock meanwhile; it keeps the batch and retries
+        time.sleep(0.2)
+    deadline = time.monotonic() + 5
+    while len(records.snapshot()['player_vs_player']) < 100 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(records.snapshot()['player_vs_player']) == 100
+    assert records.writer.is_alive()
+
+
+def test_concurrent_writers(pool, records):
+    def worker(n):
+        for i in range(50):
+            records.append('player_vs_player', {'match': f'W{n} vs Q', 'winner': 'Q'})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    records.flush()
+    assert records.leaderboard(1) == [{'player': 'Q', 'wins': 400, 'losses': 0, 'matches': 400}]
+
+
+def test_async_wait_is_woken_by_the_watcher(pool, records):
+    sessions = make_sessions(pool, records)
+    match_id, _ = sessions.create()
+    with sessions.locked(match_id) as game:
+        game.start_game('player_vs_player', 'Ann', 'Bob', 3)
+        version = game.version
+
+    def move():
+        time.sleep(0.2)
+        with sessions.locked(match_id) as game:
+            game.play_round('rock', 1)
+
+    async def main():
+        assert await sessions.wait_for_change_async(match_id, version, 0.05) == version
+        threading.Thread(target=move).start()
+        assert await sessions.wait_for_change_async(match_id, version, 5) > version
+        sessions.discard(match_id)
+        assert await sessions.wait_for_change_async(match_id, 0, 5) is None
+
+    asyncio.run(main())
+    assert sessions.watchers == {}
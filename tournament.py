@@ -0,0 +1,197 @@
+"""
+Tournaments between CPU strategies.
+
+Round-robin and single-elimination brackets are played across a
+ProcessPoolExecutor; results are handed to `on_result` as matches finish
+and the champions are written to the `tournament_winners` records in one
+batched write.
+
+    python tournament.py --format round_robin --entrants hard easy markov expert
+"""
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from record_store import RecordStore
+from rules import FIRST, SECOND, VARIANTS, get_rules
+from strategies import make_strategy
+
+# Extra rounds allowed to break a tie in an elimination match
+MAX_TIEBREAK_ROUNDS = 50
+
+
+def play_match(entry1, entry2, rounds, seed, decisive=False, variant='classic'):
+    """
+    Play one match between two (name, difficulty) entrants.
+    Returns (name1, name2, score1, score2).
+    """
+    random.seed(seed)
+    rules = get_rules(variant)
+    codes = rules.codes
+    cpu1 = make_strategy(entry1[1], rules)
+    cpu2 = make_strategy(entry2[1], rules)
+    score1 = score2 = 0
+    played = 0
+    while played < rounds or (decisive and score1 == score2 and played < rounds + MAX_TIEBREAK_ROUNDS):
+        move1 = cpu1.choose()
+        move2 = cpu2.choose()
+        outcome, _ = rules.resolve(codes[move1], codes[move2])
+        if outcome == FIRST:
+            score1 += 1
+        elif outcome == SECOND:
+            score2 += 1
+        cpu1.observe(move2)
+        cpu2.observe(move1)
+        played += 1
+    if decisive and score1 == score2:
+        # Still level after the tiebreak: settle it with a coin flip
+        if random.random() < 0.5:
+            score1 += 1
+        else:
+            score2 += 1
+    return entry1[0], entry2[0], score1, score2
+
+
+def play_batch(matches, rounds, decisive, variant):
+    return [play_match(e1, e2, rounds, seed, decisive, variant) for e1, e2, seed in matches]
+
+
+def run_matches(executor, pairs, rounds, decisive=False, on_result=None, seed=None, batches=None,
+                variant='classic'):
+    """
+    Spread `pairs` over the executor in batches (a few per worker, to keep
+    scheduling overhead low); `on_result` sees results as they complete.
+    """
+    rng = random.Random(seed)
+    matches = [(e1, e2, rng.getrandbits(32)) for e1, e2 in pairs]
+    batches = batches or (os.cpu_count() or 1) * 4
+    size = max(1, -(-len(matches) // batches))
+    futures = {
+        executor.submit(play_batch, matches[i:i + size], rounds, decisive, variant): i
+        for i in range(0, len(matches), size)
+    }
+    # Results are returned in the order of `pairs`, so callers can match them up by position
+    results = [None] * len(matches)
+    for future in as_completed(futures):
+        start = futures[future]
+        for offset, result in enumerate(future.result()):
+            results[start + offset] = result
+            if on_result:
+                on_result(result)
+    return results
+
+
+def round_robin(entrants, executor, rounds=5, on_result=None, seed=None, variant='classic'):
+    """Every entrant plays every other once; 3 points per win, 1 per draw."""
+    # Rows are kept per entrant, so entrants sharing a name stay apart
+    indexes = [(i, j) for i in range(len(entrants)) for j in range(i + 1, len(entrants))]
+    pairs = [(entrants[i], entrants[j]) for i, j in indexes]
+    table = [{'points': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'diff': 0} for _ in entrants]
+    results = run_matches(executor, pairs, rounds, on_result=on_result, seed=seed, variant=variant)
+    for (i, j), (_, _, score1, score2) in zip(indexes, results):
+        row1, row2 = table[i], table[j]
+        row1['diff'] += score1 - score2
+        row2['diff'] += score2 - score1
+        if score1 > score2:
+            row1['points'] += 3
+            row1['wins'] += 1
+            row2['losses'] += 1
+        elif score2 > score1:
+            row2['points'] += 3
+            row2['wins'] += 1
+            row1['losses'] += 1
+        else:
+            row1['points'] += 1
+            row2['points'] += 1
+            row1['draws'] += 1
+            row2['draws'] += 1
+    standings = sorted(((entrants[i][0], row) for i, row in enumerate(table)),
+                       key=lambda item: (item[1]['points'], item[1]['diff']), reverse=True)
+    return standings[0][0], standings
+
+
+def single_elimination(entrants, executor, rounds=5, on_result=None, seed=None, variant='classic'):
+    """
+    Knockout bracket. When the field isn't a power of two, the first round
+    gives just enough byes that every later round is full.
+    """
+    rng = random.Random(seed)
+    # Entrants are tracked by index, so two entrants with one name both advance
+    alive = list(range(len(entrants)))
+    rng.shuffle(alive)
+    byes = (1 << (len(alive) - 1).bit_length()) - len(alive) if alive else 0
+    bracket = []
+    while len(alive) > 1:
+        advanced, playing = alive[:byes], alive[byes:]
+        byes = 0
+        indexes = [(playing[i], playing[i + 1]) for i in range(0, len(playing), 2)]
+        results = run_matches(executor, [(entrants[i], entrants[j]) for i, j in indexes], rounds,
+                              decisive=True, on_result=on_result, seed=rng.getrandbits(32), variant=variant)
+        bracket.append(results)
+        # Keep bracket order stable for the next round
+        alive = advanced + [i if score1 > score2 else j for (i, j), (_, _, score1, score2) in zip(indexes, results)]
+    return entrants[alive[0]][0], bracket
+
+
+FORMATS = {'round_robin': round_robin, 'single_elimination': single_elimination}
+
+
+def run_tournaments(specs, store=None, workers=None, rounds=5, on_result=None, seed=None, variant='classic'):
+    """
+    Run each (format, entrants) spec and save every champion with one
+    batched write to `tournament_winners`. Returns the champion records.
+    """
+    champions = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for format_name, entrants in specs:
+            champion, _ = FORMATS[format_name](entrants, executor, rounds, on_result, seed, variant)
+            champions.append({
+                'champion': champion,
+                'format': format_name,
+                'entrants': len(entrants),
+                'date': datetime.now().isoformat()
+            })
+    if store is None:
+        store = RecordStore()
+    store.extend('tournament_winners', champions)
+    store.flush()
+    return champions
+
+
+def parse_entrants(values):
+    # 'name=difficulty' or just a difficulty; repeated names get a suffix
+    entrants = []
+    for i, value in enumerate(values):
+        name, _, difficulty = value.partition('=')
+        if not difficulty:
+            name, difficulty = f"{value}-{i + 1}", value
+        entrants.append((name, difficulty))
+    return entrants
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a CPU strategy tournament")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='round_robin')
+    parser.add_argument('--entrants', nargs='+', default=['easy', 'hard', 'markov', 'expert'],
+                        help="difficulties or name=difficulty pairs")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='classic')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--quiet', action='store_true', help="don't print each match")
+    args = parser.parse_args()
+
+    def show(result):
+        print("{} {}-{} {}".format(result[0], result[2], result[3], result[1]))
+
+    entrants = parse_entrants(args.entrants)
+    champions = run_tournaments([(args.format, entrants)], workers=args.workers, rounds=args.rounds,
+                                on_result=None if args.quiet else show, seed=args.seed, variant=args.variant)
+    for record in champions:
+        print(f"Champion ({record['format']}, {record['entrants']} entrants): {record['champion']}")
+
+
+if __name__ == '__main__':
+    main()